@@ -1,9 +1,19 @@
-from django.contrib import admin
+import logging
+import uuid
+
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
 from django.contrib.auth.admin import UserAdmin
 from django.utils.html import format_html
-from .models import User, Wallet
-import cloudinary.uploader
-import os
+from .models import ImageAsset, User, Wallet, WalletTransaction
+from .images import replace_profile_image
+from .paginator import EstimatedCountPaginator
+from .search import search_users
+from .wallet import credit
+
+logger = logging.getLogger(__name__)
+
 
 class CustomUserAdmin(UserAdmin):
     model = User
@@ -17,6 +27,8 @@ class CustomUserAdmin(UserAdmin):
     list_filter = ('is_staff', 'is_active', 'date_joined', 'last_login')
     search_fields = ('email', 'username', 'name', 'phone')
     ordering = ('email',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     fieldsets = (
         (None, {'fields': ('email', 'password')}),
@@ -40,9 +52,15 @@ class CustomUserAdmin(UserAdmin):
 
     readonly_fields = ('last_login', 'date_joined', 'cloudinary_preview')
 
+    def get_search_results(self, request, queryset, search_term):
+        # Indexed token search instead of an ILIKE scan per search_fields entry.
+        if not search_term.strip():
+            return queryset, False
+        return search_users(search_term, queryset), False
+
     def view_profile_link(self, obj):
         if obj.cloudinary_url:
-            return format_html('<a href="{}" target="_blank">View Image</a>', obj.cloudinary_url)
+            return format_html('<a href="{}" target="_blank">View Image</a>', obj.profile_image_url(256))
         return "-"
     view_profile_link.short_description = "Profile Image"
 
@@ -58,32 +76,107 @@ class CustomUserAdmin(UserAdmin):
 
 
     def save_model(self, request, obj, form, change):
+        image = None
+        if 'profile_image' in form.changed_data and obj.profile_image:
+            image = form.cleaned_data['profile_image']
+            # Save the rest first; replace_profile_image stores the upload and
+            # releases the image it replaces.
+            obj.profile_image = form.initial.get('profile_image')
         super().save_model(request, obj, form, change)
         if not change:
             Wallet.objects.get_or_create(user=obj, defaults={'balance': 0, 'currency': 'Gems'})
-        if 'profile_image' in form.changed_data and obj.profile_image:
+        if image:
             try:
-                local_path = obj.profile_image.path
-                if os.path.exists(local_path):
-                    upload_response = cloudinary.uploader.upload(
-                    local_path,
-                    folder="user_profiles"
-                )
-                obj.cloudinary_url = upload_response.get('secure_url')
-                obj.cloudinary_public_id = upload_response.get('public_id')
-                obj.save(update_fields=['cloudinary_url', 'cloudinary_public_id'])
-            except Exception as e:
-                print(f"Error uploading to Cloudinary: {e}")
+                replace_profile_image(obj, image)
+            except Exception:
+                logger.exception("Profile image upload failed for user %s", obj.pk)
+
+
+class WalletAdjustmentForm(ActionForm):
+    amount = forms.IntegerField(required=False, help_text="Gems to add; negative to deduct.")
+    # Generated when the changelist is rendered, so submitting the same page
+    # twice applies the adjustment once.
+    adjustment_id = forms.CharField(widget=forms.HiddenInput, initial=lambda: uuid.uuid4().hex)
 
 
 class WalletAdmin(admin.ModelAdmin):
-    fields = ('user_id_display', 'user', 'balance', 'currency', 'created_at', 'updated_at')
-    readonly_fields = ('user_id_display', 'created_at', 'updated_at')
+    fields = (
+        'user_id_display', 'user', 'balance', 'currency',
+        'snapshot_balance', 'snapshot_transaction_id', 'snapshot_at', 'created_at', 'updated_at',
+    )
+    # Balances only move through accounts.wallet.credit, which writes the
+    # ledger entry; use the "Adjust balance" action for manual changes.
+    readonly_fields = (
+        'user_id_display', 'balance', 'snapshot_balance', 'snapshot_transaction_id', 'snapshot_at',
+        'created_at', 'updated_at',
+    )
     list_display = ('user_id_display', 'user', 'balance', 'currency', 'created_at', 'updated_at')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    action_form = WalletAdjustmentForm
+    actions = ['adjust_balance']
+
     def user_id_display(self, obj):
-        return obj.user.id
+        return obj.user_id
     user_id_display.short_description = 'User ID'
 
+    @admin.action(description="Adjust balance of selected wallets by the amount")
+    def adjust_balance(self, request, queryset):
+        form = self.action_form(request.POST)
+        form.fields['action'].choices = self.get_action_choices(request)
+        if not form.is_valid() or not form.cleaned_data['amount']:
+            self.message_user(request, "Enter a non-zero amount to adjust by.", messages.ERROR)
+            return
+        amount = form.cleaned_data['amount']
+        adjustment_id = form.cleaned_data['adjustment_id']
+        applied = 0
+        for wallet in queryset.select_related('user'):
+            entry = credit(
+                wallet.user, amount,
+                reason='admin_adjustment',
+                idempotency_key=f'admin-adjustment:{adjustment_id}:{wallet.pk}',
+            )
+            applied += entry is not None
+        self.message_user(request, f"Adjusted {applied} wallet(s) by {amount:+d}.")
+
+
+class WalletTransactionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'wallet', 'amount', 'reason', 'idempotency_key', 'created_at')
+    list_filter = ('reason',)
+    list_select_related = ('wallet__user',)
+    search_fields = ('idempotency_key',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    # The ledger is append-only; entries are only written through accounts.wallet.
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class ImageAssetAdmin(admin.ModelAdmin):
+    list_display = ('id', 'public_id', 'ref_count', 'reuse_count', 'size', 'created_at')
+    readonly_fields = ('content_hash', 'public_id', 'url', 'variants', 'size', 'ref_count', 'reuse_count', 'created_at')
+    search_fields = ('=content_hash', '=public_id')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    # Reference counts are only moved by accounts.image_dedupe.
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 
 admin.site.register(User, CustomUserAdmin)
 admin.site.register(Wallet, WalletAdmin)
+admin.site.register(WalletTransaction, WalletTransactionAdmin)
+admin.site.register(ImageAsset, ImageAssetAdmin)
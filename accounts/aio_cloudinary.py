@@ -0,0 +1,198 @@
+"""
+Minimal non-blocking client for the Cloudinary upload API.
+
+``cloudinary.uploader`` is built on blocking urllib3 calls, which would pin a
+thread for the whole round-trip under ASGI. This module signs requests with
+the SDK's own helpers and sends them over ``asyncio`` streams instead.
+
+Errors are raised as the SDK's exception classes for their HTTP status, so
+``image_client`` retries and trips its breaker exactly as for sync calls.
+Connections are kept alive and reused, up to ``IMAGE_HOST_POOL_SIZE`` idle
+ones per host and event loop. An idle connection the host has closed is
+replaced and the request sent again; uploads carry a fixed ``public_id``
+(see ``image_client.upload_options``), so a resend can't duplicate an asset.
+"""
+import asyncio
+import contextlib
+import json
+import ssl
+import uuid
+import weakref
+from urllib.parse import urlsplit
+
+import cloudinary
+from cloudinary import utils
+from cloudinary.api_client.execute_request import EXCEPTION_CODES
+from cloudinary.exceptions import Error
+from django.conf import settings
+
+TIMEOUT = 60
+CHUNK_SIZE = 64 * 1024
+
+_ssl_context = None
+_pools = weakref.WeakKeyDictionary()  # event loop -> {(scheme, host, port): [(reader, writer), ...]}
+
+
+def _get_ssl_context():
+    global _ssl_context
+    if _ssl_context is None:
+        _ssl_context = ssl.create_default_context()
+    return _ssl_context
+
+
+async def upload(data, filename='file', **options):
+    """``data`` is bytes or an open file, which is streamed to the host in chunks."""
+    params = utils.build_upload_params(**options)
+    return await call_api('upload', params, file=(filename, data))
+
+
+async def call_api(action, params, file=None):
+    params = utils.sign_request(params, {})
+    fields = [(k, v) for k, v in params.items() if v]
+    body, content_type = _encode_multipart(fields, file)
+    status, payload = await asyncio.wait_for(
+        _post(utils.cloudinary_api_url(action), body, content_type), TIMEOUT
+    )
+    exception_class = EXCEPTION_CODES.get(status, Error)
+    try:
+        result = json.loads(payload.decode('utf-8'))
+    except ValueError as e:
+        raise exception_class(f"Error parsing server response ({status}) - {payload!r}. Got - {e}")
+    if 'error' in result:
+        raise exception_class(result['error']['message'])
+    return result
+
+
+def _encode_multipart(fields, file):
+    """The request body as a list of bytes and, for the upload itself, the file object."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields:
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        )
+    if file is not None:
+        filename, data = file
+        filename = ''.join(c for c in filename if c not in '"\r\n') or 'file'
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'.encode()
+        )
+        parts.append(data)
+        parts.append(b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return parts, f'multipart/form-data; boundary={boundary}'
+
+
+def _part_length(part):
+    if isinstance(part, bytes):
+        return len(part)
+    size = getattr(part, 'size', None)
+    if size is None:
+        size = part.seek(0, 2)
+    return size
+
+
+async def _post(url, body, content_type):
+    parts = urlsplit(url)
+    key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80))
+    connection = _checkout(key)
+    if connection is not None:
+        try:
+            return await _exchange(key, connection, parts, body, content_type)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            # The host closed the idle connection; send again on a fresh one.
+            pass
+    reader, writer = await asyncio.open_connection(
+        key[1], key[2], ssl=_get_ssl_context() if key[0] == 'https' else None,
+    )
+    return await _exchange(key, (reader, writer), parts, body, content_type)
+
+
+async def _exchange(key, connection, parts, body, content_type):
+    reader, writer = connection
+    reusable = False
+    try:
+        head = (
+            f'POST {parts.path} HTTP/1.1\r\n'
+            f'Host: {parts.hostname}\r\n'
+            f'User-Agent: {cloudinary.get_user_agent()}\r\n'
+            f'Content-Type: {content_type}\r\n'
+            f'Content-Length: {sum(_part_length(part) for part in body)}\r\n\r\n'
+        )
+        writer.write(head.encode('latin-1'))
+        for part in body:
+            if isinstance(part, bytes):
+                writer.write(part)
+                continue
+            part.seek(0)
+            while chunk := part.read(CHUNK_SIZE):
+                writer.write(chunk)
+                await writer.drain()
+        await writer.drain()
+        status, payload, reusable = await _read_response(reader)
+        return status, payload
+    finally:
+        # A timeout or error leaves the connection mid-exchange; only a
+        # cleanly finished one goes back to the pool.
+        if not (reusable and _checkin(key, connection)):
+            writer.close()
+            with contextlib.suppress(Exception):
+                await writer.wait_closed()
+
+
+def _pool(key):
+    return _pools.setdefault(asyncio.get_running_loop(), {}).setdefault(key, [])
+
+
+def _checkout(key):
+    idle = _pool(key)
+    while idle:
+        reader, writer = idle.pop()
+        if not (writer.is_closing() or reader.at_eof()):
+            return reader, writer
+        writer.close()
+    return None
+
+
+def _checkin(key, connection):
+    idle = _pool(key)
+    if len(idle) >= settings.IMAGE_HOST_POOL_SIZE:
+        return False
+    idle.append(connection)
+    return True
+
+
+async def _read_response(reader):
+    """``(status, body, reusable)``; ``reusable`` says whether the connection can carry another request."""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionResetError("Image host closed the connection")
+    try:
+        status = int(status_line.split()[1])
+    except (IndexError, ValueError):
+        raise Error(f"Malformed response from image host: {status_line!r}")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    keep_alive = headers.get('connection', '').lower() != 'close'
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                await reader.readline()
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+        return status, b''.join(chunks), keep_alive
+    if 'content-length' in headers:
+        return status, await reader.readexactly(int(headers['content-length'])), keep_alive
+    # Delimited by the host closing the connection.
+    return status, await reader.read(), False
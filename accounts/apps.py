@@ -4,3 +4,22 @@ from django.apps import AppConfig
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounts'
+
+    def ready(self):
+        from django.conf import settings
+        from django.contrib.auth import get_user_model
+        from django.db import connections
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_save
+
+        from .db_routing import user_saved
+        from .instrumentation import install_query_timer
+        from .jwt_keys import install_token_backend
+
+        install_token_backend()
+        if settings.DATABASE_REPLICAS:
+            post_save.connect(user_saved, sender=get_user_model(), dispatch_uid='accounts.db_routing.user_saved')
+        if settings.METRICS_ENABLED:
+            connection_created.connect(install_query_timer, dispatch_uid='accounts.instrumentation.query_timer')
+            for connection in connections.all(initialized_only=True):
+                install_query_timer(connection)
@@ -0,0 +1,271 @@
+"""
+Native async implementations of the accounts API, served instead of
+``accounts.views`` when ``ACCOUNTS_ASYNC_VIEWS`` is enabled.
+
+They return the same payloads as the DRF views but never park a thread on
+network I/O: the ORM is used through its async methods, image uploads go
+through the image client's ``aupload`` and password hashing runs on a
+bounded executor.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import check_password, make_password
+from django.contrib.auth.models import update_last_login
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils.decorators import classonlymethod
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, serializers, status
+from rest_framework_simplejwt.settings import api_settings
+
+from .authentication import CachedJWTAuthentication
+from .conditional import add_validators, not_modified, profile_etag
+from .images import (
+    adelete_profile_image_assets, areplace_profile_image, has_profile_image,
+)
+from .instrumentation import timed
+from .jobs import enqueue_profile_image
+from .renderers import Envelope, json_response, loads
+from .serializers import (
+    CustomTokenObtainPairSerializer, ProfileImageSerializer, RegisterSerializer, UserSerializer,
+)
+from .throttling import LoginRateThrottle, SignUpRateThrottle
+from .wallet import grant_first_upload_reward
+
+User = get_user_model()
+
+_hash_executor = ThreadPoolExecutor(
+    max_workers=settings.ASYNC_PASSWORD_HASH_WORKERS,
+    thread_name_prefix='password-hash',
+)
+
+
+async def run_hasher(fn, *args):
+    # hashlib's PBKDF2 releases the GIL, so hashes on this pool run in
+    # parallel without blocking the event loop. Timed here: the pool's
+    # threads don't see the request's context.
+    with timed('hash'):
+        return await asyncio.get_running_loop().run_in_executor(_hash_executor, fn, *args)
+
+
+def request_data(request):
+    if request.content_type == 'application/json':
+        return loads(request.body or b'{}')
+    return request.POST.dict()
+
+
+def error_response(message, status_code=status.HTTP_400_BAD_REQUEST):
+    return json_response(Envelope(400, message, static=False), status=status_code)
+
+
+class AsyncAPIView(View):
+    authentication = CachedJWTAuthentication()
+    authentication_required = False
+    throttle_classes = []
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        # Token-authenticated like the DRF views, so CSRF does not apply.
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        if self.authentication_required:
+            try:
+                result = await self.authentication.aauthenticate(request)
+            except exceptions.APIException as e:
+                return json_response({'detail': e.detail}, status=e.status_code)
+            if result is None:
+                return json_response(
+                    {'detail': 'Authentication credentials were not provided.'},
+                    status=status.HTTP_401_UNAUTHORIZED,
+                )
+            request.user, request.auth = result
+        for throttle_class in self.throttle_classes:
+            throttle = throttle_class()
+            if not await sync_to_async(throttle.allow_request, thread_sensitive=False)(request, self):
+                wait = throttle.wait()
+                return json_response(
+                    {'detail': f'Request was throttled. Expected available in {wait} seconds.'},
+                    status=status.HTTP_429_TOO_MANY_REQUESTS,
+                    headers={'Retry-After': str(wait)},
+                )
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class SignUpView(AsyncAPIView):
+    throttle_classes = [SignUpRateThrottle]
+
+    async def post(self, request, *args, **kwargs):
+        try:
+            serializer = RegisterSerializer(data=request_data(request))
+            serializer.is_valid(raise_exception=True)
+            data = serializer.validated_data
+
+            user = RegisterSerializer.build_user(data)
+            user.password = await run_hasher(make_password, data['password'])
+            await sync_to_async(RegisterSerializer.save_user)(user)
+
+            return json_response(Envelope(200, 'User registered successfully', {
+                'id': user.id,
+                'name': user.name,
+                'email': user.email,
+                'phone': user.phone,
+            }), status=status.HTTP_201_CREATED)
+        except Exception as e:
+            return error_response(str(e))
+
+
+class LoginView(AsyncAPIView):
+    throttle_classes = [LoginRateThrottle]
+
+    async def post(self, request, *args, **kwargs):
+        try:
+            data = request_data(request)
+            missing = {
+                field: ["This field is required."]
+                for field in (User.USERNAME_FIELD, 'password') if not data.get(field)
+            }
+            if missing:
+                raise serializers.ValidationError(missing)
+
+            user = await self.authenticate(data[User.USERNAME_FIELD], data['password'])
+            if user is None:
+                raise exceptions.AuthenticationFailed("No active account found with the given credentials")
+
+            refresh = CustomTokenObtainPairSerializer.get_token(user)
+            if api_settings.UPDATE_LAST_LOGIN:
+                await sync_to_async(update_last_login)(None, user)
+
+            return json_response({
+                'refresh': str(refresh),
+                'access': str(refresh.access_token),
+                'user': {
+                    'id': user.id,
+                    'name': user.name,
+                    'email': user.email,
+                },
+            }, status=status.HTTP_200_OK)
+        except Exception as e:
+            return error_response(str(e))
+
+    async def authenticate(self, username, password):
+        user = await User.objects.filter(**{User.USERNAME_FIELD: username}).afirst()
+        if user is None:
+            # Hash anyway so response time doesn't reveal unknown emails.
+            await run_hasher(make_password, password)
+            return None
+
+        outdated = []
+        valid = await run_hasher(check_password, password, user.password, outdated.append)
+        if not valid or not user.is_active:
+            return None
+        if outdated:
+            user.password = await run_hasher(make_password, password)
+            await user.asave(update_fields=['password'])
+        return user
+
+
+class MyProfileView(AsyncAPIView):
+    authentication_required = True
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            user = request.user
+            etag = profile_etag(user)
+            response = not_modified(request, etag, user.profile_updated_at)
+            if response is not None:
+                return response
+
+            cache_key = f'accounts:profile:{user.pk}:{etag}'
+            data = await cache.aget(cache_key) if settings.PROFILE_CACHE_TTL else None
+            if data is None:
+                data = UserSerializer(user).data
+                if settings.PROFILE_CACHE_TTL:
+                    await cache.aset(cache_key, data, settings.PROFILE_CACHE_TTL)
+
+            response = json_response(Envelope(200, 'User profile retrieved successfully', data))
+            return add_validators(response, etag, user.profile_updated_at)
+        except Exception as e:
+            return error_response(str(e))
+
+
+class EditProfileView(AsyncAPIView):
+    authentication_required = True
+
+    async def put(self, request, *args, **kwargs):
+        return await self.update(request, partial=False)
+
+    async def patch(self, request, *args, **kwargs):
+        return await self.update(request, partial=True)
+
+    async def update(self, request, partial):
+        try:
+            instance = request.user
+            serializer = UserSerializer(instance, data=request_data(request), partial=partial)
+            serializer.is_valid(raise_exception=True)
+            await sync_to_async(serializer.save)()
+            return json_response(Envelope(
+                200, f'Profile updated successfully for user {instance.email}', serializer.data,
+                static=False,
+            ), status=status.HTTP_200_OK)
+        except Exception as e:
+            return error_response(str(e))
+
+
+class UploadProfileImageView(AsyncAPIView):
+    authentication_required = True
+
+    async def post(self, request, *args, **kwargs):
+        try:
+            user = request.user
+            serializer = ProfileImageSerializer(user, data=request.FILES, partial=True)
+            serializer.is_valid(raise_exception=True)
+            image = serializer.validated_data['profile_image']
+
+            if settings.PROFILE_IMAGE_UPLOAD_MODE == 'async':
+                job = await sync_to_async(enqueue_profile_image)(user, image)
+                return json_response(Envelope(202, 'Profile image upload queued', {
+                    'job_id': job.id,
+                    'status': job.status,
+                    'status_url': reverse('upload-image-status', kwargs={'pk': job.id}),
+                }), status=status.HTTP_202_ACCEPTED)
+
+            had_profile_image = has_profile_image(user)
+            await areplace_profile_image(user, image)
+            if not had_profile_image:
+                await sync_to_async(grant_first_upload_reward)(user)
+
+            return json_response(Envelope(200, 'Profile image uploaded successfully', {
+                'cloudinary_url': user.cloudinary_url,
+            }), status=status.HTTP_200_OK)
+        except Exception as e:
+            return error_response(str(e))
+
+
+class DeleteProfileImageView(AsyncAPIView):
+    authentication_required = True
+
+    async def delete(self, request, pk, *args, **kwargs):
+        user_to_delete = await User.objects.filter(pk=pk).afirst()
+        if user_to_delete is None:
+            return json_response({'detail': 'No User matches the given query.'}, status=status.HTTP_404_NOT_FOUND)
+        if not user_to_delete.profile_image and not user_to_delete.cloudinary_public_id:
+            return json_response(Envelope('error', 'No profile image found to delete.'), status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            await adelete_profile_image_assets(user_to_delete)
+
+            user_to_delete.profile_image = None
+            user_to_delete.cloudinary_url = None
+            user_to_delete.cloudinary_public_id = None
+            user_to_delete.profile_image_variants = {}
+            await user_to_delete.asave()
+
+            return json_response(Envelope('success', 'Profile image deleted successfully.'), status=status.HTTP_200_OK)
+        except Exception as e:
+            return json_response(Envelope('error', str(e), static=False), status=status.HTTP_400_BAD_REQUEST)
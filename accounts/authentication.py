@@ -0,0 +1,65 @@
+from asgiref.sync import sync_to_async
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from . import db_routing, user_cache
+from .revocation import store as revocation_store
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves the token's user through ``user_cache``
+    instead of querying the database on every request, and rejects tokens
+    found in the in-memory revocation store. Users who wrote recently are
+    read from the primary database (see ``db_routing``).
+    """
+
+    def get_user(self, validated_token):
+        if revocation_store.sync_due():
+            revocation_store.sync()
+        user_id = self.get_user_id(validated_token)
+        db_routing.authenticated(user_id)
+        user = user_cache.get_user(user_id)
+        return self.check_user(user, validated_token, revocation_store.is_revoked(validated_token.payload))
+
+    async def aauthenticate(self, request):
+        """Native async counterpart of ``authenticate`` for plain Django async views."""
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        if revocation_store.sync_due():
+            await sync_to_async(revocation_store.sync)()
+        user_id = self.get_user_id(validated_token)
+        await db_routing.aauthenticated(user_id)
+        user = await user_cache.aget_user(user_id)
+        revoked = await revocation_store.ais_revoked(validated_token.payload)
+        return self.check_user(user, validated_token, revoked), validated_token
+
+    def get_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+    def check_user(self, user, validated_token, revoked):
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if revoked:
+            raise AuthenticationFailed(_("Token has been revoked"), code="token_revoked")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
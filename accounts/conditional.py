@@ -0,0 +1,38 @@
+"""
+Helpers for conditional GETs (ETag / Last-Modified) on per-user resources.
+
+Views compute a validator from a cheap version marker, call
+``not_modified`` before doing any serialization work and ``add_validators``
+on the full response.
+"""
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(*parts):
+    return quote_etag('-'.join(str(part) for part in parts))
+
+
+def profile_etag(user):
+    return make_etag('profile', user.pk, user.profile_version, user.profile_updated_at.timestamp())
+
+
+def not_modified(request, etag, last_modified=None):
+    """Return a 304 response if the client's validators still match, else ``None``."""
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+    if response is not None:
+        add_validators(response, etag, last_modified)
+    return response
+
+
+def add_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    # Per-user data: shared caches must not store it, clients must revalidate.
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
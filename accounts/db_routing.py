@@ -0,0 +1,141 @@
+"""
+Primary/replica routing.
+
+With ``DATABASE_REPLICAS`` configured, ``replica_routing_middleware`` decides
+per request where reads go and ``ReplicaRouter`` applies it:
+
+* Writes always go to the primary (``default``).
+* Reads in GET/HEAD/OPTIONS requests go to one replica, picked per request.
+* Reads in other requests, inside ``transaction.atomic()`` on the primary,
+  after the request has written, and outside requests (management commands,
+  the image worker) stay on the primary.
+
+Read-your-writes: once a request writes, its user is pinned to the primary
+for ``DATABASE_REPLICA_PIN_SECONDS``. Token clients are pinned by user id
+(checked in ``CachedJWTAuthentication``), browsers by a short-lived cookie,
+which also covers admin sessions and newly created accounts.
+"""
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.decorators import sync_and_async_middleware
+
+PIN_KEY_PREFIX = 'accounts:db-pin:'
+PIN_COOKIE = 'db_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class RoutingState:
+    def __init__(self, replica=None):
+        self.replica = replica
+        self.user_id = None
+        self.wrote = False
+        self.pinned_users = set()
+
+
+_state = ContextVar('accounts_db_routing', default=None)
+
+
+def _pin_key(user_id):
+    return f'{PIN_KEY_PREFIX}{user_id}'
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.replica is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+            state.replica = None
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+
+def begin(request):
+    replica = None
+    if request.method in SAFE_METHODS and not request.COOKIES.get(PIN_COOKIE) and settings.DATABASE_REPLICA_ALIASES:
+        replica = random.choice(settings.DATABASE_REPLICA_ALIASES)
+    return _state.set(RoutingState(replica))
+
+
+def authenticated(user_id):
+    """Note the request's user; send its reads to the primary if it wrote recently."""
+    state = _state.get()
+    if state is None:
+        return
+    state.user_id = user_id
+    if state.replica is not None and cache.get(_pin_key(user_id)):
+        state.replica = None
+
+
+async def aauthenticated(user_id):
+    state = _state.get()
+    if state is None:
+        return
+    state.user_id = user_id
+    if state.replica is not None and await cache.aget(_pin_key(user_id)):
+        state.replica = None
+
+
+def user_saved(sender, instance, **kwargs):
+    """``post_save`` receiver for the user model: pin accounts created or edited in a request."""
+    state = _state.get()
+    if state is not None:
+        state.pinned_users.add(instance.pk)
+
+
+def _pins(state):
+    if not state.wrote:
+        return {}
+    users = state.pinned_users | ({state.user_id} if state.user_id is not None else set())
+    return {_pin_key(user_id): 1 for user_id in users}
+
+
+def _set_cookie(state, response):
+    if state.wrote:
+        response.set_cookie(
+            PIN_COOKIE, '1', max_age=settings.DATABASE_REPLICA_PIN_SECONDS, httponly=True, samesite='Lax',
+        )
+
+
+@sync_and_async_middleware
+def replica_routing_middleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = begin(request)
+            try:
+                response = await get_response(request)
+                state = _state.get()
+                pins = _pins(state)
+                if pins:
+                    await cache.aset_many(pins, settings.DATABASE_REPLICA_PIN_SECONDS)
+                _set_cookie(state, response)
+                return response
+            finally:
+                _state.reset(token)
+    else:
+        def middleware(request):
+            token = begin(request)
+            try:
+                response = get_response(request)
+                state = _state.get()
+                pins = _pins(state)
+                if pins:
+                    cache.set_many(pins, settings.DATABASE_REPLICA_PIN_SECONDS)
+                _set_cookie(state, response)
+                return response
+            finally:
+                _state.reset(token)
+    return middleware
@@ -0,0 +1,358 @@
+"""
+Resilient access to the image host.
+
+Every remote call goes through ``ImageHostClient``, which retries transient
+failures with jittered exponential backoff for at most
+``IMAGE_HOST_RETRY_BUDGET`` seconds, fails fast while its circuit breaker is
+open, and records per-operation latency (see ``stats()``). Uploads get their
+``public_id`` up front, so retrying one that landed despite the error
+overwrites that asset instead of creating a second one.
+
+Deletes don't need to happen inside the request: ``delete_later`` queues
+public ids and a background thread sends them in batches of up to
+``DELETE_BATCH_SIZE`` through the bulk delete API. Ids still queued when the
+process dies are left for ``manage.py reconcile_media`` to collect.
+"""
+import asyncio
+import atexit
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import deque
+
+from django.conf import settings
+
+from .image_host import DELETE_BATCH_SIZE, get_image_host
+from .instrumentation import timed
+
+logger = logging.getLogger(__name__)
+
+LATENCY_SAMPLES = 1000
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+def is_retryable(error):
+    """Network errors, timeouts, 5xx and rate limits are worth retrying; 4xx are not."""
+    from cloudinary import exceptions
+
+    permanent = (
+        exceptions.BadRequest, exceptions.AuthorizationRequired, exceptions.NotAllowed,
+        exceptions.NotFound, exceptions.AlreadyExists,
+    )
+    return not isinstance(error, permanent)
+
+
+class CircuitBreaker:
+    """
+    Opens after ``threshold`` consecutive failures. While open, calls fail
+    immediately; after ``reset_timeout`` seconds one trial call is let
+    through and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if self.opened_at is not None or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+class LatencyStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._operations = {}
+
+    def record(self, operation, seconds, ok):
+        with self._lock:
+            entry = self._operations.setdefault(operation, {
+                'calls': 0, 'errors': 0, 'retries': 0, 'total': 0.0, 'max': 0.0,
+                'samples': deque(maxlen=LATENCY_SAMPLES),
+            })
+            entry['calls'] += 1
+            entry['errors'] += 0 if ok else 1
+            entry['total'] += seconds
+            entry['max'] = max(entry['max'], seconds)
+            entry['samples'].append(seconds)
+
+    def record_retry(self, operation):
+        with self._lock:
+            if operation in self._operations:
+                self._operations[operation]['retries'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            operations = {name: dict(entry, samples=sorted(entry['samples'])) for name, entry in self._operations.items()}
+        result = {}
+        for name, entry in operations.items():
+            samples = entry.pop('samples')
+            entry['mean'] = entry['total'] / entry['calls']
+            entry['p50'] = _percentile(samples, 0.5)
+            entry['p95'] = _percentile(samples, 0.95)
+            result[name] = entry
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._operations.clear()
+
+
+def _percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+class ImageHostClient:
+    def __init__(self, host=None, retries=None, backoff=None, backoff_max=None, retry_budget=None, breaker=None):
+        self._host = host
+        self.retries = settings.IMAGE_HOST_RETRIES if retries is None else retries
+        self.backoff = settings.IMAGE_HOST_BACKOFF if backoff is None else backoff
+        self.backoff_max = settings.IMAGE_HOST_BACKOFF_MAX if backoff_max is None else backoff_max
+        self.retry_budget = settings.IMAGE_HOST_RETRY_BUDGET if retry_budget is None else retry_budget
+        self.breaker = breaker or CircuitBreaker(
+            settings.IMAGE_HOST_BREAKER_THRESHOLD, settings.IMAGE_HOST_BREAKER_RESET,
+        )
+        self.latency = LatencyStats()
+
+    @property
+    def host(self):
+        return self._host or get_image_host()
+
+    def call(self, operation, *args, **kwargs):
+        with timed('image_host'):
+            return self._call(operation, *args, **kwargs)
+
+    def _call(self, operation, *args, **kwargs):
+        method = getattr(self.host, operation)
+        deadline = time.monotonic() + self.retry_budget
+        attempt = 0
+        while True:
+            self._check_circuit(operation)
+            started = time.monotonic()
+            try:
+                result = method(*args, **kwargs)
+            except Exception as e:
+                delay = self._retry_delay(operation, e, started, attempt, deadline)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                continue
+            self._succeeded(operation, started)
+            return result
+
+    async def acall(self, operation, *args, **kwargs):
+        """``call`` for async callers: awaits the host's ``a<operation>`` and backs off without blocking."""
+        with timed('image_host'):
+            return await self._acall(operation, *args, **kwargs)
+
+    async def _acall(self, operation, *args, **kwargs):
+        method = getattr(self.host, f'a{operation}')
+        deadline = time.monotonic() + self.retry_budget
+        attempt = 0
+        while True:
+            self._check_circuit(operation)
+            started = time.monotonic()
+            try:
+                result = await method(*args, **kwargs)
+            except Exception as e:
+                delay = self._retry_delay(operation, e, started, attempt, deadline)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            self._succeeded(operation, started)
+            return result
+
+    def _check_circuit(self, operation):
+        if not self.breaker.allow():
+            raise CircuitOpen(f"Image host unavailable; {operation} not attempted.")
+
+    def _succeeded(self, operation, started):
+        self.latency.record(operation, time.monotonic() - started, ok=True)
+        self.breaker.record_success()
+
+    def _retry_delay(self, operation, error, started, attempt, deadline):
+        """
+        Record a failed attempt and return how long to wait before the next
+        one, or ``None`` when there shouldn't be one: the error is permanent,
+        the retries are used up, or waiting would overrun ``deadline``.
+        """
+        self.latency.record(operation, time.monotonic() - started, ok=False)
+        if not is_retryable(error):
+            # The host answered; the request itself was wrong.
+            self.breaker.record_success()
+            return None
+        self.breaker.record_failure()
+        delay = self.delay(attempt + 1)
+        if attempt >= self.retries or time.monotonic() + delay >= deadline:
+            return None
+        self.latency.record_retry(operation)
+        return delay
+
+    def delay(self, attempt):
+        """Full jitter: uniform over [0, min(cap, base * 2**attempt))."""
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+
+    def upload(self, data, **options):
+        return self.call('upload', data, **upload_options(options))
+
+    async def aupload(self, data, **options):
+        return await self.acall('upload', data, **upload_options(options))
+
+    def delete(self, public_ids):
+        return self.call('delete', list(public_ids))
+
+    def existing(self, public_ids):
+        return self.call('existing', list(public_ids))
+
+    def list_assets(self, prefix, cursor=None):
+        return self.call('list_assets', prefix, cursor)
+
+
+def upload_options(options):
+    # One public_id for every attempt: the host overwrites an asset that an
+    # attempt reported as failed but stored anyway.
+    return dict(options, public_id=options.get('public_id') or uuid.uuid4().hex, overwrite=True)
+
+
+class DeleteQueue:
+    """Collects public ids and deletes them in batches from a daemon thread."""
+
+    def __init__(self, client, batch_size=DELETE_BATCH_SIZE, interval=None, max_pending=None):
+        self.client = client
+        self.batch_size = batch_size
+        self.interval = settings.IMAGE_DELETE_FLUSH_INTERVAL if interval is None else interval
+        self.max_pending = settings.IMAGE_DELETE_MAX_PENDING if max_pending is None else max_pending
+        self.pending = []
+        self.deleted = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def put(self, public_ids):
+        public_ids = [public_id for public_id in public_ids if public_id]
+        if not public_ids:
+            return
+        with self._lock:
+            self.pending.extend(public_ids)
+            overflow = len(self.pending) - self.max_pending
+            if overflow > 0:
+                # Bounded so an outage can't grow memory without limit.
+                del self.pending[:overflow]
+                self.dropped += overflow
+            full = len(self.pending) >= self.batch_size
+        self._ensure_thread()
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        """Send everything queued so far; ids from failed batches are queued again."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self.pending = self.pending, []
+            for start in range(0, len(pending), self.batch_size):
+                batch = pending[start:start + self.batch_size]
+                try:
+                    self.client.delete(batch)
+                except Exception as e:
+                    logger.warning("Deferred delete of %d image(s) failed: %s", len(batch), e)
+                    with self._lock:
+                        self.pending[:0] = pending[start:]
+                    return
+                self.deleted += len(batch)
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='image-delete-queue', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {'pending': len(self.pending), 'deleted': self.deleted, 'dropped': self.dropped}
+
+
+_client = None
+_delete_queue = None
+_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = ImageHostClient()
+    return _client
+
+
+def get_delete_queue():
+    global _delete_queue
+    if _delete_queue is None:
+        client = get_client()
+        with _lock:
+            if _delete_queue is None:
+                _delete_queue = DeleteQueue(client)
+                atexit.register(_delete_queue.flush)
+    return _delete_queue
+
+
+def delete_later(public_ids):
+    get_delete_queue().put(public_ids)
+
+
+def stats():
+    return {
+        'operations': get_client().latency.snapshot(),
+        'circuit': get_client().breaker.state,
+        'delete_queue': get_delete_queue().stats(),
+    }
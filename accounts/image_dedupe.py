@@ -0,0 +1,106 @@
+"""
+Content-addressed profile images.
+
+Uploads are keyed by the SHA-256 of their bytes. When an identical file
+already lives on the image host, the user is pointed at that ``ImageAsset``
+instead of uploading (and resizing) it again. Assets are reference counted
+and only deleted from the host once no user points at them.
+
+Both counters are moved by conditional UPDATEs, so concurrent uploads and
+deletes never resurrect an asset that is being deleted.
+"""
+import hashlib
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import ImageAsset
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'bytes_saved': 0}
+
+
+def content_hash(image):
+    """SHA-256 of an uploaded file, reusing the digest taken during validation."""
+    digest = getattr(image, 'content_hash', None)
+    if digest:
+        return digest
+    hasher = hashlib.sha256()
+    for chunk in image.chunks():
+        hasher.update(chunk)
+    image.seek(0)
+    return hasher.hexdigest()
+
+
+def acquire(digest):
+    """Take a reference to the asset with this content hash, or return ``None``."""
+    updated = ImageAsset.objects.filter(content_hash=digest, ref_count__gt=0).update(
+        ref_count=F('ref_count') + 1, reuse_count=F('reuse_count') + 1,
+    )
+    asset = ImageAsset.objects.filter(content_hash=digest).first() if updated else None
+    with _stats_lock:
+        if asset is None:
+            _stats['misses'] += 1
+        else:
+            _stats['hits'] += 1
+            _stats['bytes_saved'] += asset.size
+    return asset
+
+
+def register(digest, user, size=0):
+    """
+    Record the asset just uploaded for ``user`` under its content hash.
+    Uploads whose variants were skipped are left untracked, so later uploads
+    of the file build their own instead of reusing the gap.
+    """
+    if not user.cloudinary_public_id:
+        return None
+    if settings.PROFILE_IMAGE_VARIANT_SIZES and not user.profile_image_variants:
+        return None
+    try:
+        with transaction.atomic():
+            return ImageAsset.objects.create(
+                content_hash=digest,
+                public_id=user.cloudinary_public_id,
+                url=user.cloudinary_url or '',
+                variants=user.profile_image_variants,
+                size=size,
+            )
+    except IntegrityError:
+        # A concurrent upload of the same file won; this copy stays untracked
+        # and is deleted outright when released.
+        return None
+
+
+def release(public_id, public_ids):
+    """
+    Drop one reference to the asset ``public_id`` and return the remote ids
+    that are now safe to delete. Untracked assets are returned as they are.
+    """
+    if not public_id:
+        return list(public_ids)
+    with transaction.atomic():
+        if not ImageAsset.objects.filter(public_id=public_id, ref_count__gt=0).update(ref_count=F('ref_count') - 1):
+            return [] if ImageAsset.objects.filter(public_id=public_id).exists() else list(public_ids)
+        asset = ImageAsset.objects.filter(public_id=public_id, ref_count=0).first()
+        if asset is None:
+            return []
+        asset.delete()
+        return asset.public_ids()
+
+
+def stats():
+    with _stats_lock:
+        data = dict(_stats)
+    lookups = data['hits'] + data['misses']
+    data['lookups'] = lookups
+    data['hit_rate'] = data['hits'] / lookups if lookups else 0.0
+    return data
+
+
+def reset_stats():
+    with _stats_lock:
+        for name in _stats:
+            _stats[name] = 0
@@ -0,0 +1,168 @@
+"""
+Listing, lookup and deletion of remote image assets, behind a small interface
+so maintenance code can run against a fake.
+
+``IMAGE_HOST_BACKEND`` selects the implementation:
+
+* ``accounts.image_host.CloudinaryHost``: the real Admin/Upload API.
+* ``accounts.image_host.LocalImageHost``: an in-memory stand-in for tests
+  and local development.
+
+Assets are dicts with ``public_id`` and ``created_at`` (an aware datetime).
+"""
+import itertools
+import threading
+import uuid
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+# Cloudinary's limits for resources / resources_by_ids / delete_resources.
+LIST_PAGE_SIZE = 500
+LOOKUP_BATCH_SIZE = 100
+DELETE_BATCH_SIZE = 100
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+class CloudinaryHost:
+    def __init__(self):
+        install_http_pool()
+
+    def list_assets(self, prefix, cursor=None):
+        """One page of assets under ``prefix``: ``(assets, next_cursor)``."""
+        import cloudinary.api
+
+        options = {'type': 'upload', 'prefix': prefix, 'max_results': LIST_PAGE_SIZE}
+        if cursor:
+            options['next_cursor'] = cursor
+        response = cloudinary.api.resources(**options)
+        assets = [
+            {'public_id': resource['public_id'], 'created_at': _parse_time(resource.get('created_at'))}
+            for resource in response.get('resources', [])
+        ]
+        return assets, response.get('next_cursor')
+
+    def existing(self, public_ids):
+        """The subset of ``public_ids`` that still exist."""
+        import cloudinary.api
+
+        found = set()
+        for batch in batched(public_ids, LOOKUP_BATCH_SIZE):
+            response = cloudinary.api.resources_by_ids(batch, max_results=len(batch))
+            found.update(resource['public_id'] for resource in response.get('resources', []))
+        return found
+
+    def delete(self, public_ids):
+        import cloudinary.api
+
+        for batch in batched(public_ids, DELETE_BATCH_SIZE):
+            cloudinary.api.delete_resources(batch)
+
+    def upload(self, data, **options):
+        """``data`` is bytes or an open file; files are rewound so a retry resends them whole."""
+        import cloudinary.uploader
+
+        if hasattr(data, 'seek'):
+            data.seek(0)
+        options.setdefault('timeout', settings.IMAGE_HOST_TIMEOUT)
+        return cloudinary.uploader.upload(data, **options)
+
+    async def aupload(self, data, filename='file', **options):
+        """``upload`` over asyncio streams (see ``aio_cloudinary``); no thread waits on the network."""
+        from . import aio_cloudinary
+
+        return await aio_cloudinary.upload(data, filename=filename, **options)
+
+
+def install_http_pool():
+    """
+    Give the SDK's upload and admin clients a keep-alive pool sized for
+    concurrent use. The SDK's default keeps one idle connection per host, so
+    concurrent requests open (and throw away) fresh TLS connections.
+    """
+    import cloudinary
+    import cloudinary.api_client.call_api
+    import cloudinary.uploader
+    from cloudinary import utils
+
+    options = dict(cloudinary.CERT_KWARGS, maxsize=settings.IMAGE_HOST_POOL_SIZE, block=False)
+    cloudinary.uploader._http = utils.get_http_connector(cloudinary.config(), options)
+    cloudinary.api_client.call_api._http = utils.get_http_connector(cloudinary.config(), options)
+
+
+def _parse_time(value):
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=dt_timezone.utc)
+
+
+class LocalImageHost:
+    """In-memory image host with the same paging behaviour as ``CloudinaryHost``."""
+
+    def __init__(self, page_size=LIST_PAGE_SIZE):
+        self.page_size = page_size
+        self.assets = {}
+        self._lock = threading.Lock()
+
+    def add(self, public_id, data=b'', created_at=None):
+        with self._lock:
+            self.assets[public_id] = {
+                'public_id': public_id,
+                'created_at': created_at or timezone.now(),
+                'data': data,
+            }
+
+    def list_assets(self, prefix, cursor=None):
+        # The cursor is the last id returned, so deletes between pages don't
+        # shift later pages (Cloudinary's cursors behave the same way).
+        with self._lock:
+            ids = sorted(
+                public_id for public_id in self.assets
+                if public_id.startswith(prefix) and (cursor is None or public_id > cursor)
+            )
+            page = ids[:self.page_size]
+            assets = [{'public_id': public_id, 'created_at': self.assets[public_id]['created_at']} for public_id in page]
+        next_cursor = page[-1] if len(ids) > self.page_size else None
+        return assets, next_cursor
+
+    def existing(self, public_ids):
+        with self._lock:
+            return {public_id for public_id in public_ids if public_id in self.assets}
+
+    def delete(self, public_ids):
+        with self._lock:
+            for public_id in public_ids:
+                self.assets.pop(public_id, None)
+
+    def upload(self, data, folder='', public_id=None, **options):
+        if hasattr(data, 'read'):
+            data.seek(0)
+            data = data.read()
+        public_id = public_id or uuid.uuid4().hex
+        if folder:
+            public_id = f'{folder}/{public_id}'
+        self.add(public_id, data)
+        return {'public_id': public_id, 'secure_url': f'https://images.invalid/{public_id}'}
+
+    async def aupload(self, data, folder='', public_id=None, **options):
+        return self.upload(data, folder=folder, public_id=public_id, **options)
+
+
+_host = None
+_host_lock = threading.Lock()
+
+
+def get_image_host():
+    global _host
+    if _host is None:
+        with _host_lock:
+            if _host is None:
+                _host = import_string(settings.IMAGE_HOST_BACKEND)()
+    return _host
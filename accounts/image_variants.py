@@ -0,0 +1,127 @@
+import asyncio
+import io
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+
+class VariantQueueFull(Exception):
+    pass
+
+
+def render_variants(source, sizes, formats, quality):
+    """
+    Decode ``source`` (a file path or the image bytes) once and return
+    ``[(size, format, bytes), ...]`` with one entry per size/format pair.
+
+    Runs inside the process pool, so it only touches Pillow. Images are
+    auto-oriented from their EXIF tag and re-encoded without any metadata.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(source if isinstance(source, str) else io.BytesIO(source)) as original:
+        image = ImageOps.exif_transpose(original)
+        image.load()
+
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    variants = []
+    for size in sorted(sizes, reverse=True):
+        # Resize from the previous (larger) variant; each step is cheaper
+        # than going back to the full-resolution original.
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        for fmt in formats:
+            frame = image
+            if fmt == 'jpeg' and image.mode == 'RGBA':
+                frame = Image.new('RGB', image.size, (255, 255, 255))
+                frame.paste(image, mask=image.getchannel('A'))
+            buffer = io.BytesIO()
+            frame.save(buffer, fmt.upper(), quality=quality, optimize=True)
+            variants.append((size, fmt, buffer.getvalue()))
+    return variants
+
+
+class VariantProcessor:
+    """
+    Process pool with a bounded number of in-flight jobs.
+
+    Request threads that find the queue full get ``VariantQueueFull`` after
+    ``queue_timeout`` seconds instead of piling more CPU work onto the pool.
+    """
+
+    def __init__(self, workers, queue_size, queue_timeout, result_timeout):
+        self.queue_timeout = queue_timeout
+        self.result_timeout = result_timeout
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+
+    def render(self, source, sizes, formats, quality):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise VariantQueueFull("Image processing queue is full.")
+        try:
+            future = self._executor.submit(render_variants, source, sizes, formats, quality)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result(timeout=self.result_timeout)
+
+    async def arender(self, source, sizes, formats, quality):
+        """``render`` for async callers; waits for a slot without blocking the event loop."""
+        deadline = time.monotonic() + self.queue_timeout
+        while not self._slots.acquire(blocking=False):
+            if time.monotonic() >= deadline:
+                raise VariantQueueFull("Image processing queue is full.")
+            await asyncio.sleep(0.05)
+        try:
+            future = self._executor.submit(render_variants, source, sizes, formats, quality)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return await asyncio.wait_for(asyncio.wrap_future(future), self.result_timeout)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_processor = None
+_processor_lock = threading.Lock()
+
+
+def get_processor():
+    global _processor
+    if _processor is None:
+        with _processor_lock:
+            if _processor is None:
+                _processor = VariantProcessor(
+                    workers=settings.IMAGE_PROCESS_WORKERS,
+                    queue_size=settings.IMAGE_PROCESS_QUEUE_SIZE,
+                    queue_timeout=settings.IMAGE_PROCESS_QUEUE_TIMEOUT,
+                    result_timeout=settings.IMAGE_PROCESS_TIMEOUT,
+                )
+    return _processor
+
+
+def build_variants(source):
+    return get_processor().render(
+        source,
+        settings.PROFILE_IMAGE_VARIANT_SIZES,
+        settings.PROFILE_IMAGE_VARIANT_FORMATS,
+        settings.PROFILE_IMAGE_VARIANT_QUALITY,
+    )
+
+
+async def abuild_variants(source):
+    return await get_processor().arender(
+        source,
+        settings.PROFILE_IMAGE_VARIANT_SIZES,
+        settings.PROFILE_IMAGE_VARIANT_FORMATS,
+        settings.PROFILE_IMAGE_VARIANT_QUALITY,
+    )
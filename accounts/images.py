@@ -0,0 +1,278 @@
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import image_dedupe
+from .image_client import delete_later, get_client
+from .image_variants import VariantQueueFull, abuild_variants, build_variants
+from .instrumentation import timed
+
+logger = logging.getLogger(__name__)
+
+CLOUDINARY_FOLDER = 'user_profiles'
+VARIANT_FOLDER = 'user_profiles/variants'
+
+
+def delete_profile_image_assets(user):
+    """
+    Remove the user's local image file and release its remote asset. Assets
+    no other user shares are queued for a batched delete outside the request.
+    """
+    release_profile_image_assets(current_profile_image_assets(user))
+
+
+def current_profile_image_assets(user):
+    """What ``release_profile_image_assets`` needs to let go of the user's current image."""
+    local_path = user.profile_image.path if user.profile_image else None
+    return user.cloudinary_public_id, _remote_public_ids(user), local_path
+
+
+def release_profile_image_assets(assets):
+    public_id, public_ids, local_path = assets
+    delete_later(image_dedupe.release(public_id, public_ids))
+    if local_path and os.path.exists(local_path):
+        os.remove(local_path)
+
+
+def _remote_public_ids(user):
+    public_ids = [user.cloudinary_public_id] if user.cloudinary_public_id else []
+    for formats in user.profile_image_variants.values():
+        public_ids.extend(variant['public_id'] for variant in formats.values())
+    return public_ids
+
+
+def has_profile_image(user):
+    return bool(user.profile_image or user.cloudinary_public_id)
+
+
+def replace_profile_image(user, image):
+    """
+    Store ``image`` as the user's profile image, then release the one it
+    replaces. Releasing last lets a re-upload of the same file reuse its asset.
+    """
+    previous = current_profile_image_assets(user)
+    store_profile_image(user, image)
+    release_profile_image_assets(previous)
+
+
+def store_profile_image(user, image):
+    """
+    Save a validated upload as the user's profile image and push it to
+    Cloudinary, honouring ``PROFILE_IMAGE_STORAGE``. Files already on the
+    image host are reused instead of uploaded again.
+    """
+    digest = image_dedupe.content_hash(image)
+    if settings.PROFILE_IMAGE_STORAGE == 'direct':
+        if reuse_profile_image_asset(user, digest):
+            return
+        upload_profile_image_file(user, image)
+    else:
+        user.profile_image = image
+        user.save(update_fields=['profile_image'])
+        if reuse_profile_image_asset(user, digest):
+            return
+        upload_profile_image(user)
+    image_dedupe.register(digest, user, getattr(image, 'size', 0) or 0)
+
+
+def reuse_profile_image_asset(user, digest):
+    asset = image_dedupe.acquire(digest)
+    if asset is None:
+        return False
+    if settings.PROFILE_IMAGE_STORAGE == 'direct':
+        user.profile_image = None
+    user.cloudinary_url = asset.url
+    user.cloudinary_public_id = asset.public_id
+    user.profile_image_variants = asset.variants
+    user.save(update_fields=['profile_image', 'cloudinary_url', 'cloudinary_public_id', 'profile_image_variants'])
+    return True
+
+
+def upload_profile_image(user):
+    """Push the user's local ``profile_image`` to Cloudinary and store the result."""
+    local_file_path = user.profile_image.path
+    if local_file_path and os.path.exists(local_file_path):
+        with open(local_file_path, 'rb') as f:
+            upload_response = get_client().upload(
+                f,
+                folder=CLOUDINARY_FOLDER,
+                filename=os.path.basename(local_file_path)
+            )
+        _save_upload_response(user, upload_response)
+        attach_profile_image_variants(user, local_file_path)
+
+
+def upload_profile_image_file(user, image):
+    """
+    Stream an uploaded file object straight to Cloudinary without keeping a
+    copy under MEDIA_ROOT.
+    """
+    upload_response = get_client().upload(
+        image,
+        folder=CLOUDINARY_FOLDER,
+        filename=os.path.basename(image.name or 'profile_image')
+    )
+    user.profile_image = None
+    _save_upload_response(user, upload_response)
+    attach_profile_image_variants(user, variant_source(image))
+
+
+def variant_source(image):
+    """
+    What the variant pool should decode: the path of an upload Django spooled
+    to disk (or of a staged file), so the pool reads it itself instead of
+    being sent a copy. Small in-memory uploads are passed as bytes.
+    """
+    if hasattr(image, 'temporary_file_path'):
+        return image.temporary_file_path()
+    path = getattr(getattr(image, 'file', None), 'name', None)
+    if isinstance(path, str) and os.path.isabs(path) and os.path.exists(path):
+        return path
+    image.seek(0)
+    return image.read()
+
+
+def _apply_upload_response(user, upload_response):
+    user.cloudinary_url = upload_response.get('secure_url')
+    user.cloudinary_public_id = upload_response.get('public_id')
+    user.profile_image_variants = {}
+    return ['profile_image', 'cloudinary_url', 'cloudinary_public_id', 'profile_image_variants']
+
+
+def _save_upload_response(user, upload_response):
+    user.save(update_fields=_apply_upload_response(user, upload_response))
+
+
+def attach_profile_image_variants(user, source):
+    """
+    Resize ``source`` (a path or bytes, see ``variant_source``) into the
+    configured variants in the process pool, upload them concurrently and
+    record their URLs on the user. The main image is already stored, so any
+    failure here is logged and clients fall back to ``cloudinary_url``.
+    """
+    if not settings.PROFILE_IMAGE_VARIANT_SIZES:
+        return
+    try:
+        variants = build_variants(source)
+        with timed('image_host'):
+            responses = _upload_variants(variants)
+    except (VariantQueueFull, TimeoutError) as e:
+        logger.warning("Skipping profile image variants for user %s: %s", user.pk, e)
+        return
+    except Exception:
+        logger.exception("Profile image variants failed for user %s", user.pk)
+        return
+    user.profile_image_variants = _variant_map(variants, responses)
+    user.save(update_fields=['profile_image_variants'])
+
+
+def _upload_variants(variants):
+    client = get_client()
+    futures = [
+        _get_upload_executor().submit(
+            client.upload, content, folder=VARIANT_FOLDER, filename=f'{size}.{fmt}', format=fmt,
+        )
+        for size, fmt, content in variants
+    ]
+    return _collect_variant_uploads([_result(future) for future in futures])
+
+
+def _result(future):
+    try:
+        return future.result()
+    except Exception as e:
+        return e
+
+
+def _collect_variant_uploads(results):
+    """Raise the first failure, queueing the variants that did upload for deletion."""
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        delete_later([result['public_id'] for result in results
+                      if not isinstance(result, BaseException) and result.get('public_id')])
+        raise errors[0]
+    return results
+
+
+_upload_executor = None
+_upload_executor_lock = threading.Lock()
+
+
+def _get_upload_executor():
+    global _upload_executor
+    if _upload_executor is None:
+        with _upload_executor_lock:
+            if _upload_executor is None:
+                _upload_executor = ThreadPoolExecutor(
+                    max_workers=settings.IMAGE_VARIANT_UPLOAD_WORKERS,
+                    thread_name_prefix='variant-upload',
+                )
+    return _upload_executor
+
+
+def _variant_map(variants, responses):
+    stored = {}
+    for (size, fmt, _), upload_response in zip(variants, responses):
+        stored.setdefault(str(size), {})[fmt] = {
+            'url': upload_response.get('secure_url'),
+            'public_id': upload_response.get('public_id'),
+        }
+    return stored
+
+
+# Async counterparts used by accounts.async_views. Uploads go through the
+# client's ``aupload``, so they get the same retries, circuit breaker and
+# stats as sync ones without holding a thread while waiting on the network.
+
+async def adelete_profile_image_assets(user):
+    await sync_to_async(delete_profile_image_assets)(user)
+
+
+async def areplace_profile_image(user, image):
+    previous = current_profile_image_assets(user)
+    await astore_profile_image(user, image)
+    await sync_to_async(release_profile_image_assets)(previous)
+
+
+async def astore_profile_image(user, image):
+    digest = image_dedupe.content_hash(image)
+    if settings.PROFILE_IMAGE_STORAGE == 'direct':
+        user.profile_image = None
+    else:
+        user.profile_image = image
+        await user.asave(update_fields=['profile_image'])
+    if await sync_to_async(reuse_profile_image_asset)(user, digest):
+        return
+    upload_response = await get_client().aupload(
+        image,
+        filename=os.path.basename(image.name or 'profile_image'),
+        folder=CLOUDINARY_FOLDER
+    )
+    await user.asave(update_fields=_apply_upload_response(user, upload_response))
+    await aattach_profile_image_variants(user, variant_source(image))
+    await sync_to_async(image_dedupe.register)(digest, user, getattr(image, 'size', 0) or 0)
+
+
+async def aattach_profile_image_variants(user, source):
+    if not settings.PROFILE_IMAGE_VARIANT_SIZES:
+        return
+    try:
+        variants = await abuild_variants(source)
+        results = await asyncio.gather(*(
+            get_client().aupload(content, filename=f'{size}.{fmt}', folder=VARIANT_FOLDER, format=fmt)
+            for size, fmt, content in variants
+        ), return_exceptions=True)
+        responses = _collect_variant_uploads(results)
+    except (VariantQueueFull, TimeoutError) as e:
+        logger.warning("Skipping profile image variants for user %s: %s", user.pk, e)
+        return
+    except Exception:
+        logger.exception("Profile image variants failed for user %s", user.pk)
+        return
+    user.profile_image_variants = _variant_map(variants, responses)
+    await user.asave(update_fields=['profile_image_variants'])
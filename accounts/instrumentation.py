@@ -0,0 +1,260 @@
+"""
+Per-request timing, enabled with ``METRICS_ENABLED``.
+
+``metrics_middleware`` times each request. While it runs, these phases are
+added up:
+
+* ``db``: every SQL query, through an execute wrapper on each connection.
+* ``hash``: password hashing (``TimedPBKDF2PasswordHasher`` and the async
+  views' hashing pool).
+* ``image_host``: outbound calls to the image host.
+* ``render``: JSON rendering of the response.
+
+The sums go out in a ``Server-Timing`` header and into per-route histograms
+served in Prometheus text format at ``/metrics``, along with the counters
+the cache, throttling and image modules already keep.
+
+When disabled, neither the middleware, the wrapper nor the hasher is
+installed. ``timed()`` then only checks a context variable.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.utils.decorators import sync_and_async_middleware
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PHASES = ('db', 'hash', 'image_host', 'render')
+
+_current = ContextVar('accounts_request_timings', default=None)
+_noop = nullcontext()
+
+
+class RequestTimings:
+    __slots__ = ('seconds', 'counts')
+
+    def __init__(self):
+        self.seconds = {}
+        self.counts = {}
+
+    def add(self, phase, seconds):
+        self.seconds[phase] = self.seconds.get(phase, 0.0) + seconds
+        self.counts[phase] = self.counts.get(phase, 0) + 1
+
+
+class _Timer:
+    __slots__ = ('timings', 'phase', 'started')
+
+    def __init__(self, timings, phase):
+        self.timings = timings
+        self.phase = phase
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.timings.add(self.phase, time.perf_counter() - self.started)
+
+
+def timed(phase):
+    """Context manager adding its duration to ``phase`` of the current request, if one is being timed."""
+    timings = _current.get()
+    if timings is None:
+        return _noop
+    return _Timer(timings, phase)
+
+
+def time_queries(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add('db', time.perf_counter() - started)
+
+
+def install_query_timer(connection, **kwargs):
+    """``connection_created`` receiver; also run for connections that already exist."""
+    if time_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_queries)
+
+
+class TimedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """The default hasher (same algorithm name and hashes), timed as ``hash``."""
+
+    def encode(self, password, salt, iterations=None):
+        with timed('hash'):
+            return super().encode(password, salt, iterations)
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.buckets[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """In-process histograms of phase durations per route, and request counts per route and status."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.requests = {}
+        self.queries = {}
+
+    def record(self, route, status, total, timings):
+        with self._lock:
+            self._histogram(route, 'total').observe(total)
+            for phase, seconds in timings.seconds.items():
+                self._histogram(route, phase).observe(seconds)
+            key = (route, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.queries[route] = self.queries.get(route, 0) + timings.counts.get('db', 0)
+
+    def _histogram(self, route, phase):
+        histogram = self.histograms.get((route, phase))
+        if histogram is None:
+            histogram = self.histograms[(route, phase)] = Histogram()
+        return histogram
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.requests.clear()
+            self.queries.clear()
+
+    def render(self):
+        lines = [
+            '# HELP accounts_request_phase_seconds Time per request spent in each phase, by route.',
+            '# TYPE accounts_request_phase_seconds histogram',
+        ]
+        with self._lock:
+            for (route, phase), histogram in sorted(self.histograms.items()):
+                labels = f'route="{route}",phase="{phase}"'
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ('+Inf',), histogram.buckets):
+                    cumulative += count
+                    lines.append(f'accounts_request_phase_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'accounts_request_phase_seconds_sum{{{labels}}} {histogram.sum}')
+                lines.append(f'accounts_request_phase_seconds_count{{{labels}}} {histogram.count}')
+            lines += ['# HELP accounts_requests_total Requests by route and status.',
+                      '# TYPE accounts_requests_total counter']
+            lines += [f'accounts_requests_total{{route="{route}",status="{status}"}} {count}'
+                      for (route, status), count in sorted(self.requests.items())]
+            lines += ['# HELP accounts_db_queries_total SQL queries run by requests, by route.',
+                      '# TYPE accounts_db_queries_total counter']
+            lines += [f'accounts_db_queries_total{{route="{route}"}} {count}'
+                      for route, count in sorted(self.queries.items())]
+        return lines
+
+
+registry = Registry()
+
+
+def server_timing(timings, total):
+    parts = [
+        f'{phase};dur={timings.seconds[phase] * 1000:.2f};desc="{timings.counts[phase]}"'
+        for phase in PHASES if phase in timings.seconds
+    ]
+    parts.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(parts)
+
+
+def _finish(request, response, timings, started):
+    total = time.perf_counter() - started
+    match = getattr(request, 'resolver_match', None)
+    route = (match.url_name if match else None) or 'unmatched'
+    registry.record(route, response.status_code, total, timings)
+    if settings.METRICS_SERVER_TIMING:
+        response['Server-Timing'] = server_timing(timings, total)
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            timings = RequestTimings()
+            token = _current.set(timings)
+            started = time.perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                _current.reset(token)
+            _finish(request, response, timings, started)
+            return response
+    else:
+        def middleware(request):
+            timings = RequestTimings()
+            token = _current.set(timings)
+            started = time.perf_counter()
+            try:
+                response = get_response(request)
+            finally:
+                _current.reset(token)
+            _finish(request, response, timings, started)
+            return response
+    return middleware
+
+
+def _gauges(prefix, values):
+    return _labelled_gauges(prefix, {'': values})
+
+
+def _labelled_gauges(prefix, samples):
+    """
+    ``samples`` maps a label string to a dict of values. Each numeric value
+    becomes a gauge ``<prefix>_<name>``, declared once and followed by all
+    of its labelled samples, as the text format requires.
+    """
+    series = {}
+    for labels, values in samples.items():
+        for name, value in values.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            series.setdefault(name, []).append(
+                f'{prefix}_{name}{{{labels}}} {value}' if labels else f'{prefix}_{name} {value}'
+            )
+    lines = []
+    for name, samples_lines in sorted(series.items()):
+        lines.append(f'# TYPE {prefix}_{name} gauge')
+        lines += samples_lines
+    return lines
+
+
+def component_metrics():
+    """The counters the cache, throttling and image modules keep, as gauges."""
+    from . import image_client, image_dedupe, throttling, user_cache
+
+    lines = _gauges('accounts_user_cache', user_cache.stats())
+    throttle = throttling.stats()
+    lines += _gauges('accounts_throttle', throttle)
+    lines.append('# TYPE accounts_throttle_requests gauge')
+    for scope, counters in sorted(throttle['scopes'].items()):
+        for outcome, count in sorted(counters.items()):
+            lines.append(f'accounts_throttle_requests{{scope="{scope}",outcome="{outcome}"}} {count}')
+    lines += _gauges('accounts_image_dedupe', image_dedupe.stats())
+    images = image_client.stats()
+    lines.append('# TYPE accounts_image_host_circuit_open gauge')
+    lines.append(f'accounts_image_host_circuit_open {int(images["circuit"] != "closed")}')
+    lines += _gauges('accounts_image_delete_queue', images['delete_queue'])
+    lines += _labelled_gauges('accounts_image_host', {
+        f'operation="{operation}"': values for operation, values in sorted(images['operations'].items())
+    })
+    return lines
+
+
+def render_metrics():
+    return '\n'.join(registry.render() + component_metrics()) + '\n'
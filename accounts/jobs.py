@@ -0,0 +1,94 @@
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+
+from .images import (
+    current_profile_image_assets, has_profile_image,
+    release_profile_image_assets, store_profile_image,
+)
+from .models import ProfileImageJob
+from .wallet import grant_first_upload_reward
+
+
+def enqueue_profile_image(user, image):
+    return ProfileImageJob.objects.create(user=user, image=image)
+
+
+def claim_next_job():
+    """
+    Atomically move the oldest pending job to ``running`` and return it.
+
+    A job is only claimable while its user has no running or older pending
+    job, so uploads for the same user are applied in order. The claim is a
+    conditional UPDATE, so concurrent workers never pick up the same job.
+    """
+    same_user = ProfileImageJob.objects.filter(user_id=OuterRef('user_id'))
+    claimable = ProfileImageJob.objects.filter(
+        status=ProfileImageJob.STATUS_PENDING
+    ).exclude(
+        Exists(same_user.filter(status=ProfileImageJob.STATUS_RUNNING))
+    ).exclude(
+        Exists(same_user.filter(status=ProfileImageJob.STATUS_PENDING, pk__lt=OuterRef('pk')))
+    )
+
+    for job_id in claimable.values_list('pk', flat=True)[:10]:
+        claimed = claimable.filter(pk=job_id).update(
+            status=ProfileImageJob.STATUS_RUNNING,
+            attempts=F('attempts') + 1,
+            started_at=timezone.now(),
+        )
+        if claimed:
+            return ProfileImageJob.objects.select_related('user').get(pk=job_id)
+    return None
+
+
+def process_job(job):
+    user = job.user
+    try:
+        had_profile_image = has_profile_image(user)
+        previous = current_profile_image_assets(user)
+        with job.image.open('rb') as staged:
+            # A fresh File, not the job's FieldFile, so local storage saves
+            # the user their own copy instead of pointing both rows at one file.
+            store_profile_image(user, File(staged.file, name=os.path.basename(staged.name)))
+        # The queued file is only a staging copy; drop it once stored.
+        job.image.delete(save=False)
+        release_profile_image_assets(previous)
+    except Exception as e:
+        _fail(job, e)
+        return job
+
+    with transaction.atomic():
+        # The reward is keyed per user in the wallet ledger, so a retried or
+        # duplicated completion can never pay out twice.
+        if not had_profile_image and grant_first_upload_reward(user):
+            job.reward_applied = True
+        job.status = ProfileImageJob.STATUS_DONE
+        job.cloudinary_url = user.cloudinary_url
+        job.error = ''
+        job.finished_at = timezone.now()
+        job.save(update_fields=['image', 'status', 'reward_applied', 'cloudinary_url', 'error', 'finished_at', 'updated_at'])
+    return job
+
+
+def _fail(job, error):
+    job.error = str(error)
+    if job.attempts < settings.PROFILE_IMAGE_JOB_MAX_ATTEMPTS:
+        job.status = ProfileImageJob.STATUS_PENDING
+    else:
+        job.status = ProfileImageJob.STATUS_FAILED
+        job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished_at', 'updated_at'])
+
+
+def requeue_stale_jobs(older_than):
+    """Return jobs left ``running`` by a crashed worker to the queue."""
+    cutoff = timezone.now() - timedelta(seconds=older_than)
+    return ProfileImageJob.objects.filter(
+        status=ProfileImageJob.STATUS_RUNNING, started_at__lt=cutoff
+    ).update(status=ProfileImageJob.STATUS_PENDING)
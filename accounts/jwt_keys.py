@@ -0,0 +1,166 @@
+"""
+Asymmetric JWT signing with several keys identified by ``kid``.
+
+Keys live in ``JWT_KEYS_DIR`` as ``<kid>.pem`` files. A file holding a private
+key can sign and verify. A file holding only a public key is a retired key:
+tokens it signed still verify until they expire. New tokens are signed with
+``JWT_ACTIVE_KID``, or with the last private key by file name if that is not
+set. To rotate, add a new key, make it active, and later replace the old
+private key with its public half (``manage.py generate_jwt_key``).
+
+With an HS* ``JWT_ALGORITHM`` none of this is used and simplejwt keeps
+signing with ``SECRET_KEY``.
+"""
+import hashlib
+import json
+import threading
+from pathlib import Path
+
+import jwt
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.backends import TokenBackend
+from rest_framework_simplejwt.exceptions import TokenBackendError
+from rest_framework_simplejwt.settings import api_settings
+
+
+def is_asymmetric(algorithm):
+    return not algorithm.startswith('HS')
+
+
+class KeyRing:
+    def __init__(self, algorithm, keys, active_kid=None):
+        """``keys`` maps kid -> PEM bytes (private or public)."""
+        self.algorithm = algorithm
+        self._alg = jwt.PyJWS().get_algorithm_by_name(algorithm)
+        self.private_keys = {}
+        self.public_keys = {}
+        for kid, pem in keys.items():
+            key = self._load(pem)
+            if hasattr(key, 'public_key'):
+                self.private_keys[kid] = key
+                key = key.public_key()
+            self.public_keys[kid] = key
+
+        if active_kid is None and self.private_keys:
+            active_kid = sorted(self.private_keys)[-1]
+        if active_kid not in self.private_keys:
+            raise ValueError(f"No private key for active kid {active_kid!r}.")
+        self.active_kid = active_kid
+
+    @classmethod
+    def from_directory(cls, algorithm, path, active_kid=None):
+        keys = {pem.stem: pem.read_bytes() for pem in sorted(Path(path).glob('*.pem'))}
+        return cls(algorithm, keys, active_kid)
+
+    def _load(self, pem):
+        try:
+            return self._alg.prepare_key(pem)
+        except (ValueError, TypeError, jwt.InvalidKeyError) as e:
+            raise ValueError(f"Invalid {self.algorithm} key: {e}") from e
+
+    @property
+    def signing_key(self):
+        return self.private_keys[self.active_kid]
+
+    def jwks(self):
+        keys = []
+        for kid, public_key in sorted(self.public_keys.items()):
+            jwk = self._alg.to_jwk(public_key, as_dict=True)
+            jwk.update(kid=kid, use='sig', alg=self.algorithm)
+            keys.append(jwk)
+        return {'keys': keys}
+
+
+class KeyRingTokenBackend(TokenBackend):
+    """
+    simplejwt backend that adds a ``kid`` header and verifies by it. Without
+    an explicit ``keyring`` the keys in ``JWT_KEYS_DIR`` are loaded on first use.
+    """
+
+    def __init__(self, keyring=None, algorithm=None, **kwargs):
+        super().__init__(algorithm or keyring.algorithm, **kwargs)
+        self._keyring = keyring
+
+    @property
+    def keyring(self):
+        return self._keyring or get_keyring()
+
+    @property
+    def prepared_signing_key(self):
+        return self.keyring.signing_key
+
+    def get_verifying_key(self, token):
+        try:
+            kid = jwt.get_unverified_header(token).get('kid')
+        except jwt.InvalidTokenError as e:
+            raise TokenBackendError(_("Token is invalid")) from e
+        key = self.keyring.public_keys.get(kid)
+        if key is None:
+            raise TokenBackendError(_("Token is invalid"))
+        return key
+
+    def encode(self, payload):
+        jwt_payload = payload.copy()
+        if self.audience is not None:
+            jwt_payload['aud'] = self.audience
+        if self.issuer is not None:
+            jwt_payload['iss'] = self.issuer
+        return jwt.encode(
+            jwt_payload,
+            self.keyring.signing_key,
+            algorithm=self.algorithm,
+            headers={'kid': self.keyring.active_kid},
+            json_encoder=self.json_encoder,
+        )
+
+
+_keyring = None
+_jwks_document = None
+_lock = threading.Lock()
+
+
+def get_keyring():
+    global _keyring
+    if _keyring is None:
+        with _lock:
+            if _keyring is None:
+                try:
+                    _keyring = KeyRing.from_directory(
+                        settings.JWT_ALGORITHM, settings.JWT_KEYS_DIR, settings.JWT_ACTIVE_KID or None,
+                    )
+                except ValueError as e:
+                    raise ImproperlyConfigured(
+                        f"{e} Create one in {settings.JWT_KEYS_DIR} with 'manage.py generate_jwt_key'."
+                    ) from e
+    return _keyring
+
+
+def jwks_document():
+    """``(body, etag)`` of the JWKS, built once per process."""
+    global _jwks_document
+    if _jwks_document is None:
+        keys = get_keyring().jwks() if is_asymmetric(settings.JWT_ALGORITHM) else {'keys': []}
+        body = json.dumps(keys, separators=(',', ':'), sort_keys=True).encode()
+        _jwks_document = (body, '"%s"' % hashlib.sha256(body).hexdigest()[:32])
+    return _jwks_document
+
+
+def install_token_backend():
+    """
+    Point simplejwt at a ``KeyRingTokenBackend`` when an asymmetric algorithm
+    is configured. simplejwt reads ``state.token_backend`` on every token, and
+    5.x no longer has a setting to swap the backend class.
+    """
+    if not is_asymmetric(settings.JWT_ALGORITHM):
+        return
+    from rest_framework_simplejwt import state
+
+    state.token_backend = KeyRingTokenBackend(
+        algorithm=settings.JWT_ALGORITHM,
+        audience=api_settings.AUDIENCE,
+        issuer=api_settings.ISSUER,
+        leeway=api_settings.LEEWAY,
+        json_encoder=api_settings.JSON_ENCODER,
+    )
@@ -0,0 +1,82 @@
+"""
+Local verification of access tokens for other services.
+
+Depends only on PyJWT (with cryptography), not on Django, so it can be copied
+into or installed by a downstream service::
+
+    verifier = JWKSVerifier('https://accounts.example.com/.well-known/jwks.json')
+    payload = verifier.verify(token)
+
+Public keys are cached in-process by ``kid``. The JWKS is fetched on first
+use, then again when ``refresh_interval`` has passed, or when a token has an
+unknown ``kid`` (a rotation). Refetches for unknown kids are rate-limited by
+``min_refetch_interval``, so bad tokens can't be used to flood the issuer.
+"""
+import json
+import threading
+import time
+import urllib.request
+
+import jwt
+
+
+class JWKSVerifier:
+    def __init__(self, jwks_url=None, jwks=None, algorithms=('RS256', 'ES256'), audience=None, issuer=None,
+                 leeway=0, refresh_interval=3600, min_refetch_interval=60, timeout=5):
+        if jwks_url is None and jwks is None:
+            raise ValueError("Pass jwks_url or a JWKS document.")
+        self.jwks_url = jwks_url
+        self.algorithms = set(algorithms)
+        self.audience = audience
+        self.issuer = issuer
+        self.leeway = leeway
+        self.refresh_interval = refresh_interval
+        self.min_refetch_interval = min_refetch_interval
+        self.timeout = timeout
+        self._keys = {}
+        self._fetched_at = float('-inf')
+        self._lock = threading.Lock()
+        if jwks is not None:
+            self.load(jwks)
+
+    def load(self, jwks):
+        keys = {}
+        for data in jwks.get('keys', []):
+            if data.get('use', 'sig') != 'sig' or data.get('alg') not in self.algorithms:
+                continue
+            keys[data['kid']] = jwt.PyJWK(data)
+        self._keys = keys
+        self._fetched_at = time.monotonic()
+
+    def fetch(self):
+        with urllib.request.urlopen(self.jwks_url, timeout=self.timeout) as response:
+            self.load(json.load(response))
+
+    def get_key(self, kid):
+        age = time.monotonic() - self._fetched_at
+        key = self._keys.get(kid)
+        stale = self.jwks_url and age > self.refresh_interval
+        unknown = key is None and self.jwks_url and age > self.min_refetch_interval
+        if stale or unknown:
+            with self._lock:
+                if time.monotonic() - self._fetched_at > min(self.refresh_interval, self.min_refetch_interval):
+                    self.fetch()
+            key = self._keys.get(kid)
+        if key is None:
+            raise jwt.InvalidTokenError(f"Unknown signing key {kid!r}.")
+        return key
+
+    def verify(self, token):
+        """Return the token's payload, or raise ``jwt.InvalidTokenError``."""
+        kid = jwt.get_unverified_header(token).get('kid')
+        key = self.get_key(kid)
+        return jwt.decode(
+            token,
+            key.key,
+            # Pin the algorithm to the key's, never the token header's.
+            algorithms=[key.algorithm_name],
+            audience=self.audience,
+            issuer=self.issuer,
+            leeway=self.leeway,
+            options={'verify_aud': self.audience is not None},
+        )
@@ -0,0 +1,50 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks.endpoints import SCENARIOS, compare, run
+
+
+class Command(BaseCommand):
+    help = "Load-test every accounts endpoint in-process against a throwaway database and report JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=500, help="Users (with wallets) seeded before the run.")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per scenario.")
+        parser.add_argument('--concurrency', type=int, default=4, help="Concurrent clients.")
+        parser.add_argument('--interface', choices=['wsgi', 'asgi'], default='wsgi')
+        parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+        parser.add_argument('--image-latency', type=float, default=0.05,
+                            help="Seconds the fake image host takes per call.")
+        parser.add_argument('--image-size', type=int, default=256, help="Width and height of uploaded images.")
+        parser.add_argument('--hasher', choices=['fast', 'default'], default='fast',
+                            help="'fast' hashes passwords with MD5 so the run measures everything else.")
+        parser.add_argument('--output', help="Write the report here instead of stdout.")
+        parser.add_argument('--baseline', help="Report from an earlier run to compare against.")
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help="Allowed regression against the baseline, as a fraction.")
+
+    def handle(self, *args, **options):
+        report = run(
+            users=options['users'],
+            requests=options['requests'],
+            concurrency=options['concurrency'],
+            interface=options['interface'],
+            scenarios=options['scenarios'],
+            image_latency=options['image_latency'],
+            image_size=options['image_size'],
+            hasher=options['hasher'],
+        )
+        body = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(body + '\n')
+        else:
+            self.stdout.write(body)
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                regressions = compare(report, json.load(f), options['tolerance'])
+            if regressions:
+                raise CommandError("Regressed against the baseline:\n" + '\n'.join(regressions))
+            self.stderr.write(self.style.SUCCESS("No regressions against the baseline."))
@@ -0,0 +1,22 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from server.swagger import write_schema
+
+
+class Command(BaseCommand):
+    help = "Generate the OpenAPI schema (JSON and YAML, plain and gzipped) served at /swagger.json."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=settings.OPENAPI_SCHEMA_DIR,
+                            help="Directory to write to (default: OPENAPI_SCHEMA_DIR).")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        paths = write_schema(options['output'])
+        for file_path in paths:
+            self.stdout.write(file_path)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(paths)} schema files in {elapsed:.1f}s."))
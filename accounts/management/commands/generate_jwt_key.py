@@ -0,0 +1,60 @@
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def generate_private_key(algorithm):
+    if algorithm.startswith(('RS', 'PS')):
+        return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    curves = {'ES256': ec.SECP256R1(), 'ES384': ec.SECP384R1(), 'ES512': ec.SECP521R1()}
+    if algorithm not in curves:
+        raise CommandError(f"Unsupported algorithm {algorithm}.")
+    return ec.generate_private_key(curves[algorithm])
+
+
+class Command(BaseCommand):
+    help = "Create a JWT signing key in JWT_KEYS_DIR, or retire one by keeping only its public key."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--algorithm', default=settings.JWT_ALGORITHM)
+        parser.add_argument('--kid', help="Key id. Defaults to the current UTC timestamp.")
+        parser.add_argument('--retire', metavar='KID',
+                            help="Replace KID's private key with its public key; its tokens keep verifying.")
+
+    def handle(self, *args, **options):
+        keys_dir = Path(settings.JWT_KEYS_DIR)
+        keys_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+
+        if options['retire']:
+            path = keys_dir / f"{options['retire']}.pem"
+            if not path.exists():
+                raise CommandError(f"{path} does not exist.")
+            private_key = serialization.load_pem_private_key(path.read_bytes(), password=None)
+            path.write_bytes(private_key.public_key().public_bytes(
+                serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo,
+            ))
+            self.stdout.write(self.style.SUCCESS(f"Retired {options['retire']}."))
+            return
+
+        kid = options['kid'] or datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')
+        path = keys_dir / f'{kid}.pem'
+        if path.exists():
+            raise CommandError(f"{path} already exists.")
+        private_key = generate_private_key(options['algorithm'])
+        # Created owner-only, so the key is never readable by others, not even briefly.
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            raise CommandError(f"{path} already exists.")
+        with os.fdopen(fd, 'wb') as f:
+            f.write(private_key.private_bytes(
+                serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {path}. Set JWT_ACTIVE_KID={kid} once every instance has the key."
+        ))
@@ -0,0 +1,56 @@
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from accounts.jobs import claim_next_job, process_job, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = "Process queued profile image uploads with a pool of worker threads."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="Number of worker threads.")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds an idle worker waits before polling the queue again.")
+        parser.add_argument('--stale-after', type=int, default=600,
+                            help="Requeue jobs left running for longer than this many seconds on startup.")
+        parser.add_argument('--once', action='store_true', help="Drain the queue and exit.")
+
+    def handle(self, *args, **options):
+        self.stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: self.stop.set())
+        signal.signal(signal.SIGINT, lambda *_: self.stop.set())
+
+        requeued = requeue_stale_jobs(options['stale_after'])
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} stale job(s).")
+
+        self.stdout.write(f"Starting {options['workers']} image worker(s).")
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            futures = [
+                pool.submit(self.work, options['poll_interval'], options['once'])
+                for _ in range(options['workers'])
+            ]
+            processed = sum(future.result() for future in futures)
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} job(s)."))
+
+    def work(self, poll_interval, once):
+        processed = 0
+        try:
+            while not self.stop.is_set():
+                close_old_connections()
+                job = claim_next_job()
+                if job is None:
+                    if once:
+                        break
+                    self.stop.wait(poll_interval)
+                    continue
+                job = process_job(job)
+                processed += 1
+                self.stdout.write(f"Job {job.pk} for user {job.user_id}: {job.status}")
+        finally:
+            connections.close_all()
+        return processed
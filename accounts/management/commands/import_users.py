@@ -0,0 +1,193 @@
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+from accounts.models import User, Wallet
+from accounts.search import index_users
+from accounts.serializers import RegisterSerializer
+
+FIELDS = ['name', 'email', 'password', 'phone', 'address']
+
+
+def _init_hasher():
+    # Worker processes started with 'spawn' don't inherit Django's setup.
+    import django
+    from django.conf import settings
+
+    if not settings.configured:
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'server.settings')
+        django.setup()
+
+
+def _hash_passwords(passwords):
+    return [make_password(password) for password in passwords]
+
+
+class Command(BaseCommand):
+    help = "Bulk import users (with wallets) from a CSV or NDJSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, or '-' for stdin.")
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help="Input format. Defaults to the file extension.")
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help="Processes used for password hashing.")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Validate and de-duplicate without writing anything.")
+        parser.add_argument('--max-errors', type=int, default=50,
+                            help="Number of invalid rows to print before going quiet.")
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or ('ndjson' if options['path'].endswith(('.ndjson', '.jsonl')) else 'csv')
+        self.max_errors = options['max_errors']
+        self.stats = {'rows': 0, 'created': 0, 'invalid': 0, 'duplicates': 0, 'conflicts': 0}
+        self.seen_emails = set()
+        self.seen_phones = set()
+
+        stream = sys.stdin if options['path'] == '-' else open(options['path'], newline='', encoding='utf-8')
+        started = time.monotonic()
+        try:
+            rows = self.read_rows(stream, fmt)
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_hasher) as pool:
+                while True:
+                    chunk = list(islice(rows, options['chunk_size']))
+                    if not chunk:
+                        break
+                    self.import_chunk(chunk, pool, options['workers'], options['dry_run'])
+                    self.report(started)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        self.report(started, final=True)
+
+    def read_rows(self, stream, fmt):
+        if fmt == 'csv':
+            for row in csv.DictReader(stream):
+                yield {field: (row.get(field) or '').strip() for field in FIELDS}
+            return
+        for line_no, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                raise CommandError(f"Line {line_no}: invalid JSON ({e})")
+            yield {field: str(row.get(field) or '').strip() for field in FIELDS}
+
+    def import_chunk(self, chunk, pool, workers, dry_run):
+        valid = []
+        for row in chunk:
+            self.stats['rows'] += 1
+            serializer = RegisterSerializer(data=row)
+            if not serializer.is_valid():
+                self.invalid(self.stats['rows'], serializer.errors)
+                continue
+            valid.append(serializer.validated_data)
+
+        valid = self.drop_duplicates(valid)
+        if not valid:
+            return
+
+        passwords = [data['password'] for data in valid]
+        batch = max(1, -(-len(passwords) // workers))
+        hashes = []
+        for part in pool.map(_hash_passwords, [passwords[i:i + batch] for i in range(0, len(passwords), batch)]):
+            hashes.extend(part)
+
+        users = [
+            User(
+                username=data['email'],
+                email=data['email'],
+                name=data['name'],
+                phone=data.get('phone', ''),
+                address=data.get('address', ''),
+                password=password_hash,
+            )
+            for data, password_hash in zip(valid, hashes)
+        ]
+        if dry_run:
+            self.stats['created'] += len(users)
+            return
+
+        try:
+            with transaction.atomic():
+                self.insert(users)
+        except IntegrityError:
+            # Someone signed up with one of these emails or phones since
+            # drop_duplicates looked. Insert the chunk row by row instead.
+            users = [user for user in users if self.insert_one(user)]
+        self.stats['created'] += len(users)
+
+    def insert(self, users):
+        User.objects.bulk_create(users, batch_size=500)
+        if any(user.pk is None for user in users):
+            # Backends without RETURNING don't set primary keys.
+            ids = dict(User.objects.filter(email__in=[u.email for u in users]).values_list('email', 'pk'))
+            for user in users:
+                user.pk = ids[user.email]
+        Wallet.objects.bulk_create([Wallet(user=user, balance=0) for user in users], batch_size=500)
+        # bulk_create skips post_save, so index for search here.
+        index_users(users, replace=False)
+
+    def insert_one(self, user):
+        # The failed bulk insert may have set a primary key before rolling back.
+        user.pk = None
+        user._state.adding = True
+        try:
+            with transaction.atomic():
+                self.insert([user])
+        except IntegrityError:
+            self.stats['conflicts'] += 1
+            self.stderr.write(f"Skipped {user.email}: its email or phone was taken during the import.")
+            return False
+        return True
+
+    def drop_duplicates(self, rows):
+        """Remove rows whose email or phone is already taken, in the file or in the DB."""
+        emails = {data['email'] for data in rows}
+        phones = {data['phone'] for data in rows if data.get('phone')}
+        taken_emails = set(User.objects.filter(email__in=emails).values_list('email', flat=True))
+        taken_emails |= set(User.objects.filter(username__in=emails).values_list('username', flat=True))
+        taken_phones = set(User.objects.filter(phone__in=phones).values_list('phone', flat=True)) if phones else set()
+
+        unique = []
+        for data in rows:
+            email, phone = data['email'], data.get('phone')
+            if email in taken_emails or email in self.seen_emails:
+                self.stats['duplicates'] += 1
+                continue
+            if phone and (phone in taken_phones or phone in self.seen_phones):
+                self.stats['duplicates'] += 1
+                continue
+            self.seen_emails.add(email)
+            if phone:
+                self.seen_phones.add(phone)
+            unique.append(data)
+        return unique
+
+    def invalid(self, row_no, errors):
+        self.stats['invalid'] += 1
+        if self.stats['invalid'] <= self.max_errors:
+            details = '; '.join(f"{field}: {' '.join(map(str, messages))}" for field, messages in errors.items())
+            self.stderr.write(f"Row {row_no}: {details}")
+
+    def report(self, started, final=False):
+        elapsed = time.monotonic() - started
+        rate = self.stats['rows'] / elapsed if elapsed else 0.0
+        message = (
+            f"{self.stats['rows']} rows, {self.stats['created']} created, "
+            f"{self.stats['duplicates']} duplicates, {self.stats['conflicts']} conflicts, "
+            f"{self.stats['invalid']} invalid "
+            f"in {elapsed:.1f}s ({rate:.0f} rows/s)"
+        )
+        self.stdout.write(self.style.SUCCESS(message) if final else message)
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.models import User
+from accounts.search import index_users
+
+
+class Command(BaseCommand):
+    help = "Rebuild the user search tokens for every user (or those from --start-id on)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--start-id', type=int, default=0,
+                            help="Resume from this user id.")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        last_id = options['start_id'] - 1
+        indexed = 0
+        fields = ['id', 'name', 'username', 'email', 'phone']
+        while True:
+            users = list(User.objects.filter(pk__gt=last_id).order_by('pk').only(*fields)[:options['chunk_size']])
+            if not users:
+                break
+            index_users(users)
+            indexed += len(users)
+            last_id = users[-1].pk
+            self.stdout.write(f"{indexed} users indexed (last id {last_id})")
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} users in {elapsed:.1f}s."))
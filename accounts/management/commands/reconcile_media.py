@@ -0,0 +1,259 @@
+import json
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from accounts import image_dedupe
+from accounts.image_client import delete_later, get_client
+from accounts.image_host import LOOKUP_BATCH_SIZE
+from accounts.images import CLOUDINARY_FOLDER, _remote_public_ids, _save_upload_response, reuse_profile_image_asset
+from accounts.models import ImageAsset, ProfileImageJob, User
+
+PHASES = ('local', 'remote', 'assets', 'users')
+LOCAL_DIRECTORY = 'profiles'
+
+
+class Command(BaseCommand):
+    help = (
+        "Find and fix profile-image orphans: local files nobody references, remote assets "
+        "nobody references, dedupe records and users whose remote asset is gone."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--phases', nargs='+', choices=PHASES, default=list(PHASES))
+        parser.add_argument('--dry-run', action='store_true', help="Report what would change without changing it.")
+        parser.add_argument('--workers', type=int, default=4,
+                            help="Threads for deletes and repairs; 1 runs them inline.")
+        parser.add_argument('--min-age', type=int, default=3600,
+                            help="Leave files, assets and users touched in the last N seconds alone.")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--checkpoint', help="JSON file recording progress; resumed from if it exists.")
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.chunk_size = options['chunk_size']
+        self.min_age = options['min_age']
+        self.checkpoint_path = options['checkpoint']
+        self.state = self.load_checkpoint()
+        self.stats = Counter()
+        self.host = get_client()
+        self.pool = ThreadPoolExecutor(max_workers=options['workers']) if options['workers'] > 1 else None
+        self.slots = threading.BoundedSemaphore(max(1, options['workers']) * 4)
+        self.pending = []
+        self.stats_lock = threading.Lock()
+
+        started = time.monotonic()
+        try:
+            for phase in PHASES:
+                if phase not in options['phases'] or self.state.get(f'{phase}_done'):
+                    continue
+                getattr(self, f'reconcile_{phase}')()
+                self.flush()
+                self.state[f'{phase}_done'] = True
+                self.save_checkpoint()
+        finally:
+            if self.pool:
+                self.pool.shutdown(wait=True)
+
+        # A dry run never writes the checkpoint, so it must not remove one either.
+        finished = all(self.state.get(f'{phase}_done') for phase in options['phases'])
+        if finished and not self.dry_run and self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        summary = ', '.join(f'{key}={value}' for key, value in sorted(self.stats.items())) or 'nothing to do'
+        prefix = '[dry run] ' if self.dry_run else ''
+        self.stdout.write(self.style.SUCCESS(f"{prefix}{summary} in {time.monotonic() - started:.1f}s"))
+
+    # -- phases -------------------------------------------------------------
+
+    def reconcile_local(self):
+        directory = os.path.join(settings.MEDIA_ROOT, LOCAL_DIRECTORY)
+        if not os.path.isdir(directory):
+            return
+        referenced = self.referenced_local_names()
+        cutoff = time.time() - self.min_age
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                self.stats['local_scanned'] += 1
+                if f'{LOCAL_DIRECTORY}/{entry.name}' in referenced or entry.stat().st_mtime > cutoff:
+                    continue
+                self.stats['local_orphans'] += 1
+                self.submit(os.remove, entry.path)
+
+    def reconcile_remote(self):
+        referenced = self.referenced_public_ids()
+        cutoff = timezone.now() - timedelta(seconds=self.min_age)
+        cursor = self.state.get('remote_cursor')
+        while True:
+            assets, cursor = self.host.list_assets(f'{CLOUDINARY_FOLDER}/', cursor)
+            self.stats['remote_scanned'] += len(assets)
+            orphans = [
+                asset['public_id'] for asset in assets
+                if asset['public_id'] not in referenced and asset['created_at'] and asset['created_at'] <= cutoff
+            ]
+            if orphans:
+                self.stats['remote_orphans'] += len(orphans)
+                self.submit(self.host.delete, orphans)
+            # Only move the checkpoint past a page once its deletes are done.
+            self.flush()
+            self.state['remote_cursor'] = cursor
+            self.save_checkpoint()
+            if not cursor:
+                break
+
+    def reconcile_assets(self):
+        cutoff = timezone.now() - timedelta(seconds=self.min_age)
+        last_id = self.state.get('assets_last_id', 0)
+        while True:
+            assets = list(
+                ImageAsset.objects.filter(pk__gt=last_id, created_at__lte=cutoff).order_by('pk')[:LOOKUP_BATCH_SIZE]
+            )
+            if not assets:
+                break
+            existing = self.host.existing([asset.public_id for asset in assets])
+            for asset in assets:
+                self.stats['assets_checked'] += 1
+                if asset.public_id not in existing:
+                    self.stats['assets_gone'] += 1
+                    self.submit(self.drop_asset, asset)
+            self.flush()
+            last_id = assets[-1].pk
+            self.state['assets_last_id'] = last_id
+            self.save_checkpoint()
+
+    def reconcile_users(self):
+        cutoff = timezone.now() - timedelta(seconds=self.min_age)
+        last_id = self.state.get('users_last_id', 0)
+        while True:
+            users = list(
+                User.objects.filter(pk__gt=last_id, profile_updated_at__lte=cutoff)
+                .exclude(cloudinary_public_id__isnull=True).exclude(cloudinary_public_id='')
+                .order_by('pk')[:LOOKUP_BATCH_SIZE]
+            )
+            if not users:
+                break
+            existing = self.host.existing([user.cloudinary_public_id for user in users])
+            for user in users:
+                self.stats['users_checked'] += 1
+                if user.cloudinary_public_id not in existing:
+                    self.stats['users_broken'] += 1
+                    self.submit(self.repair_user, user)
+            self.flush()
+            last_id = users[-1].pk
+            self.state['users_last_id'] = last_id
+            self.save_checkpoint()
+
+    # -- helpers ------------------------------------------------------------
+
+    def referenced_local_names(self):
+        names = set()
+        users = User.objects.exclude(profile_image='').exclude(profile_image__isnull=True)
+        names.update(users.values_list('profile_image', flat=True).iterator(chunk_size=self.chunk_size))
+        jobs = ProfileImageJob.objects.exclude(image='').exclude(image__isnull=True)
+        names.update(jobs.values_list('image', flat=True).iterator(chunk_size=self.chunk_size))
+        return names
+
+    def referenced_public_ids(self):
+        public_ids = set()
+        for asset in ImageAsset.objects.only('public_id', 'variants').iterator(chunk_size=self.chunk_size):
+            public_ids.update(asset.public_ids())
+        users = User.objects.exclude(cloudinary_public_id__isnull=True, profile_image_variants={})
+        rows = users.values_list('cloudinary_public_id', 'profile_image_variants').iterator(chunk_size=self.chunk_size)
+        for public_id, variants in rows:
+            if public_id:
+                public_ids.add(public_id)
+            for formats in (variants or {}).values():
+                public_ids.update(variant['public_id'] for variant in formats.values())
+        return public_ids
+
+    def drop_asset(self, asset):
+        """Stop handing out an asset that is gone; its users are repaired by the users phase."""
+        ImageAsset.objects.filter(pk=asset.pk).delete()
+
+    def repair_user(self, user):
+        """
+        Let go of the dead asset, then point the user at a live copy of their
+        local file (reusing one if it was uploaded again since) or clear the
+        dead reference.
+        """
+        # Its variants may still exist; they are deleted once nobody shares them.
+        delete_later(image_dedupe.release(user.cloudinary_public_id, _remote_public_ids(user)))
+        if user.profile_image and os.path.exists(user.profile_image.path):
+            with open(user.profile_image.path, 'rb') as f:
+                image = File(f, name=os.path.basename(user.profile_image.name))
+                digest, size = image_dedupe.content_hash(image), image.size
+                if reuse_profile_image_asset(user, digest):
+                    self.count('users_retargeted')
+                    return
+                response = self.host.upload(image, folder=CLOUDINARY_FOLDER, filename=image.name)
+            _save_upload_response(user, response)
+            image_dedupe.register(digest, user, size)
+            self.count('users_reuploaded')
+            return
+        user.cloudinary_url = None
+        user.cloudinary_public_id = None
+        user.profile_image_variants = {}
+        user.save(update_fields=['cloudinary_url', 'cloudinary_public_id', 'profile_image_variants'])
+        self.count('users_cleared')
+
+    def count(self, key):
+        with self.stats_lock:
+            self.stats[key] += 1
+
+    def submit(self, fn, *args):
+        if self.dry_run:
+            return
+        if self.pool is None:
+            self.run(fn, *args)
+            return
+        self.slots.acquire()
+        future = self.pool.submit(self.run_in_thread, fn, *args)
+        future.add_done_callback(lambda _: self.slots.release())
+        self.pending.append(future)
+
+    def run(self, fn, *args):
+        try:
+            fn(*args)
+        except Exception as e:
+            self.count('errors')
+            self.stderr.write(f"{getattr(fn, '__name__', fn)}{args!r} failed: {e}")
+
+    def run_in_thread(self, fn, *args):
+        try:
+            self.run(fn, *args)
+        finally:
+            connections.close_all()
+
+    def flush(self):
+        pending, self.pending = self.pending, []
+        for future in pending:
+            future.result()
+
+    def load_checkpoint(self):
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return {}
+        try:
+            with open(self.checkpoint_path) as f:
+                state = json.load(f)
+        except ValueError as e:
+            raise CommandError(f"Unreadable checkpoint {self.checkpoint_path}: {e}")
+        self.stdout.write(f"Resuming from {self.checkpoint_path}: {state}")
+        return state
+
+    def save_checkpoint(self):
+        if not self.checkpoint_path or self.dry_run:
+            return
+        tmp_path = f'{self.checkpoint_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.checkpoint_path)
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from accounts.models import Wallet
+from accounts.wallet import take_snapshot
+
+
+class Command(BaseCommand):
+    help = "Fold settled wallet ledger entries into each wallet's snapshot and check for balance drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wallet', type=int, action='append', dest='wallets',
+                            help="Only snapshot this wallet id (repeatable).")
+        parser.add_argument('--settle-seconds', type=int, default=60,
+                            help="Leave entries younger than this out of the snapshot.")
+        parser.add_argument('--repair', action='store_true',
+                            help="Reset drifted cached balances to the ledger balance.")
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        wallet_ids = options['wallets'] or Wallet.objects.order_by('pk').values_list('pk', flat=True).iterator(
+            chunk_size=options['chunk_size']
+        )
+        processed = drifted = 0
+        for wallet_id in wallet_ids:
+            wallet, drift = take_snapshot(wallet_id, options['settle_seconds'], options['repair'])
+            processed += 1
+            if drift:
+                drifted += 1
+                action = "repaired" if options['repair'] else "not repaired"
+                self.stderr.write(
+                    f"Wallet {wallet.pk}: cached balance {wallet.balance} is off by {drift:+d} ({action})"
+                )
+        self.stdout.write(self.style.SUCCESS(f"Snapshotted {processed} wallet(s), {drifted} with drift."))
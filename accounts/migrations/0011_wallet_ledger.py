@@ -0,0 +1,52 @@
+# Generated by Django 5.2.10 on 2026-10-18 10:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def seed_snapshots(apps, schema_editor):
+    # Balances written before the ledger existed become each wallet's
+    # starting snapshot, so recomputing from the ledger stays correct.
+    Wallet = apps.get_model('accounts', 'Wallet')
+    Wallet.objects.update(snapshot_balance=models.F('balance'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_user_phone_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wallet',
+            name='snapshot_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='wallet',
+            name='snapshot_balance',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='wallet',
+            name='snapshot_transaction_id',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='WalletTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField()),
+                ('reason', models.CharField(max_length=50)),
+                ('idempotency_key', models.CharField(max_length=100, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transactions', to='accounts.wallet')),
+            ],
+            options={
+                'ordering': ['-id'],
+                'indexes': [models.Index(fields=['wallet', 'id'], name='accounts_wallettx_wallet_id')],
+            },
+        ),
+        migrations.RunPython(seed_snapshots, migrations.RunPython.noop),
+    ]
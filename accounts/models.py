@@ -1,8 +1,9 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from cloudinary.models import CloudinaryField
+from django.utils import timezone
+from . import user_cache
 
 class User(AbstractUser):
     name = models.CharField(max_length=100, blank=False)
@@ -12,13 +13,64 @@ class User(AbstractUser):
     profile_image = models.ImageField(upload_to='profiles/', blank=True, null=True)
     cloudinary_url = models.URLField(blank=True, null=True)
     cloudinary_public_id = models.CharField(max_length=100, blank=True, null=True)
+    # {"<size>": {"<format>": {"url": ..., "public_id": ...}}}
+    profile_image_variants = models.JSONField(default=dict, blank=True)
+    # Bumped whenever a field clients see on their profile changes; used as
+    # the ETag / Last-Modified validators of the profile endpoint.
+    profile_version = models.PositiveIntegerField(default=0)
+    profile_updated_at = models.DateTimeField(default=timezone.now)
+
+    PROFILE_FIELDS = {
+        'name', 'email', 'phone', 'address', 'profile_image',
+        'cloudinary_url', 'cloudinary_public_id', 'profile_image_variants',
+    }
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['name', 'username']
 
+    class Meta(AbstractUser.Meta):
+        constraints = [
+            models.UniqueConstraint(
+                fields=['phone'],
+                condition=~models.Q(phone=''),
+                name='accounts_user_phone_unique',
+            ),
+        ]
+
     def __str__(self):
         return self.email
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or self.PROFILE_FIELDS.intersection(update_fields):
+            self.profile_version += 1
+            self.profile_updated_at = timezone.now()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'profile_version', 'profile_updated_at'}
+        super().save(*args, **kwargs)
+
+    def profile_image_url(self, size=None, fmt='jpeg'):
+        """
+        URL of the smallest variant that is at least ``size`` px, falling back
+        to the largest variant and then to the original upload.
+        """
+        if size and self.profile_image_variants:
+            sizes = sorted(int(s) for s in self.profile_image_variants)
+            chosen = next((s for s in sizes if s >= size), sizes[-1])
+            variant = self.profile_image_variants[str(chosen)].get(fmt)
+            if variant:
+                return variant['url']
+        return self.cloudinary_url
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    user_cache.invalidate_user(instance.pk)
+    # Drop it again once the surrounding transaction commits, in case a
+    # concurrent request re-cached the pre-commit row in between.
+    transaction.on_commit(lambda: user_cache.invalidate_user(instance.pk))
+
 
 class Wallet(models.Model):
     id = models.AutoField(primary_key=True)
@@ -28,5 +80,132 @@ class Wallet(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Balance as of ledger entry ``snapshot_transaction_id``; see accounts.wallet.
+    snapshot_balance = models.IntegerField(default=0)
+    snapshot_transaction_id = models.BigIntegerField(default=0)
+    snapshot_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.user.username}'s Wallet: {self.balance} {self.currency}"
+
+
+class WalletTransaction(models.Model):
+    """Append-only ledger entry. Never updated or deleted once written."""
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name='transactions')
+    amount = models.IntegerField()
+    reason = models.CharField(max_length=50)
+    idempotency_key = models.CharField(max_length=100, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-id']
+        indexes = [models.Index(fields=['wallet', 'id'], name='accounts_wallettx_wallet_id')]
+
+    def __str__(self):
+        return f"{self.amount:+d} {self.reason} ({self.idempotency_key})"
+
+class ProfileImageJob(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='image_jobs')
+    image = models.ImageField(upload_to='profiles/', blank=True, null=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    reward_applied = models.BooleanField(default=False)
+    cloudinary_url = models.URLField(blank=True, null=True)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['id']
+
     def __str__(self):
-        return f"{self.user.username}'s Wallet: {self.balance} {self.currency}"
\ No newline at end of file
+        return f"Image job {self.pk} for {self.user_id}: {self.status}"
+
+
+class RevokedToken(models.Model):
+    """
+    A revoked token (``jti`` set) or a per-user cutoff (``jti`` empty,
+    ``revoked_before`` set). Loaded into memory by ``accounts.revocation``.
+    """
+    jti = models.CharField(max_length=255, unique=True, blank=True, null=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='revoked_tokens', blank=True, null=True)
+    revoked_before = models.DateTimeField(blank=True, null=True)
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user'],
+                condition=models.Q(jti__isnull=True),
+                name='accounts_revokedtoken_user_cutoff',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Revoked token {self.jti}" if self.jti else f"Tokens of {self.user_id} before {self.revoked_before}"
+
+
+class UserSearchToken(models.Model):
+    """
+    Normalized search terms of a user (see accounts.search). Searching
+    matches token prefixes through the index on ``token``.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='search_tokens')
+    token = models.CharField(max_length=100, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'token'], name='accounts_usersearchtoken_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.token} -> {self.user_id}"
+
+
+class ImageAsset(models.Model):
+    """
+    A remote image keyed by the SHA-256 of its bytes, shared by every user
+    who uploaded the same file. ``ref_count`` users point at it; it is deleted
+    from the host when the last one lets go (see accounts.image_dedupe).
+    """
+    content_hash = models.CharField(max_length=64, unique=True)
+    public_id = models.CharField(max_length=100, unique=True)
+    url = models.URLField()
+    variants = models.JSONField(default=dict, blank=True)
+    size = models.PositiveIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=1)
+    reuse_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.public_id} ({self.ref_count} refs)"
+
+    def public_ids(self):
+        public_ids = [self.public_id]
+        for formats in self.variants.values():
+            public_ids.extend(variant['public_id'] for variant in formats.values())
+        return public_ids
+
+
+@receiver(post_save, sender=User)
+def index_user_search(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    from .search import SEARCH_FIELDS, index_user
+
+    if raw:
+        return
+    if update_fields is None or SEARCH_FIELDS.intersection(update_fields):
+        index_user(instance, replace=not created)
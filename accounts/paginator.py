@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.utils.functional import cached_property
+
+
+def estimated_row_count(model, using='default'):
+    """
+    The database's own estimate of a table's row count, or ``None``.
+
+    These are catalogue lookups that don't scan the table. Postgres and MySQL
+    estimates are only as fresh as the last ANALYZE.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    queries = {
+        'postgresql': ('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [connection.ops.quote_name(table)]),
+        'mysql': ('SELECT table_rows FROM information_schema.tables '
+                  'WHERE table_schema = DATABASE() AND table_name = %s', [table]),
+        # The largest rowid; deleted rows make it an overestimate.
+        'sqlite': (f'SELECT MAX(rowid) FROM {connection.ops.quote_name(table)}', []),
+    }
+    if connection.vendor not in queries:
+        return None
+    sql, params = queries[connection.vendor]
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if not row or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Admin paginator that never runs COUNT(*) over a large table.
+
+    Unfiltered changelists use the database's row estimate once it exceeds
+    ``ADMIN_ESTIMATED_COUNT_THRESHOLD``. Filtered or searched changelists
+    count at most that many matches, so the page links stop there.
+    """
+
+    @cached_property
+    def count(self):
+        threshold = settings.ADMIN_ESTIMATED_COUNT_THRESHOLD
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= threshold:
+                return estimate
+            return queryset.count()
+        return queryset[:threshold].count() if threshold else queryset.count()
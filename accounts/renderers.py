@@ -0,0 +1,148 @@
+"""
+JSON rendering and parsing for the API.
+
+orjson is used when it is installed and the stdlib ``json`` module otherwise
+(``JSON_BACKEND`` forces one). Output is compact UTF-8 either way, with the
+same handling of dates, decimals and lazy strings as DRF's encoder.
+
+Views build their ``{'status', 'message', 'data'}`` bodies as ``Envelope``
+objects. The ``{"status":...,"message":...`` part of a constant message is
+encoded once and reused, so a response only serializes its ``data``.
+"""
+import json
+from collections.abc import Mapping
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse
+from rest_framework import parsers, renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.utils import encoders
+
+from .instrumentation import timed
+
+NO_DATA = object()
+
+_encoder = encoders.JSONEncoder(ensure_ascii=False, separators=(',', ':'), allow_nan=False)
+
+
+def _load_orjson():
+    if settings.JSON_BACKEND not in ('auto', 'orjson'):
+        return None
+    try:
+        import orjson
+    except ImportError:
+        if settings.JSON_BACKEND == 'orjson':
+            raise ImproperlyConfigured("JSON_BACKEND is 'orjson' but orjson is not installed.")
+        return None
+    return orjson
+
+
+orjson = _load_orjson()
+BACKEND = 'orjson' if orjson else 'json'
+
+if orjson:
+    def dumps(data):
+        try:
+            # Datetimes go through DRF's encoder so they render exactly as before.
+            return orjson.dumps(data, default=_encoder.default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except orjson.JSONEncodeError:
+            # Non-string keys and the like; the stdlib handles those as DRF did.
+            return _encoder.encode(data).encode()
+
+    loads = orjson.loads
+else:
+    def dumps(data):
+        return _encoder.encode(data).encode()
+
+    loads = json.loads
+
+
+def _escape(content):
+    # Like DRF: keep the output a strict JavaScript subset.
+    if b'\xe2\x80\xa8' in content or b'\xe2\x80\xa9' in content:
+        content = content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+    return content
+
+
+_prefixes = {}
+
+
+def _prefix(status, message):
+    return b'{"status":' + dumps(status) + b',"message":' + dumps(message)
+
+
+class Envelope(Mapping):
+    """
+    The API response body. ``static=False`` for messages that vary per
+    request (errors, interpolated text) so their prefix isn't kept.
+    """
+
+    __slots__ = ('status', 'message', 'data', 'prefix')
+
+    def __init__(self, status, message, data=NO_DATA, static=True):
+        self.status = status
+        self.message = message
+        self.data = data
+        self.prefix = None
+        if static:
+            key = (status, message)
+            self.prefix = _prefixes.get(key)
+            if self.prefix is None:
+                self.prefix = _prefixes[key] = _prefix(status, message)
+
+    def encode(self):
+        prefix = self.prefix or _prefix(self.status, self.message)
+        if self.data is NO_DATA:
+            return prefix + b'}'
+        return prefix + b',"data":' + dumps(self.data) + b'}'
+
+    def __getitem__(self, key):
+        if key == 'status':
+            return self.status
+        if key == 'message':
+            return self.message
+        if key == 'data' and self.data is not NO_DATA:
+            return self.data
+        raise KeyError(key)
+
+    def __iter__(self):
+        yield 'status'
+        yield 'message'
+        if self.data is not NO_DATA:
+            yield 'data'
+
+    def __len__(self):
+        return 2 if self.data is NO_DATA else 3
+
+
+def render(data):
+    with timed('render'):
+        return _escape(data.encode() if isinstance(data, Envelope) else dumps(data))
+
+
+def json_response(data, status=200, headers=None):
+    """``JsonResponse`` for the plain Django views, rendered like the DRF ones."""
+    return HttpResponse(render(data), content_type='application/json', status=status, headers=headers)
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type or '', renderer_context or {}) is not None:
+            # Pretty-printing was asked for; leave it to DRF.
+            return super().render(dict(data) if isinstance(data, Envelope) else data, accepted_media_type,
+                                  renderer_context)
+        return render(data)
+
+
+class FastJSONParser(parsers.JSONParser):
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
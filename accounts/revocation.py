@@ -0,0 +1,278 @@
+"""
+JWT revocation without a database query per request.
+
+Two kinds of entries are kept:
+
+* a token's ``jti``, revoked on logout and when a refresh token is rotated;
+* a per-user cutoff: every token of that user issued at or before it is
+  revoked (logout-all, refresh-token reuse). Tokens carry a sub-second
+  ``iat`` (see ``accounts.tokens``), so a login in the same second after the
+  cutoff is not caught by it.
+
+``RevokedToken`` rows are the source of truth. Each process holds the user
+cutoffs in a dict and the revoked jtis in Bloom filters, one set per day of
+expiry: rotated refresh tokens pile up for the whole token lifetime, and a
+dict entry costs ~215 bytes (215 MB per worker at a million rotations)
+against ~1.8 bytes in a filter. A token the filters don't know is not revoked
+without touching the database; a hit is confirmed with an indexed lookup on
+the primary, so a false positive never rejects a valid token.
+Processes learn about each other's revocations through a numbered event log
+in Django's cache. At most every ``TOKEN_REVOCATION_SYNC_INTERVAL`` seconds
+``sync`` reads the log's sequence number and applies the new events. When
+events are missing (cache eviction, flush, a long-idle worker) it reloads the
+table instead.
+
+Entries are dropped from memory once every token they could match has
+expired; expired rows are deleted by a sweep that one worker runs every
+``TOKEN_REVOCATION_SWEEP_INTERVAL`` seconds.
+"""
+import hashlib
+import heapq
+import math
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+
+SEQUENCE_KEY = 'accounts:revocation:seq'
+EVENT_KEY_PREFIX = 'accounts:revocation:event:'
+SWEEP_KEY = 'accounts:revocation:sweep'
+# Workers further behind than this reload from the database instead.
+EVENT_TTL = 60 * 60
+MAX_EVENTS_PER_SYNC = 1000
+# Revoked jtis are grouped by the day their token expires, so a whole day's
+# filters are dropped at once.
+FILTER_BUCKET_SECONDS = 24 * 60 * 60
+
+
+def token_lifetime():
+    return max(api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME).total_seconds()
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter holding up to ``capacity`` keys at about ``error_rate`` false positives."""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, key):
+        # Double hashing: k positions from one 128-bit digest.
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self.positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(key))
+
+
+class RevocationStore:
+    def __init__(self, sync_interval=None, filter_capacity=None, filter_error_rate=None):
+        self.sync_interval = settings.TOKEN_REVOCATION_SYNC_INTERVAL if sync_interval is None else sync_interval
+        self.filter_capacity = (
+            settings.TOKEN_REVOCATION_FILTER_CAPACITY if filter_capacity is None else filter_capacity
+        )
+        self.filter_error_rate = (
+            settings.TOKEN_REVOCATION_FILTER_ERROR_RATE if filter_error_rate is None else filter_error_rate
+        )
+        self._tokens = {}   # expiry day -> [BloomFilter, ...] of jtis
+        self._users = {}    # str(user_id) -> (cutoff, expires_at)
+        self._expiry = []   # heap of (expires_at, key) for user cutoffs
+        self._seq = None
+        self._next_sync = 0.0
+        self._next_sweep = 0.0
+        self._lock = threading.RLock()
+
+    # -- checks -----------------------------------------------------------
+
+    def is_revoked(self, payload):
+        """Whether a decoded token payload has been revoked. Only queries the database on a filter hit."""
+        return self._user_revoked(payload) or self.is_token_revoked(payload.get(api_settings.JTI_CLAIM))
+
+    async def ais_revoked(self, payload):
+        if self._user_revoked(payload):
+            return True
+        jti = payload.get(api_settings.JTI_CLAIM)
+        return self.might_be_revoked(jti) and await sync_to_async(self._confirm)(jti)
+
+    def is_token_revoked(self, jti):
+        return self.might_be_revoked(jti) and self._confirm(jti)
+
+    def might_be_revoked(self, jti):
+        """Filter check only: ``False`` is definite, ``True`` may be a false positive."""
+        self._evict(time.time())
+        if not jti:
+            return False
+        for filters in list(self._tokens.values()):
+            if any(jti in bloom for bloom in filters):
+                return True
+        return False
+
+    def _user_revoked(self, payload):
+        self._evict(time.time())
+        entry = self._users.get(str(payload.get(api_settings.USER_ID_CLAIM)))
+        return entry is not None and payload.get('iat', 0) <= entry[0]
+
+    def _confirm(self, jti):
+        from .models import RevokedToken
+
+        # The primary: a replica may not have the row of a just-revoked token yet.
+        return RevokedToken.objects.using(DEFAULT_DB_ALIAS).filter(jti=jti, expires_at__gt=timezone.now()).exists()
+
+    def sync_due(self):
+        return time.monotonic() >= self._next_sync
+
+    def sync(self):
+        """Apply revocations made by other processes since the last sync."""
+        with self._lock:
+            self._next_sync = time.monotonic() + self.sync_interval
+            if time.monotonic() >= self._next_sweep:
+                self.sweep()
+            current = cache.get(SEQUENCE_KEY)
+            if current is None:
+                cache.add(SEQUENCE_KEY, 0)
+                current = cache.get(SEQUENCE_KEY, 0)
+            if self._seq is None or current < self._seq or current - self._seq > MAX_EVENTS_PER_SYNC:
+                return self.reload(current)
+            if current == self._seq:
+                return
+            keys = [f'{EVENT_KEY_PREFIX}{seq}' for seq in range(self._seq + 1, current + 1)]
+            events = cache.get_many(keys)
+            if len(events) != len(keys):
+                return self.reload(current)
+            for key in keys:
+                self._apply(*events[key])
+            self._seq = current
+
+    def reload(self, seq=None):
+        """Replace the in-memory state with the unexpired rows of ``RevokedToken``."""
+        from .models import RevokedToken
+
+        with self._lock:
+            if seq is None:
+                seq = cache.get(SEQUENCE_KEY, 0)
+            self._tokens, self._users, self._expiry = {}, {}, []
+            rows = RevokedToken.objects.filter(expires_at__gt=timezone.now()).values_list(
+                'jti', 'user_id', 'revoked_before', 'expires_at'
+            )
+            for jti, user_id, revoked_before, expires_at in rows.iterator():
+                if jti:
+                    self._apply('token', jti, None, expires_at.timestamp())
+                else:
+                    self._apply('user', str(user_id), revoked_before.timestamp(), expires_at.timestamp())
+            self._seq = seq
+            self._next_sync = time.monotonic() + self.sync_interval
+
+    def clear(self):
+        with self._lock:
+            self._tokens, self._users, self._expiry = {}, {}, []
+            self._seq = None
+            self._next_sync = 0.0
+            self._next_sweep = 0.0
+
+    def sweep(self):
+        """Delete expired rows, at most once per ``TOKEN_REVOCATION_SWEEP_INTERVAL`` across all workers."""
+        from .models import RevokedToken
+
+        interval = settings.TOKEN_REVOCATION_SWEEP_INTERVAL
+        self._next_sweep = time.monotonic() + interval
+        if cache.add(SWEEP_KEY, True, interval):
+            RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+
+    # -- revocation -------------------------------------------------------
+
+    def revoke_token(self, token):
+        """
+        Revoke a single token by its ``jti``. Returns ``False`` if it was
+        already revoked, which the refresh endpoint treats as reuse.
+        """
+        from .models import RevokedToken
+
+        jti = token[api_settings.JTI_CLAIM]
+        expires_at = token['exp']
+        try:
+            with transaction.atomic():
+                RevokedToken.objects.create(
+                    jti=jti,
+                    user_id=token.get(api_settings.USER_ID_CLAIM),
+                    expires_at=datetime.fromtimestamp(expires_at, dt_timezone.utc),
+                )
+        except IntegrityError:
+            return False
+        self._publish('token', jti, None, expires_at)
+        return True
+
+    def revoke_user(self, user_id):
+        """Revoke every token issued to ``user_id`` up to now."""
+        from .models import RevokedToken
+
+        now = timezone.now()
+        expires_at = now.timestamp() + token_lifetime()
+        RevokedToken.objects.update_or_create(
+            user_id=user_id, jti=None,
+            defaults={
+                'revoked_before': now,
+                'expires_at': datetime.fromtimestamp(expires_at, dt_timezone.utc),
+            },
+        )
+        self._publish('user', str(user_id), now.timestamp(), expires_at)
+
+    def _publish(self, kind, key, cutoff, expires_at):
+        event = (kind, key, cutoff, expires_at)
+        with self._lock:
+            self._apply(*event)
+
+        def send():
+            cache.add(SEQUENCE_KEY, 0)
+            seq = cache.incr(SEQUENCE_KEY)
+            cache.set(f'{EVENT_KEY_PREFIX}{seq}', event, EVENT_TTL)
+
+        # Only announce committed rows, so a rolled-back revocation never
+        # reaches other workers.
+        transaction.on_commit(send)
+
+    def _apply(self, kind, key, cutoff, expires_at):
+        if kind == 'token':
+            filters = self._tokens.setdefault(int(expires_at // FILTER_BUCKET_SECONDS), [])
+            if not filters or filters[-1].count >= self.filter_capacity:
+                filters.append(BloomFilter(self.filter_capacity, self.filter_error_rate))
+            filters[-1].add(key)
+            return
+        current = self._users.get(key)
+        if current is not None and current[0] >= cutoff:
+            return
+        self._users[key] = (cutoff, expires_at)
+        heapq.heappush(self._expiry, (expires_at, key))
+
+    def _evict(self, now):
+        # Every token in a day's filters has expired once the day is over.
+        expired_bucket = int(now // FILTER_BUCKET_SECONDS) - 1
+        if self._tokens and min(self._tokens) <= expired_bucket:
+            with self._lock:
+                for bucket in [bucket for bucket in self._tokens if bucket <= expired_bucket]:
+                    del self._tokens[bucket]
+        if not self._expiry or self._expiry[0][0] > now:
+            return
+        with self._lock:
+            while self._expiry and self._expiry[0][0] <= now:
+                expires_at, key = heapq.heappop(self._expiry)
+                entry = self._users.get(key)
+                if entry is not None and entry[1] == expires_at:
+                    del self._users[key]
+
+
+store = RevocationStore()
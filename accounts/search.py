@@ -0,0 +1,130 @@
+"""
+User search over the ``UserSearchToken`` side table.
+
+Each user is indexed as lowercased tokens: name words, username, the full
+email, its local part and domain (each whole and split into words) and the
+phone number's digits with their suffixes. A query is split the same way, and each query term
+must prefix-match one of the user's tokens. Prefix matches are
+``token__startswith`` lookups (``LIKE 'term%'``), which the index on ``token``
+serves (on PostgreSQL through Django's ``varchar_pattern_ops`` companion
+index), so no search needs ``ILIKE '%term%'`` over the users table.
+
+Tokens are rebuilt when a user is saved with a searchable field, and
+``manage.py index_user_search`` backfills them. ``USER_SEARCH_BACKEND`` picks
+the matcher. ``TrigramSearchBackend`` adds typo-tolerant matching through
+pg_trgm on PostgreSQL.
+"""
+import re
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils.module_loading import import_string
+
+from .models import UserSearchToken
+
+SEARCH_FIELDS = {'name', 'username', 'email', 'phone'}
+MAX_TOKEN_LENGTH = 100
+MAX_QUERY_TERMS = 5
+MIN_PHONE_SUFFIX = 4
+_WORD = re.compile(r'[^\W_]+')
+
+
+def words(value):
+    return _WORD.findall((value or '').lower())
+
+
+def user_tokens(user):
+    tokens = set(words(user.name))
+    for value in (user.username, user.email):
+        value = (value or '').strip().lower()
+        if not value:
+            continue
+        tokens.add(value)
+        local, _, domain = value.partition('@')
+        tokens.add(local)
+        tokens.update(words(local))
+        if domain:
+            tokens.add(domain)
+            tokens.update(words(domain))
+    digits = re.sub(r'\D', '', user.phone or '')
+    # Suffixes too, so a number matches with or without its country code.
+    tokens.update(digits[start:] for start in range(max(len(digits) - MIN_PHONE_SUFFIX, 0) + 1))
+    return {token[:MAX_TOKEN_LENGTH] for token in tokens if token}
+
+
+def query_terms(query):
+    """Split a search box query into normalized terms."""
+    terms = []
+    for part in query.strip().lower().split():
+        if '@' in part:
+            terms.append(part)
+        elif re.fullmatch(r'[\d\s()+\-.]+', part):
+            terms.append(re.sub(r'\D', '', part))
+        else:
+            terms.extend(words(part))
+    return [term[:MAX_TOKEN_LENGTH] for term in terms if term][:MAX_QUERY_TERMS]
+
+
+def index_users(users, replace=True):
+    """Write the search tokens of ``users``, replacing existing ones unless ``replace`` is false."""
+    users = [user for user in users if user.pk is not None]
+    if not users:
+        return
+    with transaction.atomic():
+        if replace:
+            UserSearchToken.objects.filter(user__in=[user.pk for user in users]).delete()
+        UserSearchToken.objects.bulk_create(
+            [UserSearchToken(user_id=user.pk, token=token) for user in users for token in sorted(user_tokens(user))],
+            batch_size=1000,
+        )
+
+
+def index_user(user, replace=True):
+    index_users([user], replace=replace)
+
+
+class PrefixSearchBackend:
+    def term_filter(self, term):
+        return UserSearchToken.objects.filter(user=OuterRef('pk'), token__startswith=term)
+
+    def search(self, queryset, query):
+        terms = query_terms(query)
+        if not terms:
+            return queryset.none()
+        for term in terms:
+            queryset = queryset.filter(Exists(self.term_filter(term)))
+        return queryset
+
+
+class TrigramSearchBackend(PrefixSearchBackend):
+    """
+    Prefix matches, plus tokens within ``USER_SEARCH_TRIGRAM_THRESHOLD``
+    trigram similarity of each term (PostgreSQL with pg_trgm only).
+    """
+
+    def term_filter(self, term):
+        from django.contrib.postgres.search import TrigramSimilarity
+
+        similar = UserSearchToken.objects.annotate(similarity=TrigramSimilarity('token', term)).filter(
+            user=OuterRef('pk'), similarity__gte=settings.USER_SEARCH_TRIGRAM_THRESHOLD,
+        )
+        return super().term_filter(term) | similar
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = import_string(settings.USER_SEARCH_BACKEND)()
+    return _backend
+
+
+def search_users(query, queryset=None):
+    from django.contrib.auth import get_user_model
+
+    if queryset is None:
+        queryset = get_user_model().objects.all()
+    return get_backend().search(queryset, query)
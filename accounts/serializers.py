@@ -1,15 +1,47 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, TokenError
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
 import re
+from django.db import IntegrityError, transaction
+from .image_dedupe import content_hash
+from .models import ProfileImageJob, Wallet, WalletTransaction
+from .revocation import store as revocation_store
+from .tokens import RefreshToken
 
 User = get_user_model()
 
 class UserSerializer(serializers.ModelSerializer):
+    profile_image_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = User
-        fields = ['id', 'name', 'email', 'phone', 'address']
-        read_only_fields = ['email']
+        fields = ['id', 'name', 'email', 'phone', 'address', 'cloudinary_url', 'profile_image_variants']
+        read_only_fields = ['email', 'cloudinary_url']
+        extra_kwargs = {'phone': {'validators': []}}
+
+    def update(self, instance, validated_data):
+        try:
+            with transaction.atomic():
+                # request.user can be a cached copy that is behind the row.
+                # Reload it under a lock and write only the edited columns, so
+                # image fields set by the worker or another process survive.
+                instance.refresh_from_db(from_queryset=User.objects.select_for_update())
+                for attr, value in validated_data.items():
+                    setattr(instance, attr, value)
+                if validated_data:
+                    instance.save(update_fields=list(validated_data))
+                return instance
+        except IntegrityError as e:
+            raise serializers.ValidationError(unique_violation_detail(e)) from e
+
+    def get_profile_image_variants(self, obj):
+        return {
+            size: {fmt: variant['url'] for fmt, variant in formats.items()}
+            for size, formats in obj.profile_image_variants.items()
+        }
 
 class ProfileImageSerializer(serializers.ModelSerializer):
     profile_image = serializers.ImageField(required=True)
@@ -18,57 +50,120 @@ class ProfileImageSerializer(serializers.ModelSerializer):
         model = User
         fields = ['profile_image']
 
+    def validate_profile_image(self, value):
+        # Hashed once here so storing the image doesn't read the file again.
+        value.content_hash = content_hash(value)
+        return value
+
+def check_password_strength(value):
+    if len(value) < 6:
+        raise serializers.ValidationError("Password must be at least 6 characters long.")
+    if not re.search(r"[A-Z]", value):
+        raise serializers.ValidationError("Password must contain at least one uppercase letter.")
+    if not re.search(r"[a-z]", value):
+        raise serializers.ValidationError("Password must contain at least one lowercase letter.")
+    if not re.search(r"[0-9]", value):
+        raise serializers.ValidationError("Password must contain at least one digit.")
+    if not re.search(r"[!@#$%^&*(),.?\":{}|<>]", value):
+        raise serializers.ValidationError("Password must contain at least one special character.")
+    return value
+
+
+def check_phone_format(value):
+    if not value:
+        return value
+    if not re.match(r'^\+\d+$', value):
+        raise serializers.ValidationError("Phone number must start with '+' and contain only digits.")
+    if not (10 <= len(value) <= 16):
+        raise serializers.ValidationError("Phone number must be between 10 and 16 digits.")
+    return value
+
+
+def check_email_format(value):
+    email_regex = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
+    if not re.match(email_regex, value):
+        raise serializers.ValidationError("Enter a valid email address.")
+    return value.lower()
+
+
+UNIQUE_VIOLATIONS = {
+    'phone': {'phone': ["Phone number already exists."]},
+    'email': {'email': ["Email already registered."]},
+    'username': {'email': ["Email already registered."]},
+}
+
+
+def unique_violation_detail(error):
+    """
+    Map an IntegrityError from the user table to RegisterSerializer's field
+    errors, by the violated constraint: its name on PostgreSQL (e.g.
+    ``accounts_user_email_key``, ``accounts_user_phone_unique``) or the
+    ``accounts_user.<column>`` SQLite and MySQL report. Only the first line of
+    the message is read; PostgreSQL's DETAIL line holds the offending value.
+    """
+    diag = getattr(error.__cause__, 'diag', None)
+    violated = (getattr(diag, 'constraint_name', None) or str(error).partition('\n')[0]).lower()
+    table = User._meta.db_table
+    for column, detail in UNIQUE_VIOLATIONS.items():
+        if f'{table}_{column}' in violated or f'{table}.{column}' in violated:
+            return detail
+    raise error
+
+
 class RegisterSerializer(serializers.ModelSerializer):
+    """
+    Uniqueness of email and phone is enforced by the database, not by
+    pre-check queries: the user and wallet are inserted in one transaction and
+    a constraint violation is reported as the matching field error.
+    """
     password = serializers.CharField(write_only=True)
     
     class Meta:
         model = User
         fields = ['name', 'email', 'password', 'phone', 'address']
+        extra_kwargs = {
+            'email': {'validators': []},
+            'phone': {'validators': []},
+        }
 
     def validate_password(self, value):
-        if len(value) < 6:
-            raise serializers.ValidationError("Password must be at least 6 characters long.")
-        if not re.search(r"[A-Z]", value):
-            raise serializers.ValidationError("Password must contain at least one uppercase letter.")
-        if not re.search(r"[a-z]", value):
-            raise serializers.ValidationError("Password must contain at least one lowercase letter.")
-        if not re.search(r"[0-9]", value):
-            raise serializers.ValidationError("Password must contain at least one digit.")
-        if not re.search(r"[!@#$%^&*(),.?\":{}|<>]", value):
-            raise serializers.ValidationError("Password must contain at least one special character.")
-        return value
+        return check_password_strength(value)
     
     def validate_phone(self, value):
-        if not value:
-            return value
-        if not re.match(r'^\+\d+$', value):
-            raise serializers.ValidationError("Phone number must start with '+' and contain only digits.")
-        if not (10 <= len(value) <= 16):
-            raise serializers.ValidationError("Phone number must be between 10 and 16 digits.")
-        if User.objects.filter(phone=value).exists():
-            raise serializers.ValidationError("Phone number already exists.")
-        return value
+        return check_phone_format(value)
     
     def validate_email(self, value):
-        email_regex = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        if not re.match(email_regex, value):
-            raise serializers.ValidationError("Enter a valid email address.")
-        if User.objects.filter(email=value).exists():
-            raise serializers.ValidationError("Email already registered.")
-        return value.lower()
+        return check_email_format(value)
 
     def create(self, validated_data):
-        user = User.objects.create_user(
-            username=validated_data.get('username', validated_data['email']),
+        user = self.build_user(validated_data)
+        # Hash before opening the transaction so it stays as short as the two INSERTs.
+        user.set_password(validated_data['password'])
+        return self.save_user(user)
+
+    @staticmethod
+    def build_user(validated_data):
+        return User(
+            username=User.normalize_username(validated_data.get('username', validated_data['email'])),
             email=validated_data['email'],
             name=validated_data['name'],
-            password=validated_data['password'],
             phone=validated_data.get('phone', ''),
             address=validated_data.get('address', '')
         )
+
+    @staticmethod
+    def save_user(user):
+        try:
+            with transaction.atomic():
+                user.save()
+                Wallet.objects.create(user=user, balance=0)
+        except IntegrityError as e:
+            raise serializers.ValidationError(unique_violation_detail(e)) from e
         return user
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = RefreshToken
+
     @classmethod
     def get_token(cls, user):
         token = super().get_token(user)
@@ -82,4 +177,67 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
             'name': self.user.name,
             'email': self.user.email,
         }
-        return data
\ No newline at end of file
+        return data
+
+class RotatingTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refresh serializer that revokes the presented refresh token when it is
+    rotated. Presenting an already revoked refresh token again is treated as
+    theft and revokes every token of its user.
+    """
+    token_class = RefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        if revocation_store.sync_due():
+            revocation_store.sync()
+
+        reused = revocation_store.is_token_revoked(refresh[api_settings.JTI_CLAIM])
+        if not reused and revocation_store.is_revoked(refresh.payload):
+            raise AuthenticationFailed(_("Token has been revoked"), code='token_revoked')
+        if not reused and api_settings.ROTATE_REFRESH_TOKENS:
+            # The unique jti row makes concurrent refreshes with one token race-free.
+            reused = not revocation_store.revoke_token(refresh)
+        if reused:
+            revocation_store.revoke_user(refresh[api_settings.USER_ID_CLAIM])
+            raise AuthenticationFailed(_("Refresh token reuse detected; all sessions were revoked."), code='token_reused')
+        return super().validate(attrs)
+
+
+class LogoutSerializer(serializers.Serializer):
+    refresh = serializers.CharField(required=False)
+
+    def validate_refresh(self, value):
+        try:
+            refresh = RefreshToken(value)
+        except TokenError as e:
+            raise serializers.ValidationError(str(e)) from e
+        if str(refresh[api_settings.USER_ID_CLAIM]) != str(self.context['request'].user.pk):
+            raise serializers.ValidationError("Refresh token belongs to another user.")
+        return refresh
+
+
+class UserSearchSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ['id', 'name', 'email', 'phone', 'is_active', 'date_joined']
+
+
+class ProfileImageJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ProfileImageJob
+        fields = ['id', 'status', 'attempts', 'cloudinary_url', 'error', 'created_at', 'finished_at']
+
+
+class WalletSerializer(serializers.ModelSerializer):
+    email = serializers.EmailField(source='user.email', read_only=True)
+
+    class Meta:
+        model = Wallet
+        fields = ['id', 'email', 'balance', 'currency', 'created_at', 'updated_at']
+
+
+class WalletTransactionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = WalletTransaction
+        fields = ['id', 'amount', 'reason', 'created_at']
@@ -1,3 +1,1541 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from types import ModuleType
+from unittest import mock
 
-# Create your tests here.
+import jwt
+from cryptography.hazmat.primitives import serialization
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, connections
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import TokenBackendError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import aio_cloudinary, db_routing, image_dedupe, throttling, user_cache
+from .image_client import CircuitBreaker, CircuitOpen, DeleteQueue, ImageHostClient
+from .image_host import CloudinaryHost, LocalImageHost
+from .image_variants import VariantQueueFull
+from .jwt_keys import KeyRing, KeyRingTokenBackend
+from .jwt_verify import JWKSVerifier
+from .management.commands.generate_jwt_key import generate_private_key
+from .models import ImageAsset, ProfileImageJob, RevokedToken, User, UserSearchToken, Wallet, WalletTransaction
+from .revocation import FILTER_BUCKET_SECONDS, BloomFilter, RevocationStore, store as revocation_store
+from .search import search_users
+from .serializers import (
+    CustomTokenObtainPairSerializer, RegisterSerializer, UserSerializer, unique_violation_detail,
+)
+from .wallet import credit, recompute_balance, take_snapshot
+
+
+def signup_payload(**overrides):
+    payload = {
+        'name': 'Test User',
+        'email': 'test@example.com',
+        'password': 'Passw0rd!',
+        'phone': '+12345678901',
+        'address': '1 Test Street',
+    }
+    payload.update(overrides)
+    return payload
+
+
+def png_upload(color='red', size=8):
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (size, size), color).save(buffer, 'PNG')
+    return SimpleUploadedFile('avatar.png', buffer.getvalue(), content_type='image/png')
+
+
+class UserCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        user_cache.reset_stats()
+        self.user = User.objects.create_user(username='c@example.com', email='c@example.com', name='C')
+
+    def test_local_then_shared_then_database(self):
+        user_cache.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(user_cache.get_user(self.user.pk).email, 'c@example.com')
+            user_cache.get_user(self.user.pk)
+            user_cache.clear()
+            user_cache.get_user(self.user.pk)
+        self.assertIsNone(user_cache.get_user(0))
+        stats = user_cache.stats()
+        self.assertEqual((stats['local_hits'], stats['shared_hits'], stats['misses']), (1, 1, 2))
+
+    def test_save_in_another_process_retires_local_copies(self):
+        user_cache.get_user(self.user.pk)
+        # The other worker's save only clears its own LRU; ours must still notice.
+        with mock.patch.object(user_cache, '_local', user_cache.LRUCache(16, 60)):
+            self.user.name = 'Renamed'
+            self.user.save()
+        self.assertEqual(user_cache.get_user(self.user.pk).name, 'Renamed')
+
+    def test_profile_edit_from_stale_copy_keeps_newer_image_fields(self):
+        stale = user_cache.get_user(self.user.pk)
+        User.objects.filter(pk=self.user.pk).update(
+            cloudinary_url='https://example.com/new.jpg', profile_image_variants={'64': {}},
+        )
+        api = APIClient()
+        api.force_authenticate(stale)
+        response = api.patch('/api/profile/edit/', {'name': 'New name'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['cloudinary_url'], 'https://example.com/new.jpg')
+        self.user.refresh_from_db()
+        self.assertEqual(
+            (self.user.name, self.user.cloudinary_url, self.user.profile_image_variants),
+            ('New name', 'https://example.com/new.jpg', {'64': {}}),
+        )
+
+
+class ProfileImageJobTests(TransactionTestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        overrides = self.settings(
+            MEDIA_ROOT=media, PROFILE_IMAGE_UPLOAD_MODE='async', PROFILE_IMAGE_STORAGE='local',
+            PROFILE_IMAGE_VARIANT_SIZES=[], PROFILE_IMAGE_JOB_MAX_ATTEMPTS=2,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        patcher = mock.patch('accounts.image_host._host', LocalImageHost())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        cache.clear()
+        self.user = User.objects.create_user(username='j@example.com', email='j@example.com', name='J')
+        Wallet.objects.create(user=self.user)
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def test_queued_upload_is_processed_by_the_worker(self):
+        response = self.api.post('/api/upload-image/', {'profile_image': png_upload()}, format='multipart')
+        self.assertEqual(response.status_code, 202, response.content)
+        status_url = response.json()['data']['status_url']
+        self.assertEqual(self.api.get(status_url).json()['data']['status'], 'pending')
+        staged = ProfileImageJob.objects.get().image.path
+
+        call_command('image_worker', '--once', '--workers', '1', stdout=io.StringIO())
+
+        data = self.api.get(status_url).json()['data']
+        self.assertEqual((data['status'], data['attempts']), ('done', 1))
+        self.user.refresh_from_db()
+        self.assertEqual(data['cloudinary_url'], self.user.cloudinary_url)
+        # The user keeps their own copy; the staging file is gone.
+        self.assertTrue(os.path.exists(self.user.profile_image.path))
+        self.assertNotEqual(self.user.profile_image.path, staged)
+        self.assertFalse(os.path.exists(staged))
+        job = ProfileImageJob.objects.get()
+        self.assertFalse(job.image)
+        self.assertTrue(job.reward_applied)
+
+    def test_failed_jobs_are_retried_up_to_the_limit(self):
+        from .jobs import claim_next_job, enqueue_profile_image, process_job
+
+        job = enqueue_profile_image(self.user, png_upload())
+        with mock.patch('accounts.jobs.store_profile_image', side_effect=ConnectionError('down')) as store:
+            first = process_job(claim_next_job())
+            self.assertEqual((first.status, first.attempts, first.error), ('pending', 1, 'down'))
+            second = process_job(claim_next_job())
+            self.assertEqual((second.status, second.attempts), ('failed', 2))
+            self.assertIsNone(claim_next_job())
+        self.assertEqual(store.call_count, 2)
+        self.assertTrue(os.path.exists(ProfileImageJob.objects.get(pk=job.pk).image.path))
+
+    def test_status_of_another_users_job_is_not_found(self):
+        from .jobs import enqueue_profile_image
+
+        other = User.objects.create_user(username='k@example.com', email='k@example.com', name='K')
+        job = enqueue_profile_image(other, png_upload())
+        self.assertEqual(self.api.get(f'/api/upload-image/status/{job.pk}/').status_code, 404)
+
+
+@mock.patch('accounts.management.commands.import_users.ProcessPoolExecutor',
+            lambda max_workers, initializer: ThreadPoolExecutor(max_workers))
+class ImportUsersTests(TestCase):
+    def import_users(self, rows):
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as f:
+            f.write('\n'.join(json.dumps(row) for row in rows))
+        self.addCleanup(os.remove, f.name)
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command('import_users', f.name, '--workers', '1', stdout=stdout, stderr=stderr)
+        return stdout.getvalue().splitlines()[-1], stderr.getvalue()
+
+    def test_invalid_rows_and_duplicates_are_skipped(self):
+        User.objects.create_user(username='old@example.com', email='old@example.com', name='Old')
+        summary, errors = self.import_users([
+            signup_payload(email='a@example.com', phone='+12345678901'),
+            signup_payload(email='not-an-email', phone=''),
+            signup_payload(email='a@example.com', phone=''),
+            signup_payload(email='b@example.com', phone='+12345678901'),
+            signup_payload(email='old@example.com', phone=''),
+            signup_payload(email='c@example.com', phone=''),
+        ])
+        self.assertIn('6 rows, 2 created, 3 duplicates, 0 conflicts, 1 invalid', summary)
+        self.assertIn('Row 2: email:', errors)
+        self.assertEqual(sorted(Wallet.objects.values_list('user__email', flat=True)),
+                         ['a@example.com', 'c@example.com'])
+        self.assertTrue(User.objects.get(email='a@example.com').check_password('Passw0rd!'))
+
+    def test_sign_up_racing_the_import_skips_only_its_row(self):
+        from .management.commands.import_users import Command
+
+        drop_duplicates = Command.drop_duplicates
+
+        def racing_sign_up(command, rows):
+            unique = drop_duplicates(command, rows)
+            User.objects.create_user(username='race@example.com', email='race@example.com', name='Race')
+            return unique
+
+        with mock.patch.object(Command, 'drop_duplicates', racing_sign_up):
+            summary, errors = self.import_users([
+                signup_payload(email='a@example.com', phone=''),
+                signup_payload(email='race@example.com', phone=''),
+                signup_payload(email='b@example.com', phone=''),
+            ])
+        self.assertIn('3 rows, 2 created, 0 duplicates, 1 conflicts', summary)
+        self.assertIn('Skipped race@example.com', errors)
+        self.assertEqual(Wallet.objects.count(), 2)
+
+
+def async_urlconf():
+    from django.urls import include, path
+
+    from . import async_views
+    from .urls import api_urlpatterns
+
+    urlconf = ModuleType('async_urls')
+    urlconf.urlpatterns = [path('api/', include(api_urlpatterns(async_views)))]
+    return urlconf
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        overrides = self.settings(
+            ROOT_URLCONF=async_urlconf(), ACCOUNTS_ASYNC_VIEWS=True,
+            PROFILE_IMAGE_STORAGE='direct', PROFILE_IMAGE_UPLOAD_MODE='sync',
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.host = LocalImageHost()
+        patcher = mock.patch('accounts.image_host._host', self.host)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        cache.clear()
+        throttling.reset()
+        self.client = AsyncClient()
+
+    async def test_sign_up_login_profile_and_edit(self):
+        response = await self.client.post('/api/auth/sign-up/', signup_payload(), content_type='application/json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertTrue(await Wallet.objects.filter(user__email='test@example.com').aexists())
+
+        response = await self.client.post('/api/auth/login/', {'email': 'test@example.com', 'password': 'wrong'},
+                                          content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = await self.client.post('/api/auth/login/', {'email': 'test@example.com', 'password': 'Passw0rd!'},
+                                          content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        headers = {'Authorization': f"Bearer {response.json()['access']}"}
+
+        self.assertEqual((await self.client.get('/api/profile/')).status_code, 401)
+        response = await self.client.get('/api/profile/', headers=headers)
+        self.assertEqual(response.json()['data']['name'], 'Test User')
+        etag = response['ETag']
+        response = await self.client.get('/api/profile/', headers={**headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        response = await self.client.patch('/api/profile/edit/', {'name': 'Renamed'},
+                                           content_type='application/json', headers=headers)
+        self.assertEqual(response.json()['data']['name'], 'Renamed')
+        response = await self.client.get('/api/profile/', headers={**headers, 'If-None-Match': etag})
+        self.assertEqual((response.status_code, response.json()['data']['name']), (200, 'Renamed'))
+
+    async def test_upload_and_delete_go_through_the_image_client(self):
+        from .image_client import get_client
+
+        user = await User.objects.acreate(username='a@example.com', email='a@example.com', name='A')
+        await Wallet.objects.acreate(user=user)
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+        uploads = get_client().latency.snapshot().get('upload', {}).get('calls', 0)
+
+        with mock.patch('accounts.images.abuild_variants', return_value=[(64, 'webp', b'v')]):
+            response = await self.client.post('/api/upload-image/', {'profile_image': png_upload()}, headers=headers)
+        self.assertEqual(response.status_code, 200, response.content)
+        await user.arefresh_from_db()
+        self.assertEqual(response.json()['data']['cloudinary_url'], user.cloudinary_url)
+        variant = user.profile_image_variants['64']['webp']['public_id']
+        self.assertEqual(set(self.host.assets), {user.cloudinary_public_id, variant})
+        self.assertEqual(get_client().latency.snapshot()['upload']['calls'], uploads + 2)
+
+        with mock.patch('accounts.images.delete_later') as delete_later:
+            response = await self.client.delete(f'/api/delete-image/{user.pk}/', headers=headers)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(sorted(delete_later.call_args.args[0]), sorted([user.cloudinary_public_id, variant]))
+        await user.arefresh_from_db()
+        self.assertIsNone(user.cloudinary_public_id)
+
+
+class RegistrationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        throttling.reset()
+
+    def test_sign_up_creates_user_and_wallet_without_precheck_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = APIClient().post('/api/auth/sign-up/', signup_payload(), format='json')
+
+        self.assertEqual(response.status_code, 201)
+        user = User.objects.get(email='test@example.com')
+        self.assertEqual(Wallet.objects.get(user=user).balance, 0)
+        statements = [q['sql'].split()[0].upper() for q in queries.captured_queries]
+        self.assertNotIn('SELECT', statements)
+        # User, wallet and the user's search tokens.
+        self.assertEqual(statements.count('INSERT'), 3)
+
+    def test_duplicate_email_is_reported_as_field_error(self):
+        APIClient().post('/api/auth/sign-up/', signup_payload(), format='json')
+
+        serializer = RegisterSerializer(data=signup_payload(email='TEST@example.com', phone=''))
+        self.assertTrue(serializer.is_valid())
+        with self.assertRaises(serializers.ValidationError) as ctx:
+            serializer.save()
+        self.assertEqual(ctx.exception.detail, {'email': ['Email already registered.']})
+
+    def test_duplicate_phone_is_reported_as_field_error(self):
+        APIClient().post('/api/auth/sign-up/', signup_payload(), format='json')
+
+        serializer = RegisterSerializer(data=signup_payload(email='other@example.com'))
+        self.assertTrue(serializer.is_valid())
+        with self.assertRaises(serializers.ValidationError) as ctx:
+            serializer.save()
+        self.assertEqual(ctx.exception.detail, {'phone': ['Phone number already exists.']})
+
+    def test_unique_violations_are_matched_by_constraint_name(self):
+        email = IntegrityError(
+            'duplicate key value violates unique constraint "accounts_user_email_key"\n'
+            'DETAIL:  Key (email)=(phone@example.com) already exists.'
+        )
+        phone = IntegrityError('duplicate key value violates unique constraint "accounts_user_phone_unique"')
+        self.assertEqual(unique_violation_detail(email), {'email': ['Email already registered.']})
+        self.assertEqual(unique_violation_detail(phone), {'phone': ['Phone number already exists.']})
+        with self.assertRaises(IntegrityError):
+            unique_violation_detail(IntegrityError('NOT NULL constraint failed: accounts_user.name'))
+
+    def test_user_keeps_abstract_user_meta(self):
+        self.assertEqual(User._meta.verbose_name, 'user')
+        self.assertEqual(User._meta.verbose_name_plural, 'users')
+
+    def test_blank_phones_do_not_conflict(self):
+        for email in ('one@example.com', 'two@example.com'):
+            response = APIClient().post('/api/auth/sign-up/', signup_payload(email=email, phone=''), format='json')
+            self.assertEqual(response.status_code, 201)
+
+    def test_concurrent_sign_ups_with_same_email(self):
+        # Both requests pass validation before either writes, which is the
+        # interleaving the old exists() checks could not handle.
+        first = RegisterSerializer(data=signup_payload())
+        second = RegisterSerializer(data=signup_payload(phone='+19876543210'))
+        self.assertTrue(first.is_valid())
+        self.assertTrue(second.is_valid())
+
+        first.save()
+        with self.assertRaises(serializers.ValidationError) as ctx:
+            second.save()
+
+        self.assertEqual(ctx.exception.detail, {'email': ['Email already registered.']})
+        self.assertEqual(User.objects.count(), 1)
+        self.assertEqual(Wallet.objects.count(), 1)
+
+    def test_wallet_failure_rolls_back_user(self):
+        with mock.patch.object(Wallet.objects, 'create', side_effect=RuntimeError('boom')):
+            serializer = RegisterSerializer(data=signup_payload())
+            serializer.is_valid(raise_exception=True)
+            with self.assertRaises(RuntimeError):
+                serializer.save()
+
+        self.assertFalse(User.objects.exists())
+
+
+class ConcurrentRegistrationTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        throttling.reset()
+
+    def test_parallel_sign_ups_create_exactly_one_user(self):
+        barrier = threading.Barrier(4)
+        responses = []
+
+        def sign_up(index):
+            try:
+                barrier.wait()
+                responses.append(APIClient().post(
+                    '/api/auth/sign-up/', signup_payload(phone=f'+1555000000{index}'), format='json'
+                ))
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=sign_up, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(r.status_code for r in responses), [201, 400, 400, 400])
+        self.assertEqual(User.objects.count(), 1)
+        self.assertEqual(Wallet.objects.count(), 1)
+
+
+class WalletLedgerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='w@example.com', email='w@example.com', name='W', password='x')
+        self.wallet = Wallet.objects.create(user=self.user, balance=0)
+
+    def test_credit_is_applied_once_per_idempotency_key(self):
+        self.assertIsNotNone(credit(self.user, 3, 'reward', 'reward:1'))
+        self.assertIsNone(credit(self.user, 3, 'reward', 'reward:1'))
+
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, 3)
+        self.assertEqual(WalletTransaction.objects.count(), 1)
+
+    def test_credit_updates_balance_without_reading_it(self):
+        stale = Wallet.objects.get(pk=self.wallet.pk)
+        credit(self.user, 5, 'reward', 'reward:a')
+        credit(self.user, 7, 'reward', 'reward:b')
+        stale.refresh_from_db()
+        self.assertEqual(stale.balance, 12)
+
+    def test_snapshot_keeps_recomputed_balance_consistent(self):
+        credit(self.user, 5, 'reward', 'reward:a')
+        credit(self.user, -2, 'spend', 'spend:a')
+
+        wallet, drift = take_snapshot(self.wallet.pk, settle_seconds=0)
+        self.assertEqual(drift, 0)
+        self.assertEqual(wallet.snapshot_balance, 3)
+
+        credit(self.user, 4, 'reward', 'reward:b')
+        wallet.refresh_from_db()
+        with self.assertNumQueries(1):
+            self.assertEqual(recompute_balance(wallet), 7)
+
+    def test_snapshot_repairs_drifted_balance(self):
+        credit(self.user, 5, 'reward', 'reward:a')
+        Wallet.objects.filter(pk=self.wallet.pk).update(balance=50)
+
+        wallet, drift = take_snapshot(self.wallet.pk, settle_seconds=0, repair=True)
+        self.assertEqual(drift, 45)
+        wallet.refresh_from_db()
+        self.assertEqual(wallet.balance, 5)
+
+
+class WalletAPITests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='w@example.com', email='w@example.com', name='W', password='x')
+        Wallet.objects.create(user=self.user, balance=0)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_unchanged_wallet_returns_304(self):
+        response = self.client.get('/api/wallet/')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/wallet/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        credit(self.user, 3, 'reward', 'reward:1')
+        response = self.client.get('/api/wallet/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['data']['balance'], 3)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_cached_body_skips_wallet_load(self):
+        self.client.get('/api/wallet/')
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/wallet/')
+        self.assertEqual(response.data['data']['email'], 'w@example.com')
+
+    def test_transactions_are_cursor_paginated(self):
+        for i in range(3):
+            credit(self.user, 1, 'reward', f'reward:{i}')
+        response = self.client.get('/api/wallet/transactions/')
+        self.assertEqual(response.status_code, 200)
+        results = response.data['data']['results']
+        self.assertEqual([entry['id'] for entry in results], sorted((entry['id'] for entry in results), reverse=True))
+        self.assertEqual(len(results), 3)
+
+
+class ProfileConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='p@example.com', email='p@example.com', name='P', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_matching_etag_skips_serializer(self):
+        etag = self.client.get('/api/profile/')['ETag']
+        with mock.patch.object(UserSerializer, 'to_representation') as to_representation:
+            response = self.client.get('/api/profile/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        to_representation.assert_not_called()
+
+    def test_profile_edit_changes_etag(self):
+        etag = self.client.get('/api/profile/')['ETag']
+        self.client.patch('/api/profile/edit/', {'name': 'New Name'}, format='json')
+        self.user.refresh_from_db()
+        self.client.force_authenticate(self.user)
+
+        response = self.client.get('/api/profile/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['data']['name'], 'New Name')
+
+    def test_non_profile_saves_keep_version(self):
+        version = self.user.profile_version
+        self.user.save(update_fields=['last_login'])
+        self.assertEqual(self.user.profile_version, version)
+
+
+class TokenRevocationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        throttling.reset()
+        revocation_store.clear()
+        self.user = User.objects.create_user(username='r@example.com', email='r@example.com', name='R', password='Passw0rd!')
+        self.client = APIClient()
+
+    def login(self):
+        response = self.client.post('/api/auth/login/', {'email': 'r@example.com', 'password': 'Passw0rd!'}, format='json')
+        return response.data['access'], response.data['refresh']
+
+    def get_profile(self, access):
+        return self.client.get('/api/profile/', HTTP_AUTHORIZATION=f'Bearer {access}')
+
+    def test_revocation_check_runs_without_queries(self):
+        access, _ = self.login()
+        self.get_profile(access)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_profile(access).status_code, 200)
+
+    def test_logout_revokes_access_and_refresh_tokens(self):
+        access, refresh = self.login()
+        response = self.client.post('/api/auth/logout/', {'refresh': refresh}, format='json',
+                                    HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_profile(access).status_code, 401)
+        self.assertEqual(self.client.post('/api/auth/refresh-token/', {'refresh': refresh}, format='json').status_code, 401)
+
+    def test_logout_all_revokes_every_session(self):
+        first, _ = self.login()
+        second, _ = self.login()
+        self.client.post('/api/auth/logout-all/', HTTP_AUTHORIZATION=f'Bearer {first}')
+        self.assertEqual(self.get_profile(second).status_code, 401)
+
+    def test_refresh_reuse_revokes_rotated_tokens(self):
+        _, refresh = self.login()
+        response = self.client.post('/api/auth/refresh-token/', {'refresh': refresh}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        new_access = response.data['access']
+        self.assertEqual(self.get_profile(new_access).status_code, 200)
+
+        response = self.client.post('/api/auth/refresh-token/', {'refresh': refresh}, format='json')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.get_profile(new_access).status_code, 401)
+
+    def test_other_workers_pick_up_revocations_from_cache(self):
+        access, _ = self.login()
+        other = RevocationStore(sync_interval=0)
+        other.sync()
+        payload = AccessToken(access).payload
+        self.assertFalse(other.is_revoked(payload))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            revocation_store.revoke_token(AccessToken(access))
+        with self.assertNumQueries(0):
+            other.sync()
+        self.assertTrue(other.is_revoked(payload))
+
+    def test_login_right_after_logout_all_is_not_revoked(self):
+        old, _ = self.login()
+        self.client.post('/api/auth/logout-all/', HTTP_AUTHORIZATION=f'Bearer {old}')
+        new, _ = self.login()
+        self.assertEqual(self.get_profile(old).status_code, 401)
+        self.assertEqual(self.get_profile(new).status_code, 200)
+
+    def test_filter_hits_are_confirmed_in_the_database(self):
+        store = RevocationStore(sync_interval=0, filter_capacity=10)
+        access = AccessToken(self.login()[0])
+        store.revoke_token(access)
+        self.assertTrue(store.is_token_revoked(access['jti']))
+        with mock.patch.object(BloomFilter, '__contains__', return_value=True), self.assertNumQueries(1):
+            self.assertFalse(store.is_token_revoked('never-revoked'))
+        with self.assertNumQueries(0):
+            self.assertFalse(store.is_token_revoked('never-revoked'))
+
+    def test_filters_grow_and_expire_by_day(self):
+        store = RevocationStore(sync_interval=0, filter_capacity=10)
+        now = time.time()
+        jtis = [f'jti-{i}' for i in range(25)]
+        for jti in jtis:
+            store._apply('token', jti, None, now + 60)
+        self.assertTrue(all(store.might_be_revoked(jti) for jti in jtis))
+        self.assertEqual(sum(len(filters) for filters in store._tokens.values()), 3)
+
+        store._apply('token', 'old', None, now - FILTER_BUCKET_SECONDS * 2)
+        self.assertFalse(store.might_be_revoked('old'))
+        self.assertEqual(len(store._tokens), 1)
+
+    def test_expired_rows_are_swept_periodically_not_per_revocation(self):
+        def expired_row(jti):
+            return RevokedToken.objects.create(jti=jti, expires_at=timezone.now() - timedelta(seconds=1))
+
+        expired_row('expired-1')
+        revocation_store.revoke_token(AccessToken(self.login()[0]))
+        self.assertTrue(RevokedToken.objects.filter(jti='expired-1').exists())
+
+        revocation_store.sweep()
+        self.assertFalse(RevokedToken.objects.filter(jti='expired-1').exists())
+        expired_row('expired-2')
+        RevocationStore().sweep()
+        self.assertTrue(RevokedToken.objects.filter(jti='expired-2').exists())
+
+
+def pem_private_key(algorithm='ES256'):
+    return generate_private_key(algorithm).private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+    )
+
+
+def pem_public_key(private_pem):
+    private_key = serialization.load_pem_private_key(private_pem, password=None)
+    return private_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo,
+    )
+
+
+class AsymmetricJWTTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        throttling.reset()
+        revocation_store.clear()
+        self.old_pem = pem_private_key()
+        self.new_pem = pem_private_key()
+        self.keyring = KeyRing('ES256', {'k1': pem_public_key(self.old_pem), 'k2': self.new_pem})
+
+    def test_rotated_keys_keep_verifying_old_tokens(self):
+        old_backend = KeyRingTokenBackend(KeyRing('ES256', {'k1': self.old_pem}))
+        backend = KeyRingTokenBackend(self.keyring)
+        old_token = old_backend.encode({'user_id': 1})
+
+        self.assertEqual(backend.decode(old_token)['user_id'], 1)
+        new_token = backend.encode({'user_id': 2})
+        self.assertEqual(jwt.get_unverified_header(new_token)['kid'], 'k2')
+        with self.assertRaises(TokenBackendError):
+            old_backend.decode(new_token)
+
+    def test_login_and_downstream_verification_with_jwks(self):
+        User.objects.create_user(username='k@example.com', email='k@example.com', name='K', password='Passw0rd!')
+        client = APIClient()
+        with mock.patch('rest_framework_simplejwt.state.token_backend', KeyRingTokenBackend(self.keyring)):
+            access = client.post('/api/auth/login/', {'email': 'k@example.com', 'password': 'Passw0rd!'},
+                                 format='json').data['access']
+            response = client.get('/api/profile/', HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(response.status_code, 200)
+
+        verifier = JWKSVerifier(jwks=self.keyring.jwks(), algorithms=['ES256'])
+        self.assertEqual(verifier.verify(access)['email'], 'k@example.com')
+        with self.assertRaises(jwt.InvalidTokenError):
+            JWKSVerifier(jwks={'keys': []}).verify(access)
+
+    def test_jwks_endpoint_is_publicly_cacheable(self):
+        response = self.client.get('/.well-known/jwks.json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('max-age=', response['Cache-Control'])
+
+        response = self.client.get('/.well-known/jwks.json', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+
+    def test_generated_keys_are_private_to_the_owner(self):
+        keys_dir = os.path.join(tempfile.mkdtemp(), 'jwt_keys')
+        self.addCleanup(shutil.rmtree, os.path.dirname(keys_dir))
+        with override_settings(JWT_KEYS_DIR=keys_dir):
+            call_command('generate_jwt_key', '--algorithm', 'ES256', '--kid', 'k3', stdout=io.StringIO())
+            call_command('generate_jwt_key', '--retire', 'k3', stdout=io.StringIO())
+
+        self.assertEqual(os.stat(keys_dir).st_mode & 0o777, 0o700)
+        self.assertEqual(os.stat(os.path.join(keys_dir, 'k3.pem')).st_mode & 0o777, 0o600)
+
+class RateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        throttling.reset()
+        User.objects.create_user(username='l@example.com', email='l@example.com', name='L', password='Passw0rd!')
+
+    @override_settings(LOGIN_RATE_LIMIT_EMAIL=2)
+    def test_login_flood_is_rejected_before_password_check(self):
+        client = APIClient()
+        with mock.patch.object(CustomTokenObtainPairSerializer, 'validate', side_effect=serializers.ValidationError('bad')) as validate:
+            responses = [
+                client.post('/api/auth/login/', {'email': 'L@example.com ', 'password': 'wrong'}, format='json')
+                for _ in range(4)
+            ]
+        self.assertEqual([r.status_code for r in responses], [400, 400, 429, 429])
+        self.assertEqual(validate.call_count, 2)
+        self.assertGreater(int(responses[-1]['Retry-After']), 0)
+
+        stats = throttling.stats()
+        self.assertEqual(stats['scopes']['login'], {'allowed': 2, 'rejected': 2})
+        self.assertGreater(stats['hash_cpu_seconds_avoided'], 0)
+
+    @override_settings(SIGNUP_RATE_LIMIT_IP=1)
+    def test_sign_up_is_limited_per_ip(self):
+        client = APIClient()
+        self.assertEqual(client.post('/api/auth/sign-up/', signup_payload(), format='json').status_code, 201)
+        response = client.post('/api/auth/sign-up/', signup_payload(email='other@example.com', phone=''), format='json')
+        self.assertEqual(response.status_code, 429)
+        response = client.post('/api/auth/sign-up/', signup_payload(email='other@example.com', phone=''), format='json',
+                               REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 201)
+
+    @override_settings(LOGIN_RATE_LIMIT_IP=2)
+    def test_rotating_forwarded_for_does_not_reset_the_ip_limit(self):
+        client = APIClient()
+
+        def attempt(index, **headers):
+            return client.post('/api/auth/login/', {'email': f'x{index}@example.com', 'password': 'wrong'},
+                               format='json', **headers).status_code
+
+        statuses = [attempt(i, HTTP_X_FORWARDED_FOR=f'198.51.100.{i}') for i in range(4)]
+        self.assertEqual(statuses, [400, 400, 429, 429])
+
+        # Behind one trusted proxy, the address it appended is the client's.
+        throttling.reset()
+        cache.clear()
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1}):
+            statuses = [attempt(i, HTTP_X_FORWARDED_FOR=f'203.0.113.9, 198.51.100.{i}') for i in range(4)]
+        self.assertEqual(statuses, [400, 400, 400, 400])
+
+    def test_sliding_window_weights_previous_window(self):
+        limiter = throttling.SlidingWindowLimiter('test', limit=4, window=60)
+        with mock.patch('accounts.throttling.time.time', return_value=6000.0):
+            for _ in range(4):
+                self.assertEqual(limiter.hit('a'), 0)
+        # Half-way into the next window the previous 4 still count as 2.
+        with mock.patch('accounts.throttling.time.time', return_value=6090.0):
+            self.assertEqual(limiter.hit('a'), 0)
+            self.assertEqual(limiter.hit('a'), 0)
+            self.assertGreater(limiter.hit('a'), 0)
+
+    @mock.patch('accounts.throttling.MAX_LOCAL_BLOCKS', 10)
+    def test_full_block_table_evicts_expired_then_oldest(self):
+        with mock.patch('accounts.throttling.time.time', return_value=1000.0):
+            throttling._blocked.update({f'short:{i}': 1001.0 for i in range(5)})
+            throttling._blocked.update({f'long:{i}': 5000.0 for i in range(5)})
+            limiter = throttling.SlidingWindowLimiter('test', limit=1, window=3600)
+            limiter.hit('a')
+            limiter.hit('a')
+        with mock.patch('accounts.throttling.time.time', return_value=2000.0):
+            limiter.hit('b')
+            limiter.hit('b')
+
+        # short:0 went first, as the oldest; the other short blocks once expired.
+        self.assertEqual(sorted(throttling._blocked), sorted([f'long:{i}' for i in range(5)] + ['test:a', 'test:b']))
+
+        with mock.patch('accounts.throttling.time.time', return_value=2000.0):
+            for ident in 'cdef':
+                limiter.hit(ident)
+                limiter.hit(ident)
+        self.assertEqual(len(throttling._blocked), 10)
+        self.assertNotIn('long:0', throttling._blocked)
+        self.assertIn('test:f', throttling._blocked)
+
+
+class AdminChangelistTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin@example.com', email='admin@example.com',
+                                                   name='Admin', password='x')
+        self.client.force_login(self.admin)
+
+    def add_wallets(self, count):
+        for _ in range(count):
+            index = User.objects.count()
+            user = User.objects.create_user(username=f'u{index}@example.com', email=f'u{index}@example.com', name='U')
+            Wallet.objects.create(user=user)
+
+    def changelist_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in queries]
+
+    def test_changelists_use_constant_number_of_queries(self):
+        for url in ('/admin/accounts/wallet/', '/admin/accounts/user/'):
+            self.add_wallets(2)
+            few = len(self.changelist_queries(url))
+            self.add_wallets(8)
+            self.assertEqual(len(self.changelist_queries(url)), few, url)
+
+    @override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=1)
+    def test_large_tables_are_not_counted(self):
+        self.add_wallets(3)
+        for url in ('/admin/accounts/wallet/', '/admin/accounts/user/'):
+            queries = self.changelist_queries(url)
+            self.assertFalse([sql for sql in queries if 'COUNT(' in sql.upper()], url)
+
+
+    def test_wallet_balance_is_read_only(self):
+        self.add_wallets(1)
+        wallet = Wallet.objects.get()
+        response = self.client.post(f'/admin/accounts/wallet/{wallet.pk}/change/', {
+            'user': wallet.user_id, 'balance': 500, 'currency': 'Gems', 'snapshot_balance': 500,
+        })
+        self.assertEqual(response.status_code, 302)
+        wallet.refresh_from_db()
+        self.assertEqual((wallet.balance, wallet.snapshot_balance), (0, 0))
+
+    def test_adjust_balance_action_writes_ledger_once(self):
+        self.add_wallets(2)
+        data = {
+            'action': 'adjust_balance', 'amount': 7, 'adjustment_id': 'abc',
+            '_selected_action': list(Wallet.objects.values_list('pk', flat=True)),
+        }
+        for _ in range(2):
+            response = self.client.post('/admin/accounts/wallet/', data)
+            self.assertEqual(response.status_code, 302)
+
+        self.assertEqual(sorted(Wallet.objects.values_list('balance', flat=True)), [7, 7])
+        self.assertEqual(WalletTransaction.objects.filter(reason='admin_adjustment').count(), 2)
+        for wallet in Wallet.objects.all():
+            self.assertEqual(recompute_balance(wallet), 7)
+
+
+class UserSearchTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice.smith@example.com', email='alice.smith@example.com',
+                                              name='Alice Smith', phone='+1 202 555 0123', password='x')
+        self.bob = User.objects.create_user(username='bob@corp.io', email='bob@corp.io', name='Bob Jones', password='x')
+        self.staff = User.objects.create_user(username='staff@example.com', email='staff@example.com', name='Staff',
+                                              password='x', is_staff=True)
+
+    def test_prefix_terms_match_names_emails_and_phone_digits(self):
+        self.assertEqual(list(search_users('ali')), [self.alice])
+        self.assertEqual(list(search_users('smi')), [self.alice])
+        self.assertEqual(list(search_users('corp.io')), [self.bob])
+        self.assertEqual(list(search_users('202-555')), [self.alice])
+        self.assertEqual(list(search_users('alice jones')), [])
+
+    def test_tokens_follow_profile_edits(self):
+        self.bob.name = 'Robert Jones'
+        self.bob.save(update_fields=['name'])
+        self.assertEqual(list(search_users('robert')), [self.bob])
+        self.assertEqual(list(search_users('bob jones')), [self.bob])
+        self.assertEqual(UserSearchToken.objects.filter(user=self.bob, token='robert').count(), 1)
+
+    def assert_only_tokens_are_matched(self, queries):
+        # Prefix LIKEs on the indexed token column only, never on user columns.
+        sql = ' '.join(query['sql'] for query in queries)
+        self.assertEqual(len(re.findall(r' LIKE ', sql, re.IGNORECASE)),
+                         len(re.findall(r'U\d+\."token" LIKE ', sql, re.IGNORECASE)))
+
+    def test_search_uses_token_index_not_user_scans(self):
+        with CaptureQueriesContext(connection) as queries:
+            list(search_users('alice'))
+        self.assert_only_tokens_are_matched(queries.captured_queries)
+
+    def test_like_wildcards_in_terms_match_literally(self):
+        underscored = User.objects.create_user(username='al_x@example.com', email='al_x@example.com', name='X',
+                                               password='x')
+        User.objects.create_user(username='alyx@example.com', email='alyx@example.com', name='Y', password='x')
+        self.assertEqual(list(search_users('al_x@')), [underscored])
+        self.assertEqual(list(search_users('al%x@')), [])
+
+    def test_api_is_staff_only_and_paginated(self):
+        client = APIClient()
+        client.force_authenticate(self.bob)
+        self.assertEqual(client.get('/api/users/search/', {'q': 'alice'}).status_code, 403)
+
+        client.force_authenticate(self.staff)
+        response = client.get('/api/users/search/', {'q': 'example.com', 'page_size': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['data']['count'], 2)
+        self.assertEqual(len(response.data['data']['results']), 1)
+        self.assertIsNotNone(response.data['data']['next'])
+
+    def test_admin_search_uses_index(self):
+        self.client.force_login(User.objects.create_superuser(username='root@example.com', email='root@example.com',
+                                                              name='Root', password='x'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/accounts/user/', {'q': 'bob'})
+        self.assertContains(response, 'bob@corp.io')
+        self.assertNotContains(response, 'alice.smith@example.com')
+        self.assert_only_tokens_are_matched(queries.captured_queries)
+
+
+class ReconcileMediaTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        os.makedirs(os.path.join(self.media_root, 'profiles'))
+        self.host = LocalImageHost(page_size=2)
+        patcher = mock.patch('accounts.image_host._host', self.host)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        patcher = mock.patch('accounts.management.commands.reconcile_media.delete_later')
+        self.delete_later = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        old = timezone.now() - timedelta(days=1)
+        for name in ('kept.jpg', 'orphan.jpg', 'reupload.jpg'):
+            path = os.path.join(self.media_root, 'profiles', name)
+            with open(path, 'wb') as f:
+                f.write(b'jpeg')
+            os.utime(path, (old.timestamp(), old.timestamp()))
+        for public_id in ('user_profiles/kept', 'user_profiles/orphan', 'user_profiles/variants/orphan'):
+            self.host.add(public_id, created_at=old)
+
+        self.kept = self.make_user('kept', profile_image='profiles/kept.jpg', cloudinary_public_id='user_profiles/kept')
+        self.reupload = self.make_user('reupload', profile_image='profiles/reupload.jpg',
+                                       cloudinary_public_id='user_profiles/gone')
+        self.cleared = self.make_user('cleared', cloudinary_public_id='user_profiles/gone-too')
+        User.objects.update(profile_updated_at=old)
+
+    def make_user(self, name, **fields):
+        return User.objects.create_user(username=f'{name}@example.com', email=f'{name}@example.com', name=name,
+                                        cloudinary_url=f'https://images.invalid/{name}', **fields)
+
+    def reconcile(self, *args):
+        out = io.StringIO()
+        call_command('reconcile_media', '--workers', '1', *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_changes_nothing(self):
+        output = self.reconcile('--dry-run')
+        self.assertIn('local_orphans=1', output)
+        self.assertIn('remote_orphans=2', output)
+        self.assertIn('users_broken=2', output)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.media_root, 'profiles'))),
+                         ['kept.jpg', 'orphan.jpg', 'reupload.jpg'])
+        self.assertEqual(len(self.host.assets), 3)
+
+    def test_orphans_are_removed_and_broken_users_repaired(self):
+        self.reconcile()
+        self.assertEqual(sorted(os.listdir(os.path.join(self.media_root, 'profiles'))), ['kept.jpg', 'reupload.jpg'])
+        self.assertNotIn('user_profiles/orphan', self.host.assets)
+        self.assertNotIn('user_profiles/variants/orphan', self.host.assets)
+        self.assertIn('user_profiles/kept', self.host.assets)
+
+        self.reupload.refresh_from_db()
+        self.assertIn(self.reupload.cloudinary_public_id, self.host.assets)
+        self.cleared.refresh_from_db()
+        self.assertIsNone(self.cleared.cloudinary_public_id)
+        self.assertIsNone(self.cleared.cloudinary_url)
+
+    def test_dedupe_records_follow_the_host(self):
+        old = timezone.now() - timedelta(days=1)
+        self.host.add('user_profiles/variants/kept-64', created_at=old)
+        ImageAsset.objects.create(
+            content_hash=hashlib.sha256(b'jpeg').hexdigest(), public_id='user_profiles/kept',
+            url='https://images.invalid/kept',
+            variants={'64': {'webp': {'url': '', 'public_id': 'user_profiles/variants/kept-64'}}},
+        )
+        ImageAsset.objects.create(content_hash='0' * 64, public_id='user_profiles/gone', url='https://images.invalid/gone')
+        ImageAsset.objects.update(created_at=old)
+
+        output = self.reconcile()
+        self.assertIn('assets_gone=1', output)
+        self.assertIn('users_retargeted=1', output)
+        # Only the dedupe record references this variant, and it is kept.
+        self.assertIn('user_profiles/variants/kept-64', self.host.assets)
+        self.assertEqual(list(ImageAsset.objects.values_list('public_id', 'ref_count')), [('user_profiles/kept', 2)])
+        self.reupload.refresh_from_db()
+        self.assertEqual(self.reupload.cloudinary_public_id, 'user_profiles/kept')
+        self.delete_later.assert_any_call(['user_profiles/gone'])
+
+    def test_resumes_from_checkpoint(self):
+        checkpoint = os.path.join(self.media_root, 'checkpoint.json')
+        with open(checkpoint, 'w') as f:
+            json.dump({'local_done': True, 'remote_done': True, 'users_last_id': self.reupload.pk}, f)
+        output = self.reconcile('--checkpoint', checkpoint)
+        self.assertIn('users_checked=1', output)
+        self.assertNotIn('local_scanned', output)
+        self.assertFalse(os.path.exists(checkpoint))
+
+    def test_dry_run_leaves_checkpoint_alone(self):
+        checkpoint = os.path.join(self.media_root, 'checkpoint.json')
+        output = self.reconcile('--dry-run', '--checkpoint', checkpoint)
+        self.assertIn('users_broken=2', output)
+        self.assertFalse(os.path.exists(checkpoint))
+
+        state = {'local_done': True, 'remote_done': True, 'users_last_id': self.reupload.pk}
+        with open(checkpoint, 'w') as f:
+            json.dump(state, f)
+        output = self.reconcile('--dry-run', '--checkpoint', checkpoint)
+        self.assertIn('users_checked=1', output)
+        with open(checkpoint) as f:
+            self.assertEqual(json.load(f), state)
+
+
+@override_settings(PROFILE_IMAGE_STORAGE='direct', PROFILE_IMAGE_UPLOAD_MODE='sync', FILE_UPLOAD_MAX_MEMORY_SIZE=0)
+class DirectUploadTests(TestCase):
+    def test_upload_is_streamed_and_variants_read_the_spooled_file(self):
+        host = LocalImageHost()
+        user = User.objects.create_user(username='d@example.com', email='d@example.com', name='D')
+        api = APIClient()
+        api.force_authenticate(user)
+        with mock.patch('accounts.image_host._host', host), \
+                mock.patch.object(host, 'upload', wraps=host.upload) as upload, \
+                mock.patch('accounts.images.build_variants', return_value=[]) as build_variants:
+            response = api.post('/api/upload-image/', {'profile_image': png_upload()}, format='multipart')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTrue(hasattr(upload.call_args.args[0], 'read'))
+        source = build_variants.call_args.args[0]
+        self.assertIsInstance(source, str)
+        self.assertTrue(source.startswith(tempfile.gettempdir()))
+        user.refresh_from_db()
+        self.assertFalse(user.profile_image)
+        self.assertEqual(list(host.assets), [user.cloudinary_public_id])
+
+
+    def test_variant_failures_do_not_fail_the_upload(self):
+        from cloudinary.exceptions import BadRequest
+
+        host = LocalImageHost()
+        upload = host.upload
+
+        def flaky_upload(data, folder='', **options):
+            if options.get('filename') == '64.jpeg':
+                raise BadRequest('bad variant')
+            return upload(data, folder=folder, **options)
+
+        user = User.objects.create_user(username='v@example.com', email='v@example.com', name='V')
+        api = APIClient()
+        api.force_authenticate(user)
+        variants = [(256, 'webp', b'a'), (64, 'webp', b'b'), (64, 'jpeg', b'c')]
+        with mock.patch('accounts.image_host._host', host), \
+                mock.patch.object(host, 'upload', side_effect=flaky_upload), \
+                mock.patch('accounts.images.build_variants', return_value=variants), \
+                mock.patch('accounts.images.delete_later') as delete_later, \
+                self.assertLogs('accounts.images', 'ERROR'):
+            response = api.post('/api/upload-image/', {'profile_image': png_upload()}, format='multipart')
+        self.assertEqual(response.status_code, 200, response.content)
+        user.refresh_from_db()
+        self.assertTrue(user.cloudinary_url)
+        self.assertEqual(user.profile_image_variants, {})
+        # The variants that did upload are not left behind on the host.
+        deleted = [public_id for c in delete_later.call_args_list for public_id in c.args[0]]
+        self.assertEqual(sorted(deleted), sorted(set(host.assets) - {user.cloudinary_public_id}))
+        self.assertEqual(len(deleted), 2)
+
+
+class AsyncCloudinaryClientTests(SimpleTestCase):
+    async def serve(self, responses, keep_open=True):
+        """A local HTTP host answering with ``responses`` in order; returns its URL and accepted connections."""
+        connections = []
+
+        async def handle(reader, writer):
+            connections.append(writer)
+            while responses:
+                head = await reader.readuntil(b'\r\n\r\n')
+                await reader.readexactly(int(re.search(rb'Content-Length: (\d+)', head).group(1)))
+                status, body = responses.pop(0)
+                writer.write(f'HTTP/1.1 {status} X\r\nContent-Length: {len(body)}\r\n\r\n'.encode() + body)
+                await writer.drain()
+                if not keep_open:
+                    break
+            writer.close()
+
+        server = await asyncio.start_server(handle, '127.0.0.1', 0)
+        self.addCleanup(server.close)
+        return f'http://127.0.0.1:{server.sockets[0].getsockname()[1]}/v1_1/demo/image/upload', connections
+
+    async def call(self, url):
+        with mock.patch('accounts.aio_cloudinary.utils.sign_request', side_effect=lambda params, options: params), \
+                mock.patch('accounts.aio_cloudinary.utils.cloudinary_api_url', return_value=url):
+            return await aio_cloudinary.call_api('upload', {'public_id': 'a'}, file=('a.png', io.BytesIO(b'png')))
+
+    async def test_connections_are_kept_alive(self):
+        url, connections = await self.serve([(200, b'{"public_id": "a"}'), (200, b'{"public_id": "b"}')])
+        self.assertEqual((await self.call(url))['public_id'], 'a')
+        self.assertEqual((await self.call(url))['public_id'], 'b')
+        self.assertEqual(len(connections), 1)
+
+    async def test_connections_closed_by_the_host_are_replaced(self):
+        url, connections = await self.serve([(200, b'{"public_id": "a"}'), (200, b'{"public_id": "b"}')],
+                                            keep_open=False)
+        await self.call(url)
+        await asyncio.sleep(0.01)
+        self.assertEqual((await self.call(url))['public_id'], 'b')
+        self.assertEqual(len(connections), 2)
+
+    async def test_errors_use_the_sdk_exception_for_their_status(self):
+        from cloudinary import exceptions
+
+        body = b'{"error": {"message": "Invalid image file"}}'
+        url, _ = await self.serve([(400, body), (404, body), (500, body)])
+        for exception_class in (exceptions.BadRequest, exceptions.NotFound, exceptions.GeneralError):
+            with self.assertRaises(exception_class) as ctx:
+                await self.call(url)
+            self.assertIs(type(ctx.exception), exception_class)
+
+
+class ImageHostClientTests(TestCase):
+    def setUp(self):
+        self.host = LocalImageHost()
+        self.host_client = ImageHostClient(self.host, retries=2, backoff=0, backoff_max=0,
+                                      breaker=CircuitBreaker(threshold=3, reset_timeout=60))
+
+    def test_transient_failures_are_retried(self):
+        with mock.patch.object(self.host, 'existing', side_effect=[ConnectionError('reset'), {'a'}]) as existing:
+            self.assertEqual(self.host_client.existing(['a']), {'a'})
+        self.assertEqual(existing.call_count, 2)
+        self.assertEqual(self.host_client.latency.snapshot()['existing']['retries'], 1)
+
+    def test_retried_upload_reuses_its_public_id(self):
+        upload = self.host.upload
+        attempts = []
+
+        def flaky_upload(data, **options):
+            # The first attempt stores the asset but the response never arrives.
+            attempts.append(options['public_id'])
+            result = upload(data, **options)
+            if len(attempts) == 1:
+                raise TimeoutError('read timed out')
+            return result
+
+        with mock.patch.object(self.host, 'upload', side_effect=flaky_upload):
+            response = self.host_client.upload(b'png', folder='user_profiles')
+        self.assertEqual(len(set(attempts)), 1)
+        self.assertEqual(list(self.host.assets), [response['public_id']])
+
+    def test_retries_stop_at_the_retry_budget(self):
+        host_client = ImageHostClient(self.host, retries=5, backoff=10, backoff_max=10, retry_budget=1,
+                                      breaker=CircuitBreaker(threshold=10, reset_timeout=60))
+        with mock.patch.object(self.host, 'existing', side_effect=ConnectionError('reset')) as existing, \
+                mock.patch('accounts.image_client.time.sleep') as sleep, \
+                mock.patch('accounts.image_client.random.uniform', return_value=5):
+            with self.assertRaises(ConnectionError):
+                host_client.existing(['a'])
+        self.assertEqual(existing.call_count, 1)
+        sleep.assert_not_called()
+
+    def test_client_errors_are_not_retried(self):
+        from cloudinary.exceptions import NotFound
+
+        with mock.patch.object(self.host, 'delete', side_effect=NotFound('gone')) as delete:
+            with self.assertRaises(NotFound):
+                self.host_client.delete(['a'])
+        self.assertEqual(delete.call_count, 1)
+        self.assertEqual(self.host_client.breaker.state, 'closed')
+
+    def test_async_client_errors_are_not_retried(self):
+        from cloudinary.exceptions import BadRequest
+
+        host_client = ImageHostClient(CloudinaryHost(), retries=2, backoff=0, backoff_max=0,
+                                      breaker=CircuitBreaker(threshold=1, reset_timeout=60))
+        post = mock.AsyncMock(return_value=(400, b'{"error": {"message": "Invalid image file"}}'))
+        with mock.patch('accounts.aio_cloudinary._post', post), \
+                mock.patch('accounts.aio_cloudinary.utils.sign_request', side_effect=lambda params, options: params), \
+                mock.patch('accounts.aio_cloudinary.utils.cloudinary_api_url', return_value='https://images.invalid/upload'):
+            for _ in range(2):
+                with self.assertRaisesMessage(BadRequest, 'Invalid image file'):
+                    asyncio.run(host_client.acall('upload', b'png', public_id='a'))
+        self.assertEqual(post.await_count, 2)
+        self.assertEqual(host_client.latency.snapshot()['upload']['retries'], 0)
+        self.assertEqual(host_client.breaker.state, 'closed')
+
+    def test_breaker_opens_and_fails_fast(self):
+        with mock.patch.object(self.host, 'delete', side_effect=ConnectionError('down')) as delete:
+            with self.assertRaises(ConnectionError):
+                self.host_client.delete(['a'])
+            with self.assertRaises(CircuitOpen):
+                self.host_client.delete(['a'])
+        self.assertEqual(delete.call_count, 3)
+        self.assertEqual(self.host_client.breaker.state, 'open')
+
+    def test_delete_queue_can_be_created_before_the_client(self):
+        from . import image_client
+
+        with mock.patch.object(image_client, '_client', None), \
+                mock.patch.object(image_client, '_delete_queue', None), \
+                mock.patch('accounts.image_client.atexit.register'):
+            thread = threading.Thread(target=image_client.get_delete_queue, daemon=True)
+            thread.start()
+            thread.join(5)
+            self.assertFalse(thread.is_alive())
+            self.assertIs(image_client.get_delete_queue().client, image_client.get_client())
+
+    def test_deletes_are_batched_and_requeued_on_failure(self):
+        for public_id in 'abcde':
+            self.host.add(public_id)
+        queue = DeleteQueue(self.host_client, batch_size=2, interval=3600)
+        queue._ensure_thread = lambda: None
+        queue.put(['a', 'b', 'c'])
+        queue.put(['d', 'e'])
+        with mock.patch.object(self.host, 'delete', wraps=self.host.delete) as delete:
+            queue.flush()
+        self.assertEqual([c.args[0] for c in delete.call_args_list], [['a', 'b'], ['c', 'd'], ['e']])
+        self.assertEqual(self.host.assets, {})
+
+        queue.put(['x', 'y'])
+        with mock.patch.object(self.host_client, 'delete', side_effect=CircuitOpen('down')), \
+                self.assertLogs('accounts.image_client', 'WARNING'):
+            queue.flush()
+        self.assertEqual(queue.stats(), {'pending': 2, 'deleted': 5, 'dropped': 0})
+
+    def test_profile_image_delete_does_not_wait_for_the_host(self):
+        user = User.objects.create_user(username='pic@example.com', email='pic@example.com',
+                                        cloudinary_public_id='user_profiles/pic')
+        api = APIClient()
+        api.force_authenticate(user)
+        with mock.patch('accounts.images.delete_later') as delete_later, \
+                mock.patch('accounts.image_host.CloudinaryHost.delete') as remote_delete:
+            response = api.delete(f'/api/delete-image/{user.pk}/')
+        self.assertEqual(response.status_code, 200)
+        delete_later.assert_called_once_with(['user_profiles/pic'])
+        remote_delete.assert_not_called()
+
+
+@override_settings(PROFILE_IMAGE_STORAGE='direct', PROFILE_IMAGE_VARIANT_SIZES=[], PROFILE_IMAGE_UPLOAD_MODE='sync')
+class ImageDedupeTests(TestCase):
+    def setUp(self):
+        self.host = LocalImageHost()
+        patcher = mock.patch('accounts.image_host._host', self.host)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        image_dedupe.reset_stats()
+        self.users = [
+            User.objects.create_user(username=f'{name}@example.com', email=f'{name}@example.com', name=name)
+            for name in ('ann', 'bob')
+        ]
+
+    def upload(self, user, color):
+        api = APIClient()
+        api.force_authenticate(user)
+        response = api.post('/api/upload-image/', {'profile_image': png_upload(color)}, format='multipart')
+        self.assertEqual(response.status_code, 200, response.content)
+        user.refresh_from_db()
+
+    def delete(self, user):
+        api = APIClient()
+        api.force_authenticate(user)
+        with mock.patch('accounts.images.delete_later') as delete_later:
+            self.assertEqual(api.delete(f'/api/delete-image/{user.pk}/').status_code, 200)
+        return [public_id for c in delete_later.call_args_list for public_id in c.args[0]]
+
+    def test_identical_uploads_share_one_asset(self):
+        ann, bob = self.users
+        self.upload(ann, 'red')
+        self.upload(bob, 'red')
+        self.assertEqual(len(self.host.assets), 1)
+        self.assertEqual(ann.cloudinary_public_id, bob.cloudinary_public_id)
+        asset = ImageAsset.objects.get()
+        self.assertEqual((asset.ref_count, asset.reuse_count), (2, 1))
+        self.assertEqual(image_dedupe.stats()['hit_rate'], 0.5)
+
+        self.assertEqual(self.delete(ann), [])
+        self.assertEqual(self.delete(bob), [asset.public_id])
+        self.assertFalse(ImageAsset.objects.exists())
+
+    def test_reuploading_the_same_file_keeps_the_asset(self):
+        ann = self.users[0]
+        self.upload(ann, 'red')
+        public_id = ann.cloudinary_public_id
+        with mock.patch('accounts.images.delete_later') as delete_later:
+            self.upload(ann, 'red')
+            self.upload(ann, 'blue')
+        self.assertNotEqual(ann.cloudinary_public_id, public_id)
+        self.assertEqual(len(self.host.assets), 2)
+        self.assertEqual([c.args[0] for c in delete_later.call_args_list], [[], [public_id]])
+        self.assertFalse(ImageAsset.objects.filter(public_id=public_id).exists())
+
+    def test_admin_uploads_are_tracked(self):
+        from django.contrib import admin as django_admin
+
+        from .admin import CustomUserAdmin
+
+        ann = self.users[0]
+        self.upload(ann, 'red')
+        public_id = ann.cloudinary_public_id
+        image = png_upload('blue')
+        form = mock.Mock(changed_data=['profile_image'], cleaned_data={'profile_image': image},
+                         initial={'profile_image': ann.profile_image})
+        ann.profile_image = image
+        with mock.patch('accounts.images.delete_later') as delete_later:
+            CustomUserAdmin(User, django_admin.site).save_model(RequestFactory().post('/'), ann, form, True)
+        ann.refresh_from_db()
+        self.assertNotEqual(ann.cloudinary_public_id, public_id)
+        delete_later.assert_called_once_with([public_id])
+        self.assertEqual(list(ImageAsset.objects.values_list('public_id', 'ref_count')), [(ann.cloudinary_public_id, 1)])
+
+
+    @override_settings(PROFILE_IMAGE_VARIANT_SIZES=[64])
+    def test_uploads_without_variants_are_not_shared(self):
+        ann, bob = self.users
+        with mock.patch('accounts.images.build_variants', side_effect=VariantQueueFull('busy')), \
+                self.assertLogs('accounts.images', 'WARNING'):
+            self.upload(ann, 'red')
+        self.assertFalse(ImageAsset.objects.exists())
+
+        self.upload(bob, 'red')
+        self.assertNotEqual(ann.cloudinary_public_id, bob.cloudinary_public_id)
+        self.assertTrue(ImageAsset.objects.get().variants)
+
+class OpenAPISchemaTests(TestCase):
+    def setUp(self):
+        from server import swagger
+
+        self.swagger = swagger
+        self.schema_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.schema_dir)
+        settings_override = override_settings(OPENAPI_SCHEMA_DIR=self.schema_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        swagger.clear_schema_cache()
+        self.addCleanup(swagger.clear_schema_cache)
+
+    def test_schema_is_generated_once_and_served_gzipped(self):
+        with mock.patch.object(self.swagger, 'generate_schema', wraps=self.swagger.generate_schema) as generate:
+            response = self.client.get('/swagger.json', HTTP_ACCEPT_ENCODING='gzip')
+            self.client.get('/swagger.yaml')
+        self.assertEqual(generate.call_count, 1)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('max-age=86400', response['Cache-Control'])
+        self.assertIn('/auth/logout/', json.loads(gzip.decompress(response.content))['paths'])
+
+        cached = self.client.get('/swagger.json', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+    def test_prebuilt_schema_is_served_without_generation(self):
+        call_command('build_openapi', stdout=io.StringIO())
+        self.assertTrue(os.path.exists(os.path.join(self.schema_dir, 'swagger.json.gz')))
+        with mock.patch.object(self.swagger, 'generate_schema') as generate:
+            response = self.client.get('/swagger.json')
+        generate.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_ui_assets_are_local_and_immutable(self):
+        page = self.client.get('/swagger/').content.decode()
+        self.assertNotIn('unpkg.com', page)
+        asset = self.client.get(self.swagger.asset_url('swagger-ui-bundle.js'))
+        self.assertEqual(asset.status_code, 200)
+        self.assertIn('immutable', asset['Cache-Control'])
+        self.assertEqual(self.client.get('/swagger/assets/0.0/swagger-ui-bundle.js').status_code, 404)
+
+
+class WarmUpTests(TestCase):
+    def test_failing_steps_are_skipped(self):
+        from . import warmup
+
+        with mock.patch.dict(warmup.STEPS, {'broken': mock.Mock(side_effect=RuntimeError('boom'))}):
+            with self.assertLogs('accounts.warmup', 'ERROR'):
+                timings = warmup.warm_up(['urls', 'broken', 'jwt_keys'])
+        self.assertEqual(set(timings), {'urls', 'jwt_keys'})
+
+    def test_connections_opened_while_warming_are_closed(self):
+        from . import warmup
+
+        with mock.patch('django.db.connections.close_all') as close_all:
+            warmup.warm_up(['database', 'revocation'])
+        close_all.assert_called_once_with()
+
+    def test_image_sdk_is_not_loaded_at_startup(self):
+        code = 'import server.wsgi, sys; print(any(m.split(".")[0] in ("cloudinary", "PIL") for m in sys.modules))'
+        env = dict(os.environ, WARM_UP_ON_STARTUP='false', SECRET_KEY='x')
+        result = subprocess.run([sys.executable, '-c', code], cwd=settings.BASE_DIR, env=env,
+                                capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), 'False')
+
+
+@override_settings(DATABASE_REPLICA_ALIASES=['replica1'], DATABASE_REPLICA_PIN_SECONDS=5)
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.router = db_routing.ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def route(self, request, view=lambda: None):
+        """Run ``view`` inside the middleware; returns where a read after it goes, and the response."""
+        reads = []
+
+        def get_response(request):
+            view()
+            reads.append(self.router.db_for_read(User))
+            return HttpResponse()
+
+        response = db_routing.replica_routing_middleware(get_response)(request)
+        return reads[0], response
+
+    def test_only_safe_requests_read_from_replicas(self):
+        self.assertEqual(self.route(self.factory.get('/api/profile/'))[0], 'replica1')
+        self.assertEqual(self.route(self.factory.post('/api/auth/login/'))[0], 'default')
+        self.assertEqual(self.router.db_for_read(User), 'default')
+
+    def test_writes_pin_the_user_to_the_primary(self):
+        def edit_profile():
+            db_routing.authenticated(7)
+            self.assertEqual(self.router.db_for_write(User), 'default')
+
+        alias, response = self.route(self.factory.patch('/api/edit-profile/'), edit_profile)
+        self.assertEqual(alias, 'default')
+        self.assertEqual(response.cookies[db_routing.PIN_COOKIE]['max-age'], 5)
+
+        self.assertEqual(self.route(self.factory.get('/api/profile/'), lambda: db_routing.authenticated(7))[0], 'default')
+        self.assertEqual(self.route(self.factory.get('/api/profile/'), lambda: db_routing.authenticated(8))[0], 'replica1')
+        browser = self.factory.get('/admin/accounts/user/')
+        browser.COOKIES[db_routing.PIN_COOKIE] = '1'
+        self.assertEqual(self.route(browser)[0], 'default')
+
+    def test_new_accounts_are_pinned(self):
+        def sign_up():
+            self.router.db_for_write(User)
+            db_routing.user_saved(User, mock.Mock(pk=9))
+
+        self.route(self.factory.post('/api/auth/signup/'), sign_up)
+        self.assertEqual(self.route(self.factory.get('/api/profile/'), lambda: db_routing.authenticated(9))[0], 'default')
+
+
+class SQLiteProductionProfileTests(SimpleTestCase):
+    def test_pragmas_and_immediate_transactions(self):
+        code = (
+            'import django; django.setup()\n'
+            'from django.db import connection\n'
+            'cursor = connection.cursor()\n'
+            'print([cursor.execute(f"PRAGMA {name}").fetchone()[0] for name in ("journal_mode", "synchronous", "busy_timeout", "temp_store")])\n'
+            'print(connection.transaction_mode)\n'
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(
+                os.environ, SECRET_KEY='x', DJANGO_SETTINGS_MODULE='server.settings', SQLITE_PRODUCTION='true',
+                SQLITE_BUSY_TIMEOUT='2500', DATABASE_NAME=os.path.join(directory, 'db.sqlite3'), DATABASE_REPLICAS='',
+            )
+            result = subprocess.run([sys.executable, '-c', code], cwd=settings.BASE_DIR, env=env,
+                                    capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.split('\n')[:2], ["['wal', 1, 2500, 2]", 'IMMEDIATE'])
+
+
+class JSONRendererTests(SimpleTestCase):
+    def test_envelope_matches_drf_output(self):
+        from decimal import Decimal
+
+        from django.utils.translation import gettext_lazy
+        from rest_framework.renderers import JSONRenderer
+
+        from .renderers import Envelope, FastJSONRenderer
+
+        data = {'balance': Decimal('1.50'), 'at': timezone.now(), 'note': gettext_lazy('Hello'), 'name': 'Zoë '}
+        expected = JSONRenderer().render({'status': 200, 'message': 'Wallet retrieved successfully', 'data': data})
+        for envelope in (Envelope(200, 'Wallet retrieved successfully', data),
+                         Envelope(200, 'Wallet retrieved successfully', data, static=False)):
+            self.assertEqual(FastJSONRenderer().render(envelope), expected)
+        self.assertEqual(FastJSONRenderer().render(Envelope('error', 'Nope')), b'{"status":"error","message":"Nope"}')
+        self.assertEqual(dict(Envelope(400, 'Bad')), {'status': 400, 'message': 'Bad'})
+
+    def test_malformed_json_is_a_400(self):
+        response = APIClient().post('/api/auth/login/', '{"email": ', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class BenchBaselineTests(SimpleTestCase):
+    def test_regressions_beyond_tolerance_are_reported(self):
+        from benchmarks.endpoints import compare
+
+        def report(rps, p95, errors=0):
+            return {'scenarios': {'profile': {'throughput_rps': rps, 'latency_ms': {'p95': p95}, 'errors': errors}}}
+
+        self.assertEqual(compare(report(90, 11), report(100, 10), tolerance=0.2), [])
+        regressions = compare(report(70, 13, errors=2), report(100, 10), tolerance=0.2)
+        self.assertEqual([line.split(':')[0] for line in regressions], ['profile'] * 3)
+
+
+@override_settings(
+    METRICS_ENABLED=True,
+    MIDDLEWARE=['accounts.instrumentation.metrics_middleware', *settings.MIDDLEWARE],
+    PASSWORD_HASHERS=['accounts.instrumentation.TimedPBKDF2PasswordHasher'],
+)
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        from . import instrumentation
+
+        cache.clear()
+        throttling.reset()
+        instrumentation.registry.reset()
+        instrumentation.install_query_timer(connection)
+        self.addCleanup(connection.execute_wrappers.remove, instrumentation.time_queries)
+        User.objects.create_user(username='m@example.com', email='m@example.com', name='M', password='Passw0rd!')
+
+    def test_login_reports_each_phase(self):
+        response = APIClient().post('/api/auth/login/', {'email': 'm@example.com', 'password': 'Passw0rd!'},
+                                    format='json')
+        self.assertEqual(response.status_code, 200)
+        phases = [part.split(';')[0] for part in response['Server-Timing'].split(', ')]
+        self.assertEqual(phases, ['db', 'hash', 'render', 'total'])
+
+        metrics = APIClient().get('/metrics')
+        self.assertEqual(metrics['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        body = metrics.content.decode()
+        self.assertIn('accounts_request_phase_seconds_count{route="login",phase="hash"} 1', body)
+        self.assertIn('accounts_request_phase_seconds_bucket{route="login",phase="total",le="+Inf"} 1', body)
+        self.assertIn('accounts_requests_total{route="login",status="200"} 1', body)
+        self.assertIn('accounts_throttle_requests{scope="login",outcome="allowed"} 1', body)
+
+    def test_each_metric_is_declared_once_before_its_samples(self):
+        from . import image_client
+
+        latency = image_client.get_client().latency
+        self.addCleanup(latency.reset)
+        latency.record('upload', 0.1, ok=True)
+        latency.record('delete', 0.2, ok=False)
+        APIClient().post('/api/auth/login/', {'email': 'm@example.com', 'password': 'Passw0rd!'}, format='json')
+
+        body = APIClient().get('/metrics').content.decode()
+        declared = []
+        for line in body.splitlines():
+            if line.startswith('# TYPE '):
+                declared.append(line.split()[2])
+            elif line and not line.startswith('#'):
+                name = re.match(r'[a-zA-Z_:][a-zA-Z0-9_:]*', line).group()
+                self.assertIn(name, [declared[-1]] + [declared[-1] + suffix for suffix in ('_bucket', '_sum', '_count')],
+                              line)
+        self.assertEqual(len(declared), len(set(declared)))
+        self.assertIn('accounts_image_host_calls{operation="delete"} 1', body)
+        self.assertIn('accounts_image_host_calls{operation="upload"} 1', body)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        self.assertEqual(APIClient().get('/metrics').status_code, 401)
+        self.assertEqual(APIClient().get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled_metrics_are_not_served(self):
+        self.assertEqual(APIClient().get('/metrics').status_code, 404)
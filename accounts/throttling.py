@@ -0,0 +1,188 @@
+"""
+Sliding-window rate limits for the password-hashing endpoints.
+
+Login and sign-up each cost a full PBKDF2 run. These throttles reject excess
+attempts in ``APIView.initial()``, before the serializer hashes anything.
+
+Counts use two fixed windows in Django's cache, with the previous window
+weighted by how much of it still overlaps the sliding window. That is the
+usual sliding-window-counter approximation: two cache round trips per
+attempt, and it is shared by every worker. Once a key is over its limit, the
+process remembers when it becomes usable again. Further attempts during a
+flood are rejected from a local dict without touching the cache at all.
+"""
+import hashlib
+import json
+import math
+import threading
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from rest_framework.throttling import BaseThrottle
+
+CACHE_KEY_PREFIX = 'accounts:ratelimit:'
+MAX_LOCAL_BLOCKS = 10000
+
+_blocked = {}   # limiter key -> time.time() when it may retry
+_counters = {}  # scope -> {'allowed': n, 'rejected': n}
+_lock = threading.Lock()
+_hash_cost = None
+
+
+class SlidingWindowLimiter:
+    def __init__(self, scope, limit, window):
+        self.scope = scope
+        self.limit = limit
+        self.window = window
+
+    def hit(self, ident):
+        """Count an attempt. Returns 0 if it is allowed, else seconds until retrying makes sense."""
+        key = f'{self.scope}:{ident}'
+        now = time.time()
+        with _lock:
+            blocked_until = _blocked.get(key)
+            if blocked_until is not None and blocked_until <= now:
+                del _blocked[key]
+                blocked_until = None
+        if blocked_until is not None:
+            return blocked_until - now
+
+        index, elapsed = divmod(now, self.window)
+        current_key = f'{CACHE_KEY_PREFIX}{key}:{int(index)}'
+        cache.add(current_key, 0, self.window * 2)
+        try:
+            current = cache.incr(current_key)
+        except ValueError:
+            # Evicted between add() and incr().
+            cache.set(current_key, 1, self.window * 2)
+            current = 1
+        previous = cache.get(f'{CACHE_KEY_PREFIX}{key}:{int(index) - 1}', 0)
+
+        if previous * (1 - elapsed / self.window) + current <= self.limit:
+            return 0
+        retry_after = self.retry_after(previous, current, elapsed)
+        with _lock:
+            if len(_blocked) >= MAX_LOCAL_BLOCKS:
+                _evict_blocks(now)
+            _blocked[key] = now + retry_after
+        return retry_after
+
+    def retry_after(self, previous, current, elapsed):
+        if current < self.limit and previous:
+            # Wait for the previous window's weight to decay enough.
+            return max(0.0, self.window * (1 - (self.limit - current) / previous) - elapsed)
+        # Wait for this window to end and its own weight to decay enough.
+        return (self.window - elapsed) + self.window * (1 - self.limit / current)
+
+
+def _evict_blocks(now):
+    """
+    Drop expired blocks, then the oldest ones, down to 90% of
+    ``MAX_LOCAL_BLOCKS``, so a flood of new keys can't unblock the rest all
+    at once. Called with ``_lock`` held.
+    """
+    for key in [key for key, until in _blocked.items() if until <= now]:
+        del _blocked[key]
+    excess = len(_blocked) - MAX_LOCAL_BLOCKS * 9 // 10
+    for key in list(islice(_blocked, max(0, excess))):
+        del _blocked[key]
+
+
+def normalize_email(value):
+    return hashlib.sha256(str(value).strip().lower().encode()).hexdigest()[:32]
+
+
+def request_email(request):
+    """The ``email`` field of a DRF or plain Django request, if any."""
+    try:
+        data = request.data
+    except AttributeError:
+        if request.content_type == 'application/json':
+            try:
+                data = json.loads(request.body or b'{}')
+            except ValueError:
+                return None
+        else:
+            data = request.POST
+    value = data.get('email') if hasattr(data, 'get') else None
+    return normalize_email(value) if value else None
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    """Base class: subclasses return ``(limiter, ident)`` pairs from ``get_checks``."""
+    scope = None
+
+    def get_checks(self, request):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        self.wait_seconds = 0
+        for limiter, ident in self.get_checks(request):
+            if not limiter.limit or ident is None:
+                continue
+            self.wait_seconds = limiter.hit(ident)
+            if self.wait_seconds:
+                record(self.scope, allowed=False)
+                return False
+        record(self.scope, allowed=True)
+        return True
+
+    def wait(self):
+        return math.ceil(self.wait_seconds)
+
+
+class LoginRateThrottle(SlidingWindowThrottle):
+    scope = 'login'
+
+    def get_checks(self, request):
+        window = settings.LOGIN_RATE_LIMIT_WINDOW
+        return [
+            (SlidingWindowLimiter('login-ip', settings.LOGIN_RATE_LIMIT_IP, window), self.get_ident(request)),
+            (SlidingWindowLimiter('login-email', settings.LOGIN_RATE_LIMIT_EMAIL, window), request_email(request)),
+        ]
+
+
+class SignUpRateThrottle(SlidingWindowThrottle):
+    scope = 'sign_up'
+
+    def get_checks(self, request):
+        return [
+            (SlidingWindowLimiter('sign-up-ip', settings.SIGNUP_RATE_LIMIT_IP, settings.SIGNUP_RATE_LIMIT_WINDOW),
+             self.get_ident(request)),
+        ]
+
+
+def record(scope, allowed):
+    with _lock:
+        counters = _counters.setdefault(scope, {'allowed': 0, 'rejected': 0})
+        counters['allowed' if allowed else 'rejected'] += 1
+
+
+def hash_cost():
+    """CPU seconds of one password hash with the current hasher, measured once."""
+    global _hash_cost
+    if _hash_cost is None:
+        start = time.process_time()
+        make_password('rate-limit-calibration')
+        _hash_cost = time.process_time() - start
+    return _hash_cost
+
+
+def stats():
+    with _lock:
+        counters = {scope: dict(values) for scope, values in _counters.items()}
+    rejected = sum(values['rejected'] for values in counters.values())
+    return {
+        'scopes': counters,
+        'rejected': rejected,
+        'hash_cpu_seconds_avoided': rejected * hash_cost() if rejected else 0.0,
+    }
+
+
+def reset():
+    with _lock:
+        _blocked.clear()
+        _counters.clear()
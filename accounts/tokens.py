@@ -0,0 +1,24 @@
+"""
+simplejwt tokens with a sub-second ``iat``.
+
+simplejwt rounds ``iat`` down to whole seconds, so a token issued just after
+a logout-all in the same second looks as old as the cutoff. RFC 7519 allows
+fractional NumericDates; keeping the fraction lets ``accounts.revocation``
+compare against the exact time of the cutoff.
+"""
+from rest_framework_simplejwt import tokens
+
+
+class PreciseIssuedAtMixin:
+    def set_iat(self, claim='iat', at_time=None):
+        if at_time is None:
+            at_time = self.current_time
+        self.payload[claim] = at_time.timestamp()
+
+
+class AccessToken(PreciseIssuedAtMixin, tokens.AccessToken):
+    pass
+
+
+class RefreshToken(PreciseIssuedAtMixin, tokens.RefreshToken):
+    access_token_class = AccessToken
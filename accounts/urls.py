@@ -1,17 +1,30 @@
+from django.conf import settings
 from django.urls import path
-from rest_framework_simplejwt.views import TokenRefreshView
-from .views import (
-    SignUpView, LoginView, 
-    MyProfileView, EditProfileView,
-    UploadProfileImageView, DeleteProfileImageView,
-    )
+from . import views
 
-urlpatterns = [
-    path('auth/sign-up/', SignUpView.as_view(), name='sign_up'),
-    path('auth/login/', LoginView.as_view(), name='login'),
-    path('auth/refresh-token/', TokenRefreshView.as_view(), name='token_refresh'),
-    path('profile/', MyProfileView.as_view(), name='my_profile'),
-    path('profile/edit/', EditProfileView.as_view(), name='edit_profile'),
-    path('upload-image/', UploadProfileImageView.as_view(), name='upload-image'),
-    path('delete-image/<int:pk>/', DeleteProfileImageView.as_view(), name='delete-image'),
-]
\ No newline at end of file
+
+def api_urlpatterns(api):
+    """The accounts routes, with the switchable endpoints served by ``api`` (``views`` or ``async_views``)."""
+    return [
+        path('auth/sign-up/', api.SignUpView.as_view(), name='sign_up'),
+        path('auth/login/', api.LoginView.as_view(), name='login'),
+        path('auth/refresh-token/', views.RefreshTokenView.as_view(), name='token_refresh'),
+        path('auth/logout/', views.LogoutView.as_view(), name='logout'),
+        path('auth/logout-all/', views.LogoutAllView.as_view(), name='logout_all'),
+        path('profile/', api.MyProfileView.as_view(), name='my_profile'),
+        path('profile/edit/', api.EditProfileView.as_view(), name='edit_profile'),
+        path('upload-image/', api.UploadProfileImageView.as_view(), name='upload-image'),
+        path('upload-image/status/<int:pk>/', views.ProfileImageJobStatusView.as_view(), name='upload-image-status'),
+        path('delete-image/<int:pk>/', api.DeleteProfileImageView.as_view(), name='delete-image'),
+        path('users/search/', views.UserSearchView.as_view(), name='user-search'),
+        path('wallet/', views.WalletView.as_view(), name='wallet'),
+        path('wallet/transactions/', views.WalletTransactionListView.as_view(), name='wallet-transactions'),
+    ]
+
+
+if settings.ACCOUNTS_ASYNC_VIEWS:
+    from . import async_views
+
+    urlpatterns = api_urlpatterns(async_views)
+else:
+    urlpatterns = api_urlpatterns(views)
@@ -0,0 +1,170 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+CACHE_KEY_PREFIX = 'accounts:user:'
+
+
+class LRUCache:
+    """Bounded, thread-safe LRU map whose entries expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_local = LRUCache(settings.USER_CACHE_LOCAL_SIZE, settings.USER_CACHE_LOCAL_TTL)
+_stats_lock = threading.Lock()
+_stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def _cache_key(user_id):
+    return f'{CACHE_KEY_PREFIX}{user_id}'
+
+
+def _version_key(user_id):
+    return f'{CACHE_KEY_PREFIX}{user_id}:version'
+
+
+def _lookup(key, version, shared):
+    """
+    Local and shared entries are ``(version, user)``. They are only used
+    while the shared version key still holds ``version``, so an
+    invalidation in any process retires every worker's local copy.
+    """
+    entry = _local.get(key)
+    if entry is not None and entry[0] == version:
+        _count('local_hits')
+        return entry[1]
+    if isinstance(shared, tuple) and shared[0] == version:
+        _count('shared_hits')
+        _local.set(key, shared)
+        return shared[1]
+    return None
+
+
+def get_user(user_id):
+    """
+    Return the user with ``user_id`` from the local LRU, then the shared
+    cache, then the database. Returns ``None`` if the user does not exist.
+
+    Callers get their own copy so mutating it never leaks into the cache.
+    """
+    key = _cache_key(user_id)
+    version = cache.get(_version_key(user_id), 0)
+    user = _lookup(key, version, None)
+    if user is None:
+        user = _lookup(key, version, cache.get(key))
+    if user is not None:
+        return copy.copy(user)
+
+    _count('misses')
+    User = get_user_model()
+    try:
+        user = User.objects.get(pk=user_id)
+    except User.DoesNotExist:
+        return None
+    # Stored under the version read before the query: an invalidation that
+    # lands in between moves the version on and retires this entry.
+    cache.set(key, (version, user), settings.USER_CACHE_SHARED_TTL)
+    _local.set(key, (version, user))
+    return copy.copy(user)
+
+
+async def aget_user(user_id):
+    """Async ``get_user`` using the cache framework's and the ORM's async APIs."""
+    key = _cache_key(user_id)
+    version = await cache.aget(_version_key(user_id), 0)
+    user = _lookup(key, version, None)
+    if user is None:
+        user = _lookup(key, version, await cache.aget(key))
+    if user is not None:
+        return copy.copy(user)
+
+    _count('misses')
+    User = get_user_model()
+    try:
+        user = await User.objects.aget(pk=user_id)
+    except User.DoesNotExist:
+        return None
+    await cache.aset(key, (version, user), settings.USER_CACHE_SHARED_TTL)
+    _local.set(key, (version, user))
+    return copy.copy(user)
+
+
+def invalidate_user(user_id):
+    key = _cache_key(user_id)
+    _local.delete(key)
+    cache.delete(key)
+    version_key = _version_key(user_id)
+    try:
+        cache.incr(version_key)
+    except ValueError:
+        # Not set yet (or evicted): any value other than the one entries were
+        # stored under will do.
+        if not cache.add(version_key, 1, None):
+            cache.incr(version_key)
+
+
+def clear():
+    _local.clear()
+
+
+def stats():
+    with _stats_lock:
+        data = dict(_stats)
+    lookups = data['local_hits'] + data['shared_hits'] + data['misses']
+    data['lookups'] = lookups
+    data['hit_rate'] = (lookups - data['misses']) / lookups if lookups else 0.0
+    data['local_size'] = len(_local)
+    return data
+
+
+def reset_stats():
+    with _stats_lock:
+        for name in _stats:
+            _stats[name] = 0
@@ -1,23 +1,45 @@
+from django.conf import settings
+from django.core.cache import cache
 from django.contrib.auth import get_user_model
 from django.shortcuts import render, get_object_or_404
+from django.http import HttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.crypto import constant_time_compare
+from django.views import View
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework import generics
-from rest_framework.permissions import AllowAny, IsAuthenticated
-from .serializers import ProfileImageSerializer, RegisterSerializer, CustomTokenObtainPairSerializer, UserSerializer
-from rest_framework_simplejwt.views import TokenObtainPairView
-from drf_yasg.utils import swagger_auto_schema
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
+from .serializers import (
+    ProfileImageSerializer, RegisterSerializer, CustomTokenObtainPairSerializer, UserSerializer,
+    ProfileImageJobSerializer, WalletSerializer, WalletTransactionSerializer,
+    RotatingTokenRefreshSerializer, LogoutSerializer, UserSearchSerializer,
+)
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from drf_yasg.utils import no_body, swagger_auto_schema
 from drf_yasg import openapi
-from .models import Wallet
+from .models import ProfileImageJob, Wallet, WalletTransaction
+from .conditional import add_validators, make_etag, not_modified, profile_etag
+from .images import delete_profile_image_assets, has_profile_image, replace_profile_image
+from .jobs import enqueue_profile_image
+from .instrumentation import render_metrics
+from .jwt_keys import jwks_document
+from .renderers import Envelope
+from .revocation import store as revocation_store
+from .search import search_users
+from .throttling import LoginRateThrottle, SignUpRateThrottle
+from .wallet import grant_first_upload_reward
 from rest_framework.parsers import MultiPartParser, FormParser
-import cloudinary.uploader
-import os
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 User = get_user_model()
 
 class SignUpView(generics.CreateAPIView):
     queryset = User.objects.all()
     permission_classes = [AllowAny]
+    throttle_classes = [SignUpRateThrottle]
     serializer_class = RegisterSerializer
 
     @swagger_auto_schema(
@@ -34,27 +56,21 @@ class SignUpView(generics.CreateAPIView):
             serializer = self.get_serializer(data=request.data)
             serializer.is_valid(raise_exception=True)
             user = serializer.save()
-            Wallet.objects.create(user=user, balance=0)
             
-            return Response({
-                'status': 200,
-                'message': 'User registered successfully',
-                'data': {
-                    'id': user.id,
-                    'name': user.name,
-                    'email': user.email,
-                    'phone': user.phone,
-                }
-            }, status=status.HTTP_201_CREATED)
+            return Response(Envelope(200, 'User registered successfully', {
+                'id': user.id,
+                'name': user.name,
+                'email': user.email,
+                'phone': user.phone,
+            }), status=status.HTTP_201_CREATED)
         except Exception as e:
-            return Response({
-                'status': 400, 'message': str(e)
-            }, status = status.HTTP_400_BAD_REQUEST)
+            return Response(Envelope(400, str(e), static=False), status=status.HTTP_400_BAD_REQUEST)
         
 
 
 class LoginView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
+    throttle_classes = [LoginRateThrottle]
     @swagger_auto_schema(
         operation_description="Login a user.",
         responses={
@@ -70,11 +86,71 @@ class LoginView(TokenObtainPairView):
             serializer.is_valid(raise_exception=True)
             return Response(serializer.validated_data, status=status.HTTP_200_OK)
         except Exception as e:
-            return Response({
-                'status': 400, 'message': str(e)
-            }, status = status.HTTP_400_BAD_REQUEST)
+            return Response(Envelope(400, str(e), static=False), status=status.HTTP_400_BAD_REQUEST)
         
 
+class RefreshTokenView(TokenRefreshView):
+    serializer_class = RotatingTokenRefreshSerializer
+
+    @swagger_auto_schema(
+        operation_description="Exchange a refresh token for a new access/refresh pair. "
+                              "The presented refresh token is revoked; reusing it revokes all sessions.",
+        responses={
+            200: RotatingTokenRefreshSerializer,
+            401: "Unauthorized (invalid, revoked or reused token)"
+        },
+        tags=['Authentication'],
+    )
+    def post(self, request, *args, **kwargs):
+        return super().post(request, *args, **kwargs)
+
+
+class LogoutView(generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = LogoutSerializer
+
+    @swagger_auto_schema(
+        operation_description="Revoke the current access token and, if given, the refresh token.",
+        request_body=LogoutSerializer,
+        responses={
+            200: "Logged out",
+            400: "Bad Request",
+            401: "Unauthorized"
+        },
+        tags=['Authentication'],
+    )
+    def post(self, request, *args, **kwargs):
+        try:
+            serializer = self.get_serializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            revocation_store.revoke_token(request.auth)
+            if serializer.validated_data.get('refresh'):
+                revocation_store.revoke_token(serializer.validated_data['refresh'])
+            return Response(Envelope(200, 'Logged out successfully'), status=status.HTTP_200_OK)
+        except Exception as e:
+            return Response(Envelope(400, str(e), static=False), status=status.HTTP_400_BAD_REQUEST)
+
+
+class LogoutAllView(generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Revoke every access and refresh token issued to me so far.",
+        request_body=no_body,
+        responses={
+            200: "Logged out everywhere",
+            401: "Unauthorized"
+        },
+        tags=['Authentication'],
+    )
+    def post(self, request, *args, **kwargs):
+        try:
+            revocation_store.revoke_user(request.user.pk)
+            return Response(Envelope(200, 'Logged out of all sessions successfully'), status=status.HTTP_200_OK)
+        except Exception as e:
+            return Response(Envelope(400, str(e), static=False), status=status.HTTP_400_BAD_REQUEST)
+
+
 class MyProfileView(generics.RetrieveAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = UserSerializer
@@ -94,16 +170,22 @@ class MyProfileView(generics.RetrieveAPIView):
     def retrieve(self, request, *args, **kwargs):
         try:
             instance = self.get_object()
-            serializer = self.get_serializer(instance)
-            return Response({
-                'status': 200,
-                'message': 'User profile retrieved successfully',
-                'data': serializer.data
-            })
+            etag = profile_etag(instance)
+            response = not_modified(request, etag, instance.profile_updated_at)
+            if response is not None:
+                return response
+
+            cache_key = f'accounts:profile:{instance.pk}:{etag}'
+            data = cache.get(cache_key) if settings.PROFILE_CACHE_TTL else None
+            if data is None:
+                data = self.get_serializer(instance).data
+                if settings.PROFILE_CACHE_TTL:
+                    cache.set(cache_key, data, settings.PROFILE_CACHE_TTL)
+
+            response = Response(Envelope(200, 'User profile retrieved successfully', data))
+            return add_validators(response, etag, instance.profile_updated_at)
         except Exception as e:
-            return Response({
-                'status': 400, 'message': str(e)
-            }, status = status.HTTP_400_BAD_REQUEST)
+            return Response(Envelope(400, str(e), static=False), status=status.HTTP_400_BAD_REQUEST)
 
 
 
@@ -127,6 +209,7 @@ class UploadProfileImageView(generics.GenericAPIView):
         ],
         responses={
             200: ProfileImageSerializer,
+            202: "Upload queued (async upload mode)",
             400: "Bad Request",
             401: "Unauthorized",
             404: "Not Found"
@@ -137,52 +220,65 @@ class UploadProfileImageView(generics.GenericAPIView):
     def post(self, request, *args, **kwargs):
         try:
             user = self.get_object()
-            had_profile_image = bool(user.profile_image) 
-            if user.cloudinary_public_id:
-                cloudinary.uploader.destroy(user.cloudinary_public_id)
-            if user.profile_image:
-                old_local_path = user.profile_image.path
-                if os.path.exists(old_local_path):
-                    os.remove(old_local_path)
+            if settings.PROFILE_IMAGE_UPLOAD_MODE == 'async':
+                return self.enqueue(request, user)
+
+            had_profile_image = has_profile_image(user)
 
             serializer = self.get_serializer(user, data=request.data, partial=True)
             if serializer.is_valid(raise_exception=True):
-                serializer.save()
-
-                local_file_path = user.profile_image.path
-                if local_file_path and os.path.exists(local_file_path):
-                    upload_response = cloudinary.uploader.upload(
-                        local_file_path,
-                        folder="user_profiles"
-                    )
-                    user.cloudinary_url = upload_response.get('secure_url')
-                    user.cloudinary_public_id = upload_response.get('public_id')
-                    user.save()
-
-                user_wallet, created = Wallet.objects.get_or_create(
-                    user=user,
-                    defaults={'balance': 0, 'currency': 'Gems'}
-                )
+                replace_profile_image(user, serializer.validated_data['profile_image'])
+
                 if not had_profile_image: 
-                    reward_points = 3
-                    user_wallet.balance += reward_points
-                    user_wallet.save()
-
-                return Response({
-                    'status': 200,
-                    'message': 'Profile image uploaded successfully',
-                    "data": {
-                        "cloudinary_url": user.cloudinary_url,
-                    }
-                }, status=status.HTTP_200_OK)
+                    grant_first_upload_reward(user)
+
+                return Response(Envelope(200, 'Profile image uploaded successfully', {
+                    'cloudinary_url': user.cloudinary_url,
+                }), status=status.HTTP_200_OK)
         except Exception as e:
-            return Response({
-                'status': 400, 'message': str(e)
-            }, status=status.HTTP_400_BAD_REQUEST)
+            return Response(Envelope(400, str(e), static=False), status=status.HTTP_400_BAD_REQUEST)
+
+    def enqueue(self, request, user):
+        serializer = self.get_serializer(user, data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        job = enqueue_profile_image(user, serializer.validated_data['profile_image'])
+        return Response(Envelope(202, 'Profile image upload queued', {
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': reverse('upload-image-status', kwargs={'pk': job.id}),
+        }), status=status.HTTP_202_ACCEPTED)
+
+
+class ProfileImageJobStatusView(generics.RetrieveAPIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = ProfileImageJobSerializer
+
+    @swagger_auto_schema(
+        operation_description="Get the status of a queued profile image upload.",
+        responses={
+            200: ProfileImageJobSerializer,
+            401: "Unauthorized",
+            404: "Not Found"
+        },
+        tags=['Profile'],
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            return ProfileImageJob.objects.none()
+        return ProfileImageJob.objects.filter(user_id=self.request.user.pk)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        serializer = self.get_serializer(instance)
+        return Response(Envelope(200, 'Upload job status retrieved successfully', serializer.data))
 
 
 class DeleteProfileImageView(generics.GenericAPIView):
     permission_classes = [IsAuthenticated]
+    queryset = User.objects.all()
 
     @swagger_auto_schema(
          operation_description="Delete profile image.",
@@ -197,33 +293,20 @@ class DeleteProfileImageView(generics.GenericAPIView):
     def delete(self, request, pk, *args, **kwargs):
         user_to_delete = get_object_or_404(User, pk=pk)
         if not user_to_delete.profile_image and not user_to_delete.cloudinary_public_id:
-             return Response({
-                "status": "error",
-                "message": "No profile image found to delete."
-            }, status=status.HTTP_404_NOT_FOUND)
+            return Response(Envelope('error', 'No profile image found to delete.'), status=status.HTTP_404_NOT_FOUND)
 
         try:
-            if user_to_delete.cloudinary_public_id:
-                cloudinary.uploader.destroy(user_to_delete.cloudinary_public_id)
-            if user_to_delete.profile_image:
-                local_path = user_to_delete.profile_image.path
-                if os.path.exists(local_path):
-                    os.remove(local_path)
+            delete_profile_image_assets(user_to_delete)
 
             user_to_delete.profile_image = None
             user_to_delete.cloudinary_url = None
             user_to_delete.cloudinary_public_id = None
+            user_to_delete.profile_image_variants = {}
             user_to_delete.save()
 
-            return Response({
-                "status": "success",
-                "message": "Profile image deleted successfully."
-            }, status=status.HTTP_200_OK)
+            return Response(Envelope('success', 'Profile image deleted successfully.'), status=status.HTTP_200_OK)
         except Exception as e:
-            return Response({
-                "status": "error",
-                "message": str(e)
-            }, status=status.HTTP_400_BAD_REQUEST)
+            return Response(Envelope('error', str(e), static=False), status=status.HTTP_400_BAD_REQUEST)
         
 
 class EditProfileView(generics.UpdateAPIView):
@@ -250,12 +333,169 @@ class EditProfileView(generics.UpdateAPIView):
             serializer = self.get_serializer(instance, data=request.data, partial=partial)
             serializer.is_valid(raise_exception=True)
             self.perform_update(serializer)
-            return Response({
-                'status': 200,
-                'message': f'Profile updated successfully for user {instance.email}',
-                'data': serializer.data
-            }, status=status.HTTP_200_OK)
+            return Response(Envelope(
+                200, f'Profile updated successfully for user {instance.email}', serializer.data, static=False,
+            ), status=status.HTTP_200_OK)
         except Exception as e:
-            return Response({
-                'status': 400, 'message': str(e)
-            }, status = status.HTTP_400_BAD_REQUEST)
+            return Response(Envelope(400, str(e), static=False), status=status.HTTP_400_BAD_REQUEST)
+
+
+class WalletView(generics.RetrieveAPIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = WalletSerializer
+
+    @swagger_auto_schema(
+        operation_description="Get my wallet balance. Supports If-None-Match / If-Modified-Since.",
+        responses={
+            200: WalletSerializer,
+            304: "Not Modified",
+            401: "Unauthorized",
+            404: "Not Found"
+        },
+        tags=['Wallet'],
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        # One indexed lookup decides between 304, a cached body and a full load.
+        marker = Wallet.objects.filter(user_id=request.user.pk).values_list('pk', 'updated_at').first()
+        if marker is None:
+            raise NotFound("Wallet not found.")
+        wallet_id, updated_at = marker
+        etag = make_etag('wallet', wallet_id, updated_at.timestamp())
+        response = not_modified(request, etag, updated_at)
+        if response is not None:
+            return response
+
+        cache_key = f'accounts:wallet:{wallet_id}:{updated_at.timestamp()}'
+        data = cache.get(cache_key)
+        if data is None:
+            wallet = Wallet.objects.select_related('user').get(pk=wallet_id)
+            data = self.get_serializer(wallet).data
+            cache.set(cache_key, data, settings.WALLET_CACHE_TTL)
+
+        response = Response(Envelope(200, 'Wallet retrieved successfully', data))
+        return add_validators(response, etag, updated_at)
+
+
+class WalletTransactionPagination(CursorPagination):
+    page_size = 50
+    ordering = '-id'
+
+
+class WalletTransactionListView(generics.ListAPIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = WalletTransactionSerializer
+    pagination_class = WalletTransactionPagination
+
+    @swagger_auto_schema(
+        operation_description="List my wallet transactions, newest first.",
+        responses={
+            200: WalletTransactionSerializer(many=True),
+            304: "Not Modified",
+            401: "Unauthorized",
+        },
+        tags=['Wallet'],
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        return WalletTransaction.objects.filter(wallet__user_id=self.request.user.pk)
+
+    def list(self, request, *args, **kwargs):
+        # New ledger entries always bump Wallet.updated_at, so it versions the
+        # whole list; the query string distinguishes pages.
+        updated_at = Wallet.objects.filter(user_id=request.user.pk).values_list('updated_at', flat=True).first()
+        etag = None
+        if updated_at is not None:
+            etag = make_etag('wallet-tx', request.user.pk, updated_at.timestamp(), request.META.get('QUERY_STRING', ''))
+            response = not_modified(request, etag, updated_at)
+            if response is not None:
+                return response
+
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+        response = Response(Envelope(200, 'Wallet transactions retrieved successfully', {
+            'next': self.paginator.get_next_link(),
+            'previous': self.paginator.get_previous_link(),
+            'results': serializer.data,
+        }))
+        if etag:
+            add_validators(response, etag, updated_at)
+        return response
+
+
+class UserSearchPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class UserSearchView(generics.ListAPIView):
+    permission_classes = [IsAdminUser]
+    serializer_class = UserSearchSerializer
+    pagination_class = UserSearchPagination
+
+    @swagger_auto_schema(
+        operation_description="Search users by name, email, username or phone prefix (staff only).",
+        manual_parameters=[
+            openapi.Parameter('q', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=True,
+                              description="Search terms; every term must match."),
+        ],
+        responses={
+            200: UserSearchSerializer(many=True),
+            401: "Unauthorized",
+            403: "Forbidden"
+        },
+        tags=['Users'],
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        return search_users(self.request.query_params.get('q', ''), User.objects.order_by('id'))
+
+    def list(self, request, *args, **kwargs):
+        try:
+            page = self.paginate_queryset(self.get_queryset())
+            serializer = self.get_serializer(page, many=True)
+            return Response(Envelope(200, 'Users retrieved successfully', {
+                'count': self.paginator.page.paginator.count,
+                'next': self.paginator.get_next_link(),
+                'previous': self.paginator.get_previous_link(),
+                'results': serializer.data,
+            }))
+        except Exception as e:
+            return Response(Envelope(400, str(e), static=False), status=status.HTTP_400_BAD_REQUEST)
+
+
+class JWKSView(View):
+    """Public signing keys. Plain Django view: no authentication, no DRF overhead."""
+
+    def get(self, request, *args, **kwargs):
+        body, etag = jwks_document()
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        patch_cache_control(
+            response,
+            public=True,
+            max_age=settings.JWKS_MAX_AGE,
+            stale_while_revalidate=settings.JWKS_MAX_AGE,
+        )
+        return response
+
+
+class MetricsView(View):
+    """Request timings and component counters in Prometheus text format."""
+
+    def get(self, request, *args, **kwargs):
+        if not settings.METRICS_ENABLED:
+            return HttpResponse(status=404)
+        token = settings.METRICS_TOKEN
+        if token and not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponse(status=401, headers={'WWW-Authenticate': 'Bearer'})
+        return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,104 @@
+"""
+Wallet balance changes.
+
+Every change is written as a ``WalletTransaction`` ledger row and applied to
+the cached ``Wallet.balance`` with a single ``F()`` UPDATE in the same
+transaction, so concurrent credits never lose updates. A unique idempotency
+key per entry makes retried or duplicated rewards a no-op.
+
+``Wallet.snapshot_balance`` is the balance as of ``snapshot_transaction_id``;
+``recompute_balance`` only sums entries after it, and ``take_snapshot`` (run
+by ``manage.py wallet_snapshot``) moves it forward.
+"""
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max, Sum
+from django.utils import timezone
+
+from .models import Wallet, WalletTransaction
+
+FIRST_UPLOAD_REWARD = 3
+
+
+def credit(user, amount, reason, idempotency_key):
+    """
+    Apply ``amount`` to the user's wallet once per ``idempotency_key``.
+
+    Returns the new ledger entry, or ``None`` if the key was already used.
+    """
+    wallet, created = Wallet.objects.get_or_create(
+        user=user,
+        defaults={'balance': 0, 'currency': 'Gems'}
+    )
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                entry = WalletTransaction.objects.create(
+                    wallet=wallet,
+                    amount=amount,
+                    reason=reason,
+                    idempotency_key=idempotency_key,
+                )
+        except IntegrityError:
+            if WalletTransaction.objects.filter(idempotency_key=idempotency_key).exists():
+                return None
+            raise
+        Wallet.objects.filter(pk=wallet.pk).update(
+            balance=F('balance') + amount,
+            updated_at=timezone.now(),
+        )
+    return entry
+
+
+def grant_first_upload_reward(user):
+    return credit(
+        user,
+        FIRST_UPLOAD_REWARD,
+        reason='profile_image_first_upload',
+        idempotency_key=f'profile-image-first-upload:{user.pk}',
+    )
+
+
+def recompute_balance(wallet):
+    """Balance derived from the ledger: the snapshot plus every newer entry."""
+    recent = wallet.transactions.filter(pk__gt=wallet.snapshot_transaction_id).aggregate(total=Sum('amount'))
+    return wallet.snapshot_balance + (recent['total'] or 0)
+
+
+def take_snapshot(wallet_id, settle_seconds=60, repair=False):
+    """
+    Fold ledger entries older than ``settle_seconds`` into the wallet's
+    snapshot and return ``(wallet, drift)``, where ``drift`` is the cached
+    balance minus the ledger balance. The delay keeps entries whose
+    transaction may still be committing out of the snapshot.
+
+    With ``repair=True`` a drifted cached balance is reset to the ledger's.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settle_seconds)
+    with transaction.atomic():
+        wallet = Wallet.objects.select_for_update().get(pk=wallet_id)
+        last_id = wallet.transactions.filter(
+            pk__gt=wallet.snapshot_transaction_id, created_at__lt=cutoff
+        ).aggregate(last_id=Max('id'))['last_id']
+
+        if last_id is not None:
+            settled = wallet.transactions.filter(
+                pk__gt=wallet.snapshot_transaction_id, pk__lte=last_id
+            ).aggregate(total=Sum('amount'))
+            wallet.snapshot_balance += settled['total']
+            wallet.snapshot_transaction_id = last_id
+            wallet.snapshot_at = timezone.now()
+            Wallet.objects.filter(pk=wallet.pk).update(
+                snapshot_balance=wallet.snapshot_balance,
+                snapshot_transaction_id=wallet.snapshot_transaction_id,
+                snapshot_at=wallet.snapshot_at,
+            )
+
+        drift = wallet.balance - recompute_balance(wallet)
+        if drift and repair:
+            Wallet.objects.filter(pk=wallet.pk).update(
+                balance=F('balance') - drift,
+                updated_at=timezone.now(),
+            )
+    return wallet, drift
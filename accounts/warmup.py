@@ -0,0 +1,103 @@
+"""
+Work a fresh worker does before it takes traffic, so the first requests
+don't pay for it.
+
+``server.wsgi`` and ``server.asgi`` call ``warm_up()`` when
+``WARM_UP_ON_STARTUP`` is set. It runs the steps named in ``WARM_UP_STEPS``:
+
+* ``urls``: import every view by building the URL resolver.
+* ``database``: connect once, which loads the backend and checks the
+  database is reachable.
+* ``jwt_keys``: load the signing keys (RS256/ES256 only).
+* ``revocation``: load the revoked-token set into memory.
+* ``openapi``: load or generate the API schema.
+* ``images``: import the image-host SDK and Pillow (upload-heavy pools).
+
+A failing step is logged and skipped; the worker still starts.
+
+Connections opened while warming are closed before ``warm_up()`` returns.
+The module is imported in a process or thread that doesn't serve requests:
+the gunicorn master under ``--preload`` (forked workers would share its
+sockets) or the ASGI server's main thread (Django connections are per
+thread). Each serving thread opens its own connection on its first query.
+To keep one open per worker, call ``warm_up(['database'])`` from gunicorn's
+``post_fork`` hook as well, or set ``CONN_MAX_AGE`` so the first request's
+connection is reused.
+"""
+import importlib
+import logging
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def warm_urls():
+    from django.urls import get_resolver
+
+    get_resolver().reverse_dict
+
+
+def warm_database():
+    from django.db import connections
+
+    for alias in connections:
+        connections[alias].ensure_connection()
+
+
+def warm_jwt_keys():
+    from .jwt_keys import get_keyring
+
+    if settings.JWT_ALGORITHM != 'HS256':
+        get_keyring()
+
+
+def warm_revocation():
+    from .revocation import store
+
+    store.reload()
+
+
+def warm_openapi():
+    if settings.ENABLE_API_DOCS:
+        from server.swagger import warm_schema
+
+        warm_schema()
+
+
+def warm_images():
+    from .image_host import get_image_host
+
+    for module in ('cloudinary.uploader', 'cloudinary.api', 'PIL.Image'):
+        importlib.import_module(module)
+    get_image_host()
+
+
+STEPS = {
+    'urls': warm_urls,
+    'database': warm_database,
+    'jwt_keys': warm_jwt_keys,
+    'revocation': warm_revocation,
+    'openapi': warm_openapi,
+    'images': warm_images,
+}
+
+
+def warm_up(steps=None):
+    """Run the warm-up steps; returns ``{step: seconds}`` for those that succeeded."""
+    from django.db import connections
+
+    timings = {}
+    try:
+        for name in settings.WARM_UP_STEPS if steps is None else steps:
+            started = time.perf_counter()
+            try:
+                STEPS[name]()
+            except Exception:
+                logger.exception("Warm-up step %r failed", name)
+                continue
+            timings[name] = time.perf_counter() - started
+    finally:
+        connections.close_all()
+    return timings
@@ -0,0 +1,6 @@
+"""
+Standalone performance benchmarks for the accounts app.
+
+Each module is runnable with ``python -m benchmarks.<name>`` from the project
+root. They build a throwaway test database, so they never touch db.sqlite3.
+"""
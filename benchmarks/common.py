@@ -0,0 +1,86 @@
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_django():
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'server.settings')
+    os.environ.setdefault('SECRET_KEY', 'benchmark-only-secret-key-not-for-production-use')
+    import django
+    django.setup()
+
+
+@contextlib.contextmanager
+def test_database():
+    """Create the Django test database for the duration of the block."""
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def create_user(email='bench@example.com', password='Bench#Pass1', **extra):
+    from accounts.models import User, Wallet
+
+    extra.setdefault('name', 'Bench User')
+    user = User.objects.create_user(username=email, email=email, password=password, **extra)
+    Wallet.objects.get_or_create(user=user)
+    return user
+
+
+def auth_client(user):
+    from rest_framework.test import APIClient
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+    return client
+
+
+def make_image(width=1600, height=1200, fmt='JPEG'):
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.effect_noise((width, height), 64).convert('RGB').save(buffer, fmt, quality=90)
+    return buffer.getvalue()
+
+
+def proc_io():
+    """Bytes read/written by this process via syscalls (Linux only)."""
+    try:
+        with open('/proc/self/io') as f:
+            values = dict(line.split(': ') for line in f.read().splitlines())
+        return {'read': int(values['rchar']), 'written': int(values['wchar'])}
+    except (OSError, KeyError, ValueError):
+        return {'read': 0, 'written': 0}
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def dump(report):
+    print(json.dumps(report, indent=2, sort_keys=True))
@@ -0,0 +1,377 @@
+"""
+End-to-end load test of every accounts endpoint.
+
+Each scenario sends ``--requests`` requests to one endpoint from
+``--concurrency`` clients inside this process. With ``--interface wsgi``
+each client is a thread with its own test Client. With ``--interface asgi``
+each is an asyncio task on an AsyncClient; set ACCOUNTS_ASYNC_VIEWS=true to
+serve the native async views.
+
+Before the scenarios run:
+- The database is a throwaway file-backed test database, seeded in bulk
+  with ``--users`` users, their wallets, ledger entries and search index.
+- The image host is replaced by ``FakeImageHost``. It keeps assets in
+  memory and sleeps ``--image-latency`` seconds per call.
+- Rate limits are off. Passwords use MD5 unless ``--hasher default``.
+
+For each scenario the report gives:
+- requests, errors and throughput;
+- p50/p95/p99 latency;
+- SQL queries per request;
+- peak RSS so far.
+
+``manage.py bench --baseline old.json`` fails when a scenario's throughput
+or p95 is more than ``--tolerance`` worse than the stored run.
+
+    python manage.py bench --users 1000 --requests 200 --concurrency 4 --output bench.json
+"""
+import asyncio
+import itertools
+import os
+import resource
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import ExitStack
+from unittest import mock
+
+from .common import make_image, percentile
+
+from accounts.image_host import LocalImageHost
+
+PASSWORD = 'Bench#Pass1'
+TRANSACTIONS_PER_USER = 20
+SCENARIOS = [
+    'sign_up', 'login', 'refresh', 'profile', 'profile_edit', 'wallet', 'wallet_transactions', 'search', 'jwks',
+    'upload_image', 'delete_image', 'logout',
+]
+
+
+class FakeImageHost(LocalImageHost):
+    """``LocalImageHost`` that reads what it is sent and takes ``latency`` seconds per call."""
+
+    def __init__(self, latency=0.0):
+        super().__init__()
+        self.latency = latency
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def upload(self, data, folder='', **options):
+        if isinstance(data, (str, os.PathLike)):
+            with open(data, 'rb') as f:
+                data = f.read()
+        elif hasattr(data, 'read'):
+            data = data.read()
+        self._wait()
+        return super().upload(b'', folder=folder, **options)
+
+    async def aupload(self, data, filename='file', folder='', **options):
+        if hasattr(data, 'read'):
+            data = data.read()
+        await asyncio.sleep(self.latency)
+        return super().upload(b'', folder=folder, **options)
+
+    def delete(self, public_ids):
+        self._wait()
+        super().delete(public_ids)
+
+    def existing(self, public_ids):
+        self._wait()
+        return super().existing(public_ids)
+
+
+class QueryCounter:
+    """Counts queries on every connection, including ones opened by worker threads."""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def __enter__(self):
+        from django.db import connections
+        from django.db.backends.signals import connection_created
+
+        connection_created.connect(self.install)
+        for connection in connections.all():
+            self.install(connection)
+        return self
+
+    def __exit__(self, *exc):
+        from django.db import connections
+        from django.db.backends.signals import connection_created
+
+        connection_created.disconnect(self.install)
+        for connection in connections.all():
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
+
+
+def seed(users):
+    """Bulk-create ``users`` users with wallets, ledger entries and search tokens, plus one staff user."""
+    from django.contrib.auth.hashers import make_password
+    from django.db import transaction
+
+    from accounts.models import User, Wallet, WalletTransaction
+    from accounts.search import index_users
+
+    password = make_password(PASSWORD)
+    people = [
+        User(username=f'bench{i}@example.com', email=f'bench{i}@example.com', name=f'Bench User {i}',
+             phone=f'+1202555{i:04d}', address=f'{i} Bench Street', password=password)
+        for i in range(users)
+    ]
+    with transaction.atomic():
+        User.objects.bulk_create(people, batch_size=500)
+        people = list(User.objects.filter(email__startswith='bench').order_by('id'))
+        Wallet.objects.bulk_create(
+            [Wallet(user=user, balance=TRANSACTIONS_PER_USER) for user in people], batch_size=500,
+        )
+        wallets = Wallet.objects.filter(user__in=people)
+        WalletTransaction.objects.bulk_create([
+            WalletTransaction(wallet=wallet, amount=1, reason='bench', idempotency_key=f'bench-{wallet.pk}-{n}')
+            for wallet in wallets for n in range(TRANSACTIONS_PER_USER)
+        ], batch_size=1000)
+        index_users(people, replace=False)
+    staff = User.objects.create_user(username='staff@bench.invalid', email='staff@bench.invalid', name='Staff',
+                                     password=PASSWORD, is_staff=True)
+    return people, staff
+
+
+def bearer(token):
+    return {'Authorization': f'Bearer {token}'}
+
+
+def build_requests(scenario, users, staff, count, image_size):
+    """``(method, path, kwargs_factory, expected_statuses)`` for each request of a scenario."""
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+    cycle = itertools.islice(itertools.cycle(users), count)
+    if scenario == 'sign_up':
+        stamp = time.monotonic_ns()
+        return [('post', '/api/auth/sign-up/', (lambda n=n: {'data': {
+            'email': f'new{stamp}-{n}@example.com', 'name': 'New User', 'password': PASSWORD,
+        }, 'content_type': 'application/json'}), (201,)) for n in range(count)]
+    if scenario == 'login':
+        return [('post', '/api/auth/login/', (lambda user=user: {
+            'data': {'email': user.email, 'password': PASSWORD}, 'content_type': 'application/json',
+        }), (200,)) for user in cycle]
+    if scenario == 'refresh':
+        return [('post', '/api/auth/refresh-token/', (lambda token=str(RefreshToken.for_user(user)): {
+            'data': {'refresh': token}, 'content_type': 'application/json',
+        }), (200,)) for user in cycle]
+    if scenario == 'logout':
+        return [('post', '/api/auth/logout/', (lambda token=str(AccessToken.for_user(user)): {
+            'data': {}, 'content_type': 'application/json', 'headers': bearer(token),
+        }), (200,)) for user in cycle]
+
+    tokens = {user.pk: str(AccessToken.for_user(user)) for user in users[:count]}
+
+    def authed(user, **kwargs):
+        return lambda: dict(kwargs, headers=bearer(tokens[user.pk]))
+
+    cycle = list(itertools.islice(itertools.cycle(users[:count]), count))
+    if scenario == 'profile':
+        return [('get', '/api/profile/', authed(user), (200,)) for user in cycle]
+    if scenario == 'profile_edit':
+        return [('patch', '/api/profile/edit/', authed(user, data={'address': f'{n} New Street'},
+                                                       content_type='application/json'), (200,))
+                for n, user in enumerate(cycle)]
+    if scenario == 'wallet':
+        return [('get', '/api/wallet/', authed(user), (200,)) for user in cycle]
+    if scenario == 'wallet_transactions':
+        return [('get', '/api/wallet/transactions/', authed(user), (200,)) for user in cycle]
+    if scenario == 'search':
+        token = str(AccessToken.for_user(staff))
+        return [('get', f'/api/users/search/?q=bench+user+{n % 100}',
+                 lambda: {'headers': bearer(token)}, (200,)) for n in range(count)]
+    if scenario == 'jwks':
+        return [('get', '/.well-known/jwks.json', dict, (200,)) for _ in range(count)]
+    if scenario == 'upload_image':
+        images = [make_image(image_size, image_size) for _ in range(min(count, len(users)))]
+        return [('post', '/api/upload-image/', authed(
+            user, data={'profile_image': SimpleUploadedFile('bench.jpg', image, content_type='image/jpeg')},
+        ), (200, 202)) for user, image in zip(cycle, itertools.cycle(images))]
+    if scenario == 'delete_image':
+        # Users who got an image in upload_image, each deleted once.
+        return [('delete', f'/api/delete-image/{user.pk}/', authed(user), (200,))
+                for user in users[:count]]
+    raise ValueError(f'Unknown scenario {scenario!r}')
+
+
+def run_wsgi(requests, concurrency):
+    from django.db import connections
+    from django.test import Client
+
+    pending = iter(requests)
+    lock = threading.Lock()
+    latencies, errors = [], {}
+
+    def work():
+        client = Client(raise_request_exception=False)
+        while True:
+            with lock:
+                item = next(pending, None)
+            if item is None:
+                connections.close_all()
+                return
+            method, path, kwargs, expected = item
+            kwargs = kwargs()
+            started = time.perf_counter()
+            response = getattr(client, method)(path, **kwargs)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if response.status_code not in expected:
+                    errors[response.status_code] = errors.get(response.status_code, 0) + 1
+
+    threads = [threading.Thread(target=work) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - started
+
+
+def run_asgi(requests, concurrency):
+    from django.test import AsyncClient
+
+    pending = iter(requests)
+    latencies, errors = [], {}
+
+    async def work():
+        client = AsyncClient(raise_request_exception=False)
+        for method, path, kwargs, expected in pending:
+            kwargs = kwargs()
+            started = time.perf_counter()
+            response = await getattr(client, method)(path, **kwargs)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code not in expected:
+                errors[response.status_code] = errors.get(response.status_code, 0) + 1
+
+    async def main():
+        await asyncio.gather(*(work() for _ in range(concurrency)))
+
+    started = time.perf_counter()
+    asyncio.run(main())
+    return latencies, errors, time.perf_counter() - started
+
+
+def summarize(latencies, errors, elapsed, queries):
+    requests = len(latencies)
+    return {
+        'requests': requests,
+        'errors': sum(errors.values()),
+        'error_statuses': {str(code): count for code, count in sorted(errors.items())},
+        'throughput_rps': requests / elapsed if elapsed else 0.0,
+        'latency_ms': {
+            'p50': 1000 * percentile(latencies, 50),
+            'p95': 1000 * percentile(latencies, 95),
+            'p99': 1000 * percentile(latencies, 99),
+        },
+        'queries_per_request': queries / requests if requests else 0.0,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def run(users=500, requests=200, concurrency=4, interface='wsgi', scenarios=None, image_latency=0.05,
+        image_size=256, hasher='fast'):
+    """Seed a throwaway database and run the scenarios; returns the report."""
+    from django.conf import settings
+    from django.core.cache import cache
+    from django.test import override_settings
+
+    from .common import test_database
+
+    overrides = {
+        'LOGIN_RATE_LIMIT_IP': 0, 'LOGIN_RATE_LIMIT_EMAIL': 0, 'SIGNUP_RATE_LIMIT_IP': 0,
+        'ALLOWED_HOSTS': ['*'], 'DEBUG': False,
+    }
+    if hasher == 'fast':
+        overrides['PASSWORD_HASHERS'] = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+    host = FakeImageHost(image_latency)
+    directory = tempfile.mkdtemp(prefix='bench-')
+    database = settings.DATABASES['default']
+    report = {
+        'config': {
+            'users': users, 'requests': requests, 'concurrency': concurrency, 'interface': interface,
+            'async_views': settings.ACCOUNTS_ASYNC_VIEWS, 'image_latency_s': image_latency, 'hasher': hasher,
+            'database': database['ENGINE'].rsplit('.', 1)[-1],
+        },
+        'scenarios': {},
+    }
+    with ExitStack() as stack:
+        stack.callback(shutil.rmtree, directory, ignore_errors=True)
+        if database['ENGINE'].endswith('sqlite3'):
+            # Threads need a real file; the shared in-memory database fails
+            # concurrent writers with "table is locked" instead of waiting.
+            stack.enter_context(mock.patch.dict(database, TEST=dict(database.get('TEST', {}),
+                                                NAME=os.path.join(directory, 'bench.sqlite3'))))
+        stack.enter_context(override_settings(MEDIA_ROOT=os.path.join(directory, 'media'), **overrides))
+        stack.enter_context(mock.patch('accounts.image_host._host', host))
+        stack.enter_context(test_database())
+        cache.clear()
+
+        started = time.perf_counter()
+        people, staff = seed(users)
+        report['seed_s'] = time.perf_counter() - started
+
+        runner = run_asgi if interface == 'asgi' else run_wsgi
+        # One counter for the whole run: connections opened by an earlier
+        # scenario (e.g. ASGI's sync-view thread) keep counting into it.
+        counter = stack.enter_context(QueryCounter())
+        for scenario in scenarios or SCENARIOS:
+            planned = build_requests(scenario, people, staff, requests, image_size)
+            before = counter.count
+            latencies, errors, elapsed = runner(planned, concurrency)
+            report['scenarios'][scenario] = summarize(latencies, errors, elapsed, counter.count - before)
+        from accounts.image_client import get_delete_queue
+
+        get_delete_queue().flush()
+    report['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return report
+
+
+def compare(report, baseline, tolerance):
+    """Scenarios whose throughput or p95 latency regressed by more than ``tolerance`` (a fraction)."""
+    regressions = []
+    for scenario, result in report['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(scenario)
+        if not previous:
+            continue
+        if result['throughput_rps'] < previous['throughput_rps'] * (1 - tolerance):
+            regressions.append(
+                f"{scenario}: throughput {result['throughput_rps']:.1f} rps < {previous['throughput_rps']:.1f} rps"
+            )
+        if result['latency_ms']['p95'] > previous['latency_ms']['p95'] * (1 + tolerance):
+            regressions.append(
+                f"{scenario}: p95 {result['latency_ms']['p95']:.2f} ms > {previous['latency_ms']['p95']:.2f} ms"
+            )
+        if result['errors'] > previous['errors']:
+            regressions.append(f"{scenario}: {result['errors']} errors (baseline {previous['errors']})")
+    return regressions
+
+
+if __name__ == '__main__':
+    import sys
+
+    from .common import setup_django
+
+    setup_django()
+    from django.core.management import call_command
+
+    call_command('bench', *sys.argv[1:])
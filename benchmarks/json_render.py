@@ -0,0 +1,91 @@
+"""
+Response rendering and request parsing: DRF's JSONRenderer/JSONParser on a
+plain envelope dict (the previous setup) against accounts.renderers with
+orjson and with the stdlib fallback.
+
+Payloads match real endpoints: a profile, a page of 50 wallet transactions
+and a page of 20 search results, each with datetimes and decimals already
+serialized to strings as the serializers produce them.
+
+    python -m benchmarks.json_render --iterations 20000
+"""
+import argparse
+import importlib
+import io
+import time
+
+from .common import dump, setup_django
+
+
+def payloads():
+    profile = {
+        'id': 42, 'name': 'Zoë Example', 'email': 'zoe@example.com', 'phone': '+2348012345678',
+        'address': '12 Example Street, Lagos', 'cloudinary_url': 'https://res.cloudinary.com/demo/image/upload/p.jpg',
+        'profile_image_variants': {f'{size}.{fmt}': f'https://res.cloudinary.com/demo/{size}.{fmt}'
+                                   for size in (64, 256, 1024) for fmt in ('webp', 'jpeg')},
+    }
+    transactions = {
+        'next': 'http://localhost/api/wallet/transactions/?cursor=cD0yMDI0', 'previous': None,
+        'results': [{'id': i, 'amount': f'{i}.50', 'reason': 'first_upload_reward',
+                     'created_at': '2024-05-01T12:00:00.123456Z'} for i in range(50)],
+    }
+    users = {
+        'count': 1234, 'next': 'http://localhost/api/users/search/?page=2&q=zo', 'previous': None,
+        'results': [{'id': i, 'name': f'User {i}', 'email': f'user{i}@example.com', 'phone': '',
+                     'is_active': True, 'date_joined': '2024-05-01T12:00:00Z'} for i in range(20)],
+    }
+    return {
+        'profile': ('User profile retrieved successfully', profile),
+        'transactions': ('Wallet transactions retrieved successfully', transactions),
+        'search': ('Users retrieved successfully', users),
+    }
+
+
+def measure(fn, iterations):
+    fn()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def backends():
+    from django.conf import settings
+    from rest_framework import parsers, renderers
+
+    yield 'drf', lambda status, message, data: renderers.JSONRenderer().render(
+        {'status': status, 'message': message, 'data': data}), parsers.JSONParser
+    for backend in ('orjson', 'json'):
+        settings.JSON_BACKEND = backend
+        module = importlib.reload(importlib.import_module('accounts.renderers'))
+        yield backend, (lambda module: lambda status, message, data: module.FastJSONRenderer().render(
+            module.Envelope(status, message, data)))(module), module.FastJSONParser
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    setup_django()
+    report = {'iterations': args.iterations}
+    reference = {}
+    for name, render, parser_class in backends():
+        results = {}
+        for payload, (message, data) in payloads().items():
+            body = render(200, message, data)
+            if name == 'drf':
+                reference[payload] = body
+            json_parser = parser_class()
+            results[payload] = {
+                'render_us': measure(lambda: render(200, message, data), args.iterations),
+                'parse_us': measure(lambda: json_parser.parse(io.BytesIO(body)), args.iterations),
+                'bytes': len(body),
+                'identical_to_drf': body == reference[payload],
+            }
+        report[name] = results
+    dump(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Sign/verify throughput of access tokens per JWT algorithm.
+
+``sign`` and ``verify`` go through the simplejwt backend the app uses. HS256
+uses the stock backend and the rest use KeyRingTokenBackend with two keys.
+``verify_local`` is what a downstream service does with
+accounts.jwt_verify.JWKSVerifier and the published JWKS.
+
+    python -m benchmarks.jwt_signing --tokens 2000 --algorithms HS256 RS256 ES256
+"""
+import argparse
+import time
+
+from .common import dump, setup_django
+
+
+def throughput(fn, items):
+    start = time.perf_counter()
+    results = [fn(item) for item in items]
+    return results, len(items) / (time.perf_counter() - start)
+
+
+def build_backend(algorithm):
+    from cryptography.hazmat.primitives import serialization
+    from rest_framework_simplejwt.backends import TokenBackend
+
+    from accounts.jwt_keys import KeyRing, KeyRingTokenBackend
+    from accounts.management.commands.generate_jwt_key import generate_private_key
+
+    if algorithm.startswith('HS'):
+        return TokenBackend(algorithm, signing_key='benchmark-only-secret-key-not-for-production-use'), None
+    keys = {
+        kid: generate_private_key(algorithm).private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+        )
+        for kid in ('2026-01', '2026-02')
+    }
+    keyring = KeyRing(algorithm, keys)
+    return KeyRingTokenBackend(keyring), keyring.jwks()
+
+
+def run(algorithm, tokens):
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    from accounts.jwt_verify import JWKSVerifier
+
+    backend, jwks = build_backend(algorithm)
+    payloads = []
+    for user_id in range(tokens):
+        token = AccessToken()
+        token['user_id'] = user_id
+        payloads.append(token.payload)
+
+    encoded, sign_rate = throughput(backend.encode, payloads)
+    _, verify_rate = throughput(backend.decode, encoded)
+    report = {
+        'token_bytes': len(encoded[0]),
+        'sign_per_s': sign_rate,
+        'verify_per_s': verify_rate,
+    }
+    if jwks is not None:
+        verifier = JWKSVerifier(jwks=jwks, algorithms=[algorithm])
+        _, report['verify_local_per_s'] = throughput(verifier.verify, encoded)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tokens', type=int, default=1000)
+    parser.add_argument('--algorithms', nargs='+', default=['HS256', 'RS256', 'ES256'])
+    args = parser.parse_args(argv)
+
+    setup_django()
+    dump({algorithm: run(algorithm, args.tokens) for algorithm in args.algorithms})
+
+
+if __name__ == '__main__':
+    main()
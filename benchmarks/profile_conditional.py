@@ -0,0 +1,77 @@
+"""
+Measure what conditional GETs and the cached profile body save on
+/api/profile/ polls.
+
+Three client behaviours are compared for the same user:
+
+* ``full``: no validators, PROFILE_CACHE_TTL=0 (the old behaviour)
+* ``cached_body``: no validators, body served from the cache
+* ``not_modified``: the client revalidates with If-None-Match and gets 304
+
+    python -m benchmarks.profile_conditional --requests 2000
+"""
+import argparse
+import time
+
+from .common import auth_client, create_user, dump, percentile, setup_django, test_database
+
+
+def run(client, requests, headers=None):
+    latencies = []
+    body_bytes = 0
+    cpu_start = time.process_time()
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.get('/api/profile/', **(headers or {}))
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code in (200, 304), response.content
+        body_bytes += len(response.content)
+    cpu = time.process_time() - cpu_start
+    return {
+        'status': response.status_code,
+        'body_bytes_per_request': body_bytes / requests,
+        'cpu_us_per_request': 1e6 * cpu / requests,
+        'latency_us': {
+            'p50': 1e6 * percentile(latencies, 50),
+            'p95': 1e6 * percentile(latencies, 95),
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from django.core.cache import cache
+    from django.test import override_settings
+
+    report = {}
+    with test_database():
+        user = create_user(address='221B Baker Street, London', phone='+12025550123')
+        user.cloudinary_url = 'https://res.cloudinary.com/demo/image/upload/user_profiles/bench.jpg'
+        user.save()
+        client = auth_client(user)
+
+        with override_settings(PROFILE_CACHE_TTL=0):
+            report['full'] = run(client, args.requests)
+
+        cache.clear()
+        etag = client.get('/api/profile/')['ETag']
+        report['cached_body'] = run(client, args.requests)
+        report['not_modified'] = run(client, args.requests, {'HTTP_IF_NONE_MATCH': etag})
+
+    full = report['full']
+    report['saved_per_request'] = {
+        name: {
+            'body_bytes': full['body_bytes_per_request'] - report[name]['body_bytes_per_request'],
+            'cpu_us': full['cpu_us_per_request'] - report[name]['cpu_us_per_request'],
+        }
+        for name in ('cached_body', 'not_modified')
+    }
+    dump(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+Sign-up and login throughput on a SQLite file with and without
+SQLITE_PRODUCTION, across worker process counts.
+
+Each worker is its own process with its own connection, like a gunicorn
+worker. The workers start together. Each one signs up ``--requests`` new
+accounts and then logs each of them in, through the full middleware/DRF
+stack. Any response other than 201/200 counts as an error; with the default
+profile these are mostly "database is locked".
+
+Password hashing is switched to MD5 so the database rather than PBKDF2 is
+the bottleneck; pass ``--real-hasher`` to keep the project's hashers.
+
+    python -m benchmarks.sqlite_profile --workers 1 2 4 8 --requests 100
+"""
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from .common import ROOT, dump, percentile
+
+PROFILES = {'default': 'false', 'production': 'true'}
+PASSWORD = 'Bench#Pass1'
+
+
+def configure(database, profile, real_hasher=False):
+    os.environ.update({
+        'SQLITE_PRODUCTION': PROFILES[profile],
+        'DATABASE_NAME': database,
+        'DATABASE_REPLICAS': '',
+        'LOGIN_RATE_LIMIT_IP': '0',
+        'LOGIN_RATE_LIMIT_EMAIL': '0',
+        'SIGNUP_RATE_LIMIT_IP': '0',
+        'DEBUG': 'False',
+    })
+    from .common import setup_django
+
+    setup_django()
+    from django.conf import settings
+
+    settings.ALLOWED_HOSTS = ['*']
+    if not real_hasher:
+        settings.PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+def worker(database, profile, real_hasher, index, requests, barrier, results):
+    configure(database, profile, real_hasher)
+    from django.test import Client
+
+    client = Client(raise_request_exception=False)
+    emails = [f'w{index}-{n}-{time.monotonic_ns()}@example.com' for n in range(requests)]
+    latencies = {'sign_up': [], 'login': []}
+    errors = {}
+
+    def call(kind, url, body, expected):
+        started = time.perf_counter()
+        response = client.post(url, body, content_type='application/json')
+        latencies[kind].append(time.perf_counter() - started)
+        if response.status_code != expected:
+            key = f'{kind} {response.status_code}'
+            errors[key] = errors.get(key, 0) + 1
+
+    barrier.wait()
+    started = time.perf_counter()
+    for email in emails:
+        call('sign_up', '/api/auth/sign-up/', {'email': email, 'name': 'Bench User', 'password': PASSWORD}, 201)
+    for email in emails:
+        call('login', '/api/auth/login/', {'email': email, 'password': PASSWORD}, 200)
+    results.put({'elapsed': time.perf_counter() - started, 'latencies': latencies, 'errors': errors})
+
+
+def migrate(database, profile):
+    subprocess.run(
+        [sys.executable, '-m', 'benchmarks.sqlite_profile', '--migrate', database, '--profile', profile],
+        cwd=ROOT, check=True,
+    )
+
+
+def run(database, profile, workers, requests, real_hasher):
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [
+        context.Process(target=worker, args=(database, profile, real_hasher, i, requests, barrier, results))
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    reports = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    elapsed = max(report['elapsed'] for report in reports)
+    errors = {}
+    for report in reports:
+        for key, count in report['errors'].items():
+            errors[key] = errors.get(key, 0) + count
+    result = {'elapsed_s': elapsed, 'errors': errors}
+    for kind in ('sign_up', 'login'):
+        samples = [s for report in reports for s in report['latencies'][kind]]
+        failed = sum(count for key, count in errors.items() if key.startswith(kind))
+        result[kind] = {
+            'ok': len(samples) - failed,
+            'p50_ms': percentile(samples, 50) * 1000,
+            'p99_ms': percentile(samples, 99) * 1000,
+        }
+    result['ok_per_s'] = (result['sign_up']['ok'] + result['login']['ok']) / elapsed
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--requests', type=int, default=100, help='sign-ups (and logins) per worker')
+    parser.add_argument('--profiles', nargs='+', choices=list(PROFILES), default=list(PROFILES))
+    parser.add_argument('--real-hasher', action='store_true')
+    parser.add_argument('--migrate', metavar='DATABASE', help=argparse.SUPPRESS)
+    parser.add_argument('--profile', choices=list(PROFILES), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.migrate:
+        configure(args.migrate, args.profile)
+        from django.core.management import call_command
+
+        return call_command('migrate', verbosity=0)
+
+    report = {'requests_per_worker': args.requests, 'real_hasher': args.real_hasher}
+    with tempfile.TemporaryDirectory() as directory:
+        for profile in args.profiles:
+            database = os.path.join(directory, f'{profile}.sqlite3')
+            migrate(database, profile)
+            report[profile] = {
+                f'{workers}_workers': run(database, profile, workers, args.requests, args.real_hasher)
+                for workers in args.workers
+            }
+    dump(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+Measure cold start: how long a fresh worker process takes to import the
+project, how long its first request takes, and how much memory it holds.
+
+Every run is a new interpreter. Each one:
+- imports server.wsgi, which includes the warm-up when it is enabled;
+- serves GET /api/profile/ twice without credentials, a 401 that still
+  goes through the middleware, URL resolution and the DRF view;
+- reports its peak RSS and whether the heavy optional modules were loaded.
+
+Three configurations are compared:
+
+* ``default``: everything enabled, no warm-up
+* ``warm``: everything enabled, warm-up on
+* ``api_only``: ENABLE_ADMIN=false, ENABLE_API_DOCS=false, warm-up on
+
+    python -m benchmarks.startup --runs 7
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from .common import ROOT, dump
+
+HEAVY_MODULES = ('cloudinary', 'PIL', 'dotenv', 'drf_yasg.generators', 'django.contrib.admin.sites')
+
+CONFIGURATIONS = {
+    'default': {'WARM_UP_ON_STARTUP': 'false'},
+    'warm': {'WARM_UP_ON_STARTUP': 'true'},
+    'api_only': {'WARM_UP_ON_STARTUP': 'true', 'ENABLE_ADMIN': 'false', 'ENABLE_API_DOCS': 'false'},
+}
+
+
+def configure(database):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'server.settings')
+    os.environ.setdefault('SECRET_KEY', 'benchmark-only-secret-key-not-for-production-use')
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    from django.conf import settings
+
+    # Keep the benchmark off the project's db.sqlite3.
+    settings.DATABASES['default']['NAME'] = database
+
+
+def child(database):
+    started = time.perf_counter()
+    configure(database)
+    from server.wsgi import application
+
+    ready = time.perf_counter()
+    from django.test import RequestFactory
+
+    def request():
+        environ = RequestFactory().get('/api/profile/', SERVER_NAME='localhost').environ
+        statuses = []
+        begin = time.perf_counter()
+        body = b''.join(application(environ, lambda status, headers: statuses.append(status)))
+        assert statuses[0].startswith('401'), (statuses, body)
+        return time.perf_counter() - begin
+
+    first = request()
+    second = request()
+
+    import resource
+
+    print(json.dumps({
+        'import_s': ready - started,
+        'first_response_s': first,
+        'second_response_s': second,
+        'time_to_first_response_s': ready - started + first,
+        'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'modules': len(sys.modules),
+        'heavy_modules_loaded': [name for name in HEAVY_MODULES if name in sys.modules],
+    }))
+
+
+def migrate(database):
+    configure(database)
+    import django
+    from django.core.management import call_command
+
+    django.setup()
+    call_command('migrate', verbosity=0)
+
+
+def spawn(mode, database, env=None):
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.startup', mode, '--database', database],
+        cwd=ROOT, env=dict(os.environ, **(env or {})), capture_output=True, text=True, check=True,
+    )
+    elapsed = time.perf_counter() - started
+    return result.stdout, elapsed
+
+
+def summarize(samples):
+    report = {}
+    for key in ('import_s', 'first_response_s', 'second_response_s', 'time_to_first_response_s', 'rss_mb',
+                'modules', 'process_s'):
+        values = [sample[key] for sample in samples]
+        report[key] = {'median': statistics.median(values), 'min': min(values), 'max': max(values)}
+    report['heavy_modules_loaded'] = samples[-1]['heavy_modules_loaded']
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('mode', nargs='?', default='run', choices=['run', 'child', 'migrate'])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--database')
+    parser.add_argument('--configurations', nargs='+', choices=list(CONFIGURATIONS), default=list(CONFIGURATIONS))
+    args = parser.parse_args(argv)
+
+    if args.mode == 'child':
+        return child(args.database)
+    if args.mode == 'migrate':
+        return migrate(args.database)
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = os.path.join(directory, 'bench.sqlite3')
+        spawn('migrate', database)
+        report = {'python': sys.version.split()[0], 'runs': args.runs}
+        for name in args.configurations:
+            samples = []
+            for _ in range(args.runs):
+                stdout, elapsed = spawn('child', database, CONFIGURATIONS[name])
+                sample = json.loads(stdout.strip().splitlines()[-1])
+                sample['process_s'] = elapsed
+                samples.append(sample)
+            report[name] = summarize(samples)
+    dump(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Compare the 'local' and 'direct' PROFILE_IMAGE_STORAGE modes.
+
+Cloudinary is replaced by a fake that reads the whole payload, so the numbers
+cover everything this process does per upload: request parsing, validation,
+local writes/reads and the bytes handed to the HTTP client.
+
+    python -m benchmarks.upload_storage --uploads 50 --width 1600 --height 1200
+"""
+import argparse
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from .common import auth_client, create_user, dump, make_image, percentile, proc_io, setup_django, test_database, timed
+
+
+def fake_upload(file, **options):
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, 'rb') as f:
+            f.read()
+    elif hasattr(file, 'read'):
+        file.read()
+    fake_upload.calls += 1
+    public_id = f"{options.get('folder', 'bench')}/{fake_upload.calls}"
+    return {'public_id': public_id, 'secure_url': f'https://res.example.com/{public_id}.jpg'}
+
+
+fake_upload.calls = 0
+
+
+def run_mode(mode, payload, uploads):
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from django.test import override_settings
+
+    media_root = tempfile.mkdtemp(prefix=f'bench-{mode}-')
+    try:
+        with override_settings(PROFILE_IMAGE_STORAGE=mode, PROFILE_IMAGE_UPLOAD_MODE='sync', MEDIA_ROOT=media_root,
+                               PROFILE_IMAGE_VARIANT_SIZES=[]), \
+                mock.patch('cloudinary.uploader.upload', side_effect=fake_upload), \
+                mock.patch('cloudinary.uploader.destroy', return_value={'result': 'ok'}):
+            user = create_user(email=f'{mode}@example.com')
+            client = auth_client(user)
+            latencies = []
+            before = proc_io()
+            for i in range(uploads):
+                image = SimpleUploadedFile(f'photo{i}.jpg', payload, content_type='image/jpeg')
+                response, elapsed = timed(client.post, '/api/upload-image/', {'profile_image': image}, format='multipart')
+                assert response.status_code == 200, response.content
+                latencies.append(elapsed)
+            after = proc_io()
+            local_files = sum(len(files) for _, _, files in os.walk(media_root))
+    finally:
+        shutil.rmtree(media_root, ignore_errors=True)
+
+    return {
+        'uploads': uploads,
+        'latency_ms': {
+            'mean': 1000 * sum(latencies) / len(latencies),
+            'p50': 1000 * percentile(latencies, 50),
+            'p95': 1000 * percentile(latencies, 95),
+        },
+        'bytes_read_per_upload': (after['read'] - before['read']) / uploads,
+        'bytes_written_per_upload': (after['written'] - before['written']) / uploads,
+        'local_files_left': local_files,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uploads', type=int, default=30)
+    parser.add_argument('--width', type=int, default=1600)
+    parser.add_argument('--height', type=int, default=1200)
+    args = parser.parse_args(argv)
+
+    setup_django()
+    payload = make_image(args.width, args.height)
+    report = {'payload_bytes': len(payload)}
+    with test_database():
+        for mode in ('local', 'direct'):
+            report[mode] = run_mode(mode, payload, args.uploads)
+
+    local, direct = report['local'], report['direct']
+    report['saved_per_upload'] = {
+        'latency_ms': local['latency_ms']['mean'] - direct['latency_ms']['mean'],
+        'bytes_read': local['bytes_read_per_upload'] - direct['bytes_read_per_upload'],
+        'bytes_written': local['bytes_written_per_upload'] - direct['bytes_written_per_upload'],
+    }
+    dump(report)
+
+
+if __name__ == '__main__':
+    main()
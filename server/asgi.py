@@ -1,5 +1,12 @@
 import os
+
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'server.settings')
 application = get_asgi_application()
+
+if settings.WARM_UP_ON_STARTUP:
+    from accounts.warmup import warm_up
+
+    warm_up()
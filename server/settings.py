@@ -1,19 +1,28 @@
 from pathlib import Path
 import os
-from dotenv import load_dotenv
 from datetime import timedelta
 
-load_dotenv()
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+# Deployed processes get their environment from the platform; only import
+# python-dotenv when there is a .env file to read.
+if (BASE_DIR / '.env').exists():
+    from dotenv import load_dotenv
+
+    load_dotenv(BASE_DIR / '.env')
 
 SECRET_KEY = os.getenv('SECRET_KEY')
 DEBUG = os.getenv('DEBUG', 'True').lower() == 'true'
 
-BASE_DIR = Path(__file__).resolve().parent.parent
-
 
 ALLOWED_HOSTS = []
 
 
+# API-only worker pools can leave out the admin and the API docs
+# (/swagger/, /redoc/), which skips loading them at startup.
+ENABLE_ADMIN = os.getenv('ENABLE_ADMIN', 'True').lower() == 'true'
+ENABLE_API_DOCS = os.getenv('ENABLE_API_DOCS', 'True').lower() == 'true'
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -23,7 +32,6 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'cloudinary',
 
     'rest_framework',
     'rest_framework_simplejwt',
@@ -31,6 +39,10 @@ INSTALLED_APPS = [
     'drf_yasg',
     # 'rest_framework_simplejwt.token_blacklist',
 ]
+if not ENABLE_ADMIN:
+    INSTALLED_APPS.remove('django.contrib.admin')
+if not ENABLE_API_DOCS:
+    INSTALLED_APPS.remove('drf_yasg')
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
@@ -44,17 +56,92 @@ MIDDLEWARE = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'accounts.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ),
+    'DEFAULT_PARSER_CLASSES': (
+        'accounts.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+    # Reverse proxies in front of the app. Throttles key on the client
+    # address they append to X-Forwarded-For; with 0 they use REMOTE_ADDR
+    # and ignore the header, which clients can set to anything.
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', 0)),
 }
 
+# JSON library behind the API renderer and parser: 'auto' uses orjson when
+# it is installed and the stdlib otherwise; 'orjson' or 'json' force one.
+JSON_BACKEND = os.getenv('JSON_BACKEND', 'auto')
+
+# Serve the accounts endpoints with the native async views in
+# accounts/async_views.py (for ASGI deployments) instead of the DRF views.
+ACCOUNTS_ASYNC_VIEWS = os.getenv('ACCOUNTS_ASYNC_VIEWS', 'False').lower() == 'true'
+ASYNC_PASSWORD_HASH_WORKERS = int(os.getenv('ASYNC_PASSWORD_HASH_WORKERS', 4))
+
+# Two-tier cache used by CachedJWTAuthentication: a per-process LRU in front
+# of Django's cache framework. Local entries are checked against a version
+# key in the shared cache, so a save in any process retires them everywhere.
+USER_CACHE_LOCAL_SIZE = int(os.getenv('USER_CACHE_LOCAL_SIZE', 1024))
+USER_CACHE_LOCAL_TTL = int(os.getenv('USER_CACHE_LOCAL_TTL', 5))
+USER_CACHE_SHARED_TTL = int(os.getenv('USER_CACHE_SHARED_TTL', 300))
+
+# HS256 signs with SECRET_KEY. RS256/ES256 sign with the active key in
+# JWT_KEYS_DIR (see accounts/jwt_keys.py) and publish the public keys at
+# /.well-known/jwks.json so other services can verify tokens locally. The
+# default directory is gitignored; keep production keys outside the tree.
+JWT_ALGORITHM = os.getenv('JWT_ALGORITHM', 'HS256')
+JWT_KEYS_DIR = os.getenv('JWT_KEYS_DIR', str(BASE_DIR / 'jwt_keys'))
+JWT_ACTIVE_KID = os.getenv('JWT_ACTIVE_KID', '')
+JWKS_MAX_AGE = int(os.getenv('JWKS_MAX_AGE', 3600))
+
+# Prebuilt OpenAPI schema (`manage.py build_openapi`); generated on first
+# request when the directory has none. A new deploy is the only invalidation.
+OPENAPI_SCHEMA_DIR = os.getenv('OPENAPI_SCHEMA_DIR', str(BASE_DIR / 'build' / 'openapi'))
+OPENAPI_MAX_AGE = int(os.getenv('OPENAPI_MAX_AGE', 86400))
+
 SIMPLE_JWT = {
+    'ALGORITHM': JWT_ALGORITHM,
     'ACCESS_TOKEN_LIFETIME': timedelta(days=int(os.getenv('JWT_ACCESS_TOKEN_LIFETIME', 10))),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=int(os.getenv('JWT_REFRESH_TOKEN_LIFETIME', 10))),
     'ROTATE_REFRESH_TOKENS': True,
     # 'BLACKLIST_AFTER_ROTATION': True, 
 }
 
+# Attempts allowed per sliding window before login / sign-up answer 429
+# without hashing anything (accounts/throttling.py). 0 disables a limit.
+LOGIN_RATE_LIMIT_IP = int(os.getenv('LOGIN_RATE_LIMIT_IP', 30))
+LOGIN_RATE_LIMIT_EMAIL = int(os.getenv('LOGIN_RATE_LIMIT_EMAIL', 5))
+LOGIN_RATE_LIMIT_WINDOW = int(os.getenv('LOGIN_RATE_LIMIT_WINDOW', 60))
+SIGNUP_RATE_LIMIT_IP = int(os.getenv('SIGNUP_RATE_LIMIT_IP', 10))
+SIGNUP_RATE_LIMIT_WINDOW = int(os.getenv('SIGNUP_RATE_LIMIT_WINDOW', 3600))
+
+# Matcher used by the admin user search and /api/users/search/. Set to
+# 'accounts.search.TrigramSearchBackend' on PostgreSQL for typo tolerance.
+USER_SEARCH_BACKEND = os.getenv('USER_SEARCH_BACKEND', 'accounts.search.PrefixSearchBackend')
+USER_SEARCH_TRIGRAM_THRESHOLD = float(os.getenv('USER_SEARCH_TRIGRAM_THRESHOLD', 0.4))
+
+# Admin changelists over tables larger than this show the database's row
+# estimate instead of running COUNT(*); filtered lists count up to this many.
+ADMIN_ESTIMATED_COUNT_THRESHOLD = int(os.getenv('ADMIN_ESTIMATED_COUNT_THRESHOLD', 10000))
+
+# Revocations (logout, logout-all, refresh rotation) are checked in memory;
+# each worker picks up the others' through the cache at most this often.
+TOKEN_REVOCATION_SYNC_INTERVAL = float(os.getenv('TOKEN_REVOCATION_SYNC_INTERVAL', 1))
+# Revoked jtis are held in Bloom filters of this many entries; hits are
+# confirmed in the database. Expired rows are swept this often (seconds).
+TOKEN_REVOCATION_FILTER_CAPACITY = int(os.getenv('TOKEN_REVOCATION_FILTER_CAPACITY', 50000))
+TOKEN_REVOCATION_FILTER_ERROR_RATE = float(os.getenv('TOKEN_REVOCATION_FILTER_ERROR_RATE', 0.001))
+TOKEN_REVOCATION_SWEEP_INTERVAL = int(os.getenv('TOKEN_REVOCATION_SWEEP_INTERVAL', 3600))
+
+# Work done by server.wsgi / server.asgi before the worker takes traffic
+# (see accounts/warmup.py for the steps, and for gunicorn --preload).
+WARM_UP_ON_STARTUP = os.getenv('WARM_UP_ON_STARTUP', 'True').lower() == 'true'
+WARM_UP_STEPS = [s for s in os.getenv('WARM_UP_STEPS', 'urls,database,jwt_keys,revocation').split(',') if s]
+
 ROOT_URLCONF = 'server.urls'
 
 TEMPLATES = [
@@ -76,13 +163,73 @@ WSGI_APPLICATION = 'server.wsgi.application'
 
 
 # Database
+# Connections are kept open for DATABASE_CONN_MAX_AGE seconds (0 closes them
+# after every request) and checked before reuse.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'ENGINE': os.getenv('DATABASE_ENGINE', 'django.db.backends.sqlite3'),
+        'NAME': os.getenv('DATABASE_NAME', str(BASE_DIR / 'db.sqlite3')),
+        'USER': os.getenv('DATABASE_USER', ''),
+        'PASSWORD': os.getenv('DATABASE_PASSWORD', ''),
+        'HOST': os.getenv('DATABASE_HOST', ''),
+        'PORT': os.getenv('DATABASE_PORT', ''),
+        'CONN_MAX_AGE': int(os.getenv('DATABASE_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Opt-in SQLite tuning for production: every new connection switches to the
+# WAL journal and applies the pragmas below, and transactions start with
+# BEGIN IMMEDIATE so concurrent writers wait up to SQLITE_BUSY_TIMEOUT ms for
+# the write lock instead of failing with "database is locked".
+SQLITE_PRODUCTION = os.getenv('SQLITE_PRODUCTION', 'False').lower() == 'true'
+SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 128 * 1024 * 1024))
+# Page cache per connection; negative values are KiB.
+SQLITE_CACHE_SIZE = int(os.getenv('SQLITE_CACHE_SIZE', -20000))
+if SQLITE_PRODUCTION and DATABASES['default']['ENGINE'].endswith('sqlite3'):
+    DATABASES['default']['OPTIONS'] = {
+        'init_command': (
+            'PRAGMA journal_mode=WAL;'
+            'PRAGMA synchronous=NORMAL;'
+            f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT};'
+            f'PRAGMA mmap_size={SQLITE_MMAP_SIZE};'
+            f'PRAGMA cache_size={SQLITE_CACHE_SIZE};'
+            'PRAGMA temp_store=MEMORY;'
+        ),
+        'transaction_mode': 'IMMEDIATE',
+    }
+
+# Read replicas of the primary, comma-separated: hosts, or database files
+# with SQLite. Safe requests read from them (see accounts/db_routing.py);
+# a user who writes reads from the primary for DATABASE_REPLICA_PIN_SECONDS.
+DATABASE_REPLICAS = [r for r in os.getenv('DATABASE_REPLICAS', '').split(',') if r]
+for _index, _replica in enumerate(DATABASE_REPLICAS, 1):
+    _location = 'NAME' if DATABASES['default']['ENGINE'].endswith('sqlite3') else 'HOST'
+    DATABASES[f'replica{_index}'] = dict(DATABASES['default'], **{_location: _replica}, TEST={'MIRROR': 'default'})
+DATABASE_REPLICA_ALIASES = [alias for alias in DATABASES if alias != 'default']
+DATABASE_REPLICA_PIN_SECONDS = int(os.getenv('DATABASE_REPLICA_PIN_SECONDS', 5))
+if DATABASE_REPLICAS:
+    DATABASE_ROUTERS = ['accounts.db_routing.ReplicaRouter']
+    MIDDLEWARE.insert(1, 'accounts.db_routing.replica_routing_middleware')
+
+# Per-request timing of SQL, password hashing, image-host calls and rendering
+# (see accounts/instrumentation.py): a Server-Timing header on each response
+# and per-route histograms at /metrics. Nothing is installed when disabled.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'False').lower() == 'true'
+METRICS_SERVER_TIMING = os.getenv('METRICS_SERVER_TIMING', 'True').lower() == 'true'
+# When set, /metrics requires "Authorization: Bearer <token>".
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+if METRICS_ENABLED:
+    MIDDLEWARE.insert(0, 'accounts.instrumentation.metrics_middleware')
+    PASSWORD_HASHERS = [
+        'accounts.instrumentation.TimedPBKDF2PasswordHasher',
+        'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+        'django.contrib.auth.hashers.Argon2PasswordHasher',
+        'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+        'django.contrib.auth.hashers.ScryptPasswordHasher',
+    ]
+
 AUTH_USER_MODEL = 'accounts.User'
 
 
@@ -108,6 +255,56 @@ CLOUDINARY_STORAGE = {
     'API_SECRET': os.getenv('CLOUDINARY_API_SECRET')
 }
 
+# Seconds a serialized profile body is cached (0 disables). Entries are
+# keyed on User.profile_version, so profile edits make them unreachable.
+PROFILE_CACHE_TTL = int(os.getenv('PROFILE_CACHE_TTL', 300))
+
+# Seconds a serialized wallet body is cached; entries are keyed on
+# Wallet.updated_at so any balance change makes them unreachable.
+WALLET_CACHE_TTL = int(os.getenv('WALLET_CACHE_TTL', 300))
+
+# 'sync' uploads profile images inside the request; 'async' stores the file,
+# queues a ProfileImageJob and returns 202 (drained by `manage.py image_worker`).
+PROFILE_IMAGE_UPLOAD_MODE = os.getenv('PROFILE_IMAGE_UPLOAD_MODE', 'sync')
+PROFILE_IMAGE_JOB_MAX_ATTEMPTS = int(os.getenv('PROFILE_IMAGE_JOB_MAX_ATTEMPTS', 3))
+
+# Remote image host; every call goes through accounts.image_client.
+IMAGE_HOST_BACKEND = os.getenv('IMAGE_HOST_BACKEND', 'accounts.image_host.CloudinaryHost')
+# Keep-alive connections kept per host, and the upload timeout in seconds.
+IMAGE_HOST_POOL_SIZE = int(os.getenv('IMAGE_HOST_POOL_SIZE', 10))
+IMAGE_HOST_TIMEOUT = float(os.getenv('IMAGE_HOST_TIMEOUT', 30))
+# Retries per call with full-jitter backoff starting at IMAGE_HOST_BACKOFF
+# seconds and capped at IMAGE_HOST_BACKOFF_MAX. No retry starts later than
+# IMAGE_HOST_RETRY_BUDGET seconds after the first attempt, so a slow host
+# can't hold a request thread through every retry.
+IMAGE_HOST_RETRIES = int(os.getenv('IMAGE_HOST_RETRIES', 3))
+IMAGE_HOST_BACKOFF = float(os.getenv('IMAGE_HOST_BACKOFF', 0.2))
+IMAGE_HOST_BACKOFF_MAX = float(os.getenv('IMAGE_HOST_BACKOFF_MAX', 5))
+IMAGE_HOST_RETRY_BUDGET = float(os.getenv('IMAGE_HOST_RETRY_BUDGET', 10))
+# Consecutive failures that open the circuit, and seconds before a trial call.
+IMAGE_HOST_BREAKER_THRESHOLD = int(os.getenv('IMAGE_HOST_BREAKER_THRESHOLD', 5))
+IMAGE_HOST_BREAKER_RESET = float(os.getenv('IMAGE_HOST_BREAKER_RESET', 30))
+# Queued deletes are sent every IMAGE_DELETE_FLUSH_INTERVAL seconds or once a
+# batch fills; at most IMAGE_DELETE_MAX_PENDING ids are held during an outage.
+IMAGE_DELETE_FLUSH_INTERVAL = float(os.getenv('IMAGE_DELETE_FLUSH_INTERVAL', 2))
+IMAGE_DELETE_MAX_PENDING = int(os.getenv('IMAGE_DELETE_MAX_PENDING', 10000))
+
+# 'local' keeps a copy of every profile image under MEDIA_ROOT/profiles/;
+# 'direct' streams the upload to Cloudinary without a persistent local copy.
+PROFILE_IMAGE_STORAGE = os.getenv('PROFILE_IMAGE_STORAGE', 'local')
+
+# Resized copies generated for every profile image. Set
+# PROFILE_IMAGE_VARIANT_SIZES='' to disable the pipeline.
+PROFILE_IMAGE_VARIANT_SIZES = [int(s) for s in os.getenv('PROFILE_IMAGE_VARIANT_SIZES', '64,256,1024').split(',') if s]
+PROFILE_IMAGE_VARIANT_FORMATS = [f for f in os.getenv('PROFILE_IMAGE_VARIANT_FORMATS', 'webp,jpeg').split(',') if f]
+PROFILE_IMAGE_VARIANT_QUALITY = int(os.getenv('PROFILE_IMAGE_VARIANT_QUALITY', 82))
+IMAGE_PROCESS_WORKERS = int(os.getenv('IMAGE_PROCESS_WORKERS', 2))
+IMAGE_PROCESS_QUEUE_SIZE = int(os.getenv('IMAGE_PROCESS_QUEUE_SIZE', 8))
+IMAGE_PROCESS_QUEUE_TIMEOUT = float(os.getenv('IMAGE_PROCESS_QUEUE_TIMEOUT', 2))
+IMAGE_PROCESS_TIMEOUT = float(os.getenv('IMAGE_PROCESS_TIMEOUT', 30))
+# Threads shared by sync requests to upload a profile image's variants in parallel.
+IMAGE_VARIANT_UPLOAD_WORKERS = int(os.getenv('IMAGE_VARIANT_UPLOAD_WORKERS', 12))
+
 LANGUAGE_CODE = 'en-us'
 
 TIME_ZONE = 'UTC'
@@ -1,80 +1,236 @@
+"""
+API documentation.
+
+The OpenAPI schema is generated once per deploy, not per request:
+``manage.py build_openapi`` writes it to ``OPENAPI_SCHEMA_DIR`` (JSON and
+YAML, each with a gzipped copy). Without a build the first request generates
+it in memory. Either way the bytes, their gzip and their ETag are held in
+memory and served with long-lived cache headers.
+
+Only the serving side lives here; the drf_yasg generator (server.schema) is
+imported when a schema has to be built.
+
+The Swagger UI and ReDoc pages load their assets from this server (the copies
+bundled with drf_yasg) under a versioned URL, so they can be cached forever.
+"""
+import gzip
+import hashlib
+import os
+import threading
+
+import drf_yasg
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.http import Http404, HttpResponse
 from django.urls import path, re_path
-from rest_framework import permissions
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
-from drf_yasg.generators import OpenAPISchemaGenerator
-from django.utils.safestring import mark_safe
-
-
-class CustomSchemaGenerator(OpenAPISchemaGenerator):
-    def get_schema(self, request=None, public=False):
-        schema = super().get_schema(request, public)
-        schema.security_definitions = {
-            'Bearer': {
-                'type': 'apiKey',
-                'in': 'header',
-                'name': 'Authorization',
-                'description': 'Paste your token below (Bearer will be auto-added)',
-            }
-        }
-        schema.security = [{'Bearer': []}]
-        return schema
-
-
-schema_view = get_schema_view(
-    openapi.Info(
-        title="python swagger collection",
-        default_version='v1',
-        contact=openapi.Contact(email="ta@gmail.com"),
-    ),
-    public=True,
-    permission_classes=(permissions.AllowAny,),
-    generator_class=CustomSchemaGenerator,
-)
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.views.decorators.http import require_safe
+
+
+SCHEMA_FORMATS = {
+    'json': 'application/json',
+    'yaml': 'application/yaml',
+}
+
+# Asset URLs carry the drf_yasg version, so a new bundle gets a new URL.
+ASSET_VERSION = drf_yasg.__version__
+ASSETS = {
+    'swagger-ui.css': ('drf-yasg/swagger-ui-dist/swagger-ui.css', 'text/css'),
+    'swagger-ui-bundle.js': ('drf-yasg/swagger-ui-dist/swagger-ui-bundle.js', 'text/javascript'),
+    'redoc.min.js': ('drf-yasg/redoc/redoc.min.js', 'text/javascript'),
+}
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+class Artifact:
+    """Response bytes held in memory with their gzipped copy and ETags."""
+
+    def __init__(self, content, content_type, compressed=None):
+        self.content = content
+        self.content_type = content_type
+        self.compressed = compressed if compressed is not None else gzip.compress(content, mtime=0)
+        digest = hashlib.sha256(content).hexdigest()[:32]
+        self.etag = f'"{digest}"'
+        self.compressed_etag = f'"{digest}-gz"'
+
+    def response(self, request, max_age, immutable=False):
+        use_gzip = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+        etag = self.compressed_etag if use_gzip else self.etag
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(self.compressed if use_gzip else self.content, content_type=self.content_type)
+            if use_gzip:
+                response['Content-Encoding'] = 'gzip'
+        response['ETag'] = etag
+        patch_vary_headers(response, ['Accept-Encoding'])
+        if immutable:
+            patch_cache_control(response, public=True, max_age=max_age, immutable=True)
+        else:
+            patch_cache_control(response, public=True, max_age=max_age)
+        return response
+
+
+def generate_schema():
+    # The generator pulls in drf_yasg's inspectors and YAML codec; only
+    # load them when a schema actually has to be built.
+    from .schema import generate_schema
+
+    return generate_schema()
+
+
+def write_schema(directory):
+    """Write ``swagger.<fmt>`` and ``swagger.<fmt>.gz`` for each format; returns the paths."""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for fmt, content in generate_schema().items():
+        for name, data in ((f'swagger.{fmt}', content), (f'swagger.{fmt}.gz', gzip.compress(content, mtime=0))):
+            file_path = os.path.join(directory, name)
+            with open(f'{file_path}.tmp', 'wb') as f:
+                f.write(data)
+            os.replace(f'{file_path}.tmp', file_path)
+            paths.append(file_path)
+    return paths
+
+
+_schemas = {}
+_assets = {}
+_lock = threading.Lock()
+
+
+def get_schema_artifact(fmt):
+    artifact = _schemas.get(fmt)
+    if artifact is None:
+        with _lock:
+            if not _schemas:
+                _schemas.update(load_schema())
+            artifact = _schemas[fmt]
+    return artifact
+
+
+def load_schema():
+    """Read the prebuilt schema if there is one, otherwise generate it."""
+    paths = {fmt: os.path.join(settings.OPENAPI_SCHEMA_DIR, f'swagger.{fmt}') for fmt in SCHEMA_FORMATS}
+    if not all(os.path.exists(file_path) for file_path in paths.values()):
+        return {fmt: Artifact(content, SCHEMA_FORMATS[fmt]) for fmt, content in generate_schema().items()}
+    artifacts = {}
+    for fmt, file_path in paths.items():
+        with open(file_path, 'rb') as f:
+            content = f.read()
+        compressed = None
+        if os.path.exists(f'{file_path}.gz'):
+            with open(f'{file_path}.gz', 'rb') as f:
+                compressed = f.read()
+        artifacts[fmt] = Artifact(content, SCHEMA_FORMATS[fmt], compressed)
+    return artifacts
+
+
+def warm_schema():
+    """Load (or generate) the schema now instead of on the first request."""
+    for fmt in SCHEMA_FORMATS:
+        get_schema_artifact(fmt)
+
+
+def clear_schema_cache():
+    with _lock:
+        _schemas.clear()
+
+
+def get_asset(name):
+    if name not in ASSETS:
+        raise Http404
+    artifact = _assets.get(name)
+    if artifact is None:
+        static_path, content_type = ASSETS[name]
+        file_path = finders.find(static_path)
+        if file_path is None:
+            raise Http404
+        with open(file_path, 'rb') as f:
+            artifact = _assets[name] = Artifact(f.read(), content_type)
+    return artifact
+
+
+def asset_url(name):
+    return f'/swagger/assets/{ASSET_VERSION}/{name}'
+
+
+@require_safe
+def schema_file(request, format):
+    return get_schema_artifact(format.lstrip('.')).response(request, settings.OPENAPI_MAX_AGE)
+
+
+@require_safe
+def swagger_asset(request, version, name):
+    if version != ASSET_VERSION:
+        raise Http404
+    return get_asset(name).response(request, IMMUTABLE_MAX_AGE, immutable=True)
+
 
 # Custom Swagger UI HTML with JS to auto-add 'Bearer '
-swagger_ui_html = """
+swagger_ui_html = f"""
 <!DOCTYPE html>
 <html>
 <head>
     <title>Swagger UI</title>
-    <link href="https://unpkg.com/swagger-ui-dist@3/swagger-ui.css" rel="stylesheet">
+    <link href="{asset_url('swagger-ui.css')}" rel="stylesheet">
 </head>
 <body>
 <div id="swagger-ui"></div>
-<script src="https://unpkg.com/swagger-ui-dist@3/swagger-ui-bundle.js"></script>
+<script src="{asset_url('swagger-ui-bundle.js')}"></script>
 <script>
-    window.onload = function () {
-        const ui = SwaggerUIBundle({
+    window.onload = function () {{
+        const ui = SwaggerUIBundle({{
             url: '/swagger.json',
             dom_id: '#swagger-ui',
             presets: [SwaggerUIBundle.presets.apis],
             layout: "BaseLayout",
-            requestInterceptor: function (req) {
+            requestInterceptor: function (req) {{
                 if (req.loadSpec) return req;
                 const token = req.headers.Authorization;
-                if (token && !token.startsWith('Bearer ')) {
+                if (token && !token.startsWith('Bearer ')) {{
                     req.headers.Authorization = 'Bearer ' + token;
-                }
+                }}
                 return req;
-            }
-        });
-    };
+            }}
+        }});
+    }};
 </script>
 </body>
 </html>
 """
 
-from django.http import HttpResponse
+redoc_html = f"""
+<!DOCTYPE html>
+<html>
+<head>
+    <title>ReDoc</title>
+    <meta name="viewport" content="width=device-width, initial-scale=1">
+</head>
+<body>
+<redoc spec-url="/swagger.json"></redoc>
+<script src="{asset_url('redoc.min.js')}"></script>
+</body>
+</html>
+"""
+
+_pages = {
+    'swagger': Artifact(swagger_ui_html.encode(), 'text/html; charset=utf-8'),
+    'redoc': Artifact(redoc_html.encode(), 'text/html; charset=utf-8'),
+}
 
+
+@require_safe
 def custom_swagger_ui(request):
-    return HttpResponse(swagger_ui_html)
+    return _pages['swagger'].response(request, settings.OPENAPI_MAX_AGE)
+
+
+@require_safe
+def redoc_ui(request):
+    return _pages['redoc'].response(request, settings.OPENAPI_MAX_AGE)
 
 
 swagger_urlpatterns = [
-    re_path(r'^swagger(?P<format>\.json|\.yaml)$',
-            schema_view.without_ui(cache_timeout=0), name='schema-json'),
+    re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_file, name='schema-json'),
     path('swagger/', custom_swagger_ui, name='schema-swagger-ui'),
-    path('redoc/', schema_view.with_ui('redoc', cache_timeout=0),
-         name='schema-redoc'),
-]
\ No newline at end of file
+    path('swagger/assets/<str:version>/<str:name>', swagger_asset, name='schema-swagger-asset'),
+    path('redoc/', redoc_ui, name='schema-redoc'),
+]
@@ -1,12 +1,21 @@
-from django.contrib import admin
+from django.conf import settings
 from django.urls import path, include
 # from accounts.urls import auth_patterns
-from accounts.views import MyProfileView, EditProfileView
-from .swagger import schema_view
-from .swagger import swagger_urlpatterns
+from accounts.views import JWKSView, MetricsView
 
 urlpatterns = [
-   path('admin/', admin.site.urls),
-   path("api/", include("accounts.urls"))
+   path("api/", include("accounts.urls")),
+   path('.well-known/jwks.json', JWKSView.as_view(), name='jwks'),
+   path('metrics', MetricsView.as_view(), name='metrics'),
 ]
-urlpatterns += swagger_urlpatterns
\ No newline at end of file
+
+# Left out of API-only worker pools so neither is imported at startup.
+if settings.ENABLE_ADMIN:
+    from django.contrib import admin
+
+    urlpatterns.insert(0, path('admin/', admin.site.urls))
+
+if settings.ENABLE_API_DOCS:
+    from .swagger import swagger_urlpatterns
+
+    urlpatterns += swagger_urlpatterns
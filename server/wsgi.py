@@ -1,5 +1,12 @@
 import os
+
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'server.settings')
 application = get_wsgi_application()
+
+if settings.WARM_UP_ON_STARTUP:
+    from accounts.warmup import warm_up
+
+    warm_up()